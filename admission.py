@@ -0,0 +1,109 @@
+import os
+import math
+import re
+from typing import Dict, List, Optional
+
+# GPT-2's context window and the tokens reserved for the rewrite it generates
+GPT2_CONTEXT_TOKENS = 1024
+GENERATION_MAX_NEW_TOKENS = int(os.getenv("GENERATION_MAX_NEW_TOKENS", "150"))
+# Tokens taken by the "Rewrite this prompt for ..." instruction around the prompt
+REWRITE_INSTRUCTION_TOKENS = 16
+
+# Largest accepted prompt per optimization level, in estimated tokens
+MAX_PROMPT_TOKENS: Dict[str, int] = {
+    "minimal": int(os.getenv("MAX_PROMPT_TOKENS_MINIMAL", "200000")),
+    "fast": int(os.getenv("MAX_PROMPT_TOKENS_FAST", "50000")),
+    "balanced": int(os.getenv("MAX_PROMPT_TOKENS_BALANCED", "50000")),
+    "maximum": int(os.getenv("MAX_PROMPT_TOKENS_MAXIMUM", str(
+        GPT2_CONTEXT_TOKENS - GENERATION_MAX_NEW_TOKENS - REWRITE_INSTRUCTION_TOKENS))),
+}
+
+# phi-1_5's context window, shared by a tested prompt and its response
+TEST_CONTEXT_TOKENS = 2048
+# Default and largest number of tokens generated when testing a prompt
+TEST_MAX_NEW_TOKENS = int(os.getenv("TEST_MAX_NEW_TOKENS", "200"))
+TEST_MAX_NEW_TOKENS_LIMIT = int(os.getenv("TEST_MAX_NEW_TOKENS_LIMIT", "1024"))
+
+WORD_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap upper-leaning estimate of the GPT-2 token count of text
+
+    English averages about 4 characters or 0.75 words per BPE token; every
+    non-ASCII character (e.g. Thai) is counted as a whole token since
+    byte-level BPE usually needs at least one for it.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    non_ascii = len(text) - ascii_chars
+    words = len(WORD_RE.findall(text))
+    return max(math.ceil(words * 4 / 3), math.ceil(ascii_chars / 4)) + non_ascii
+
+
+def max_prompt_tokens(optimization_level: str) -> int:
+    # Unknown levels are optimized like "maximum"
+    return MAX_PROMPT_TOKENS.get(optimization_level, MAX_PROMPT_TOKENS["maximum"])
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt is larger than its optimization level accepts"""
+
+    def __init__(self, tokens: int, limit: int, optimization_level: str):
+        super().__init__(f"Prompt is about {tokens} tokens, the limit for the "
+                         f"{optimization_level} level is {limit}")
+        self.tokens = tokens
+        self.limit = limit
+        self.optimization_level = optimization_level
+
+    def __reduce__(self):
+        # Keep the exception picklable across the process pool and model server
+        return (type(self), (self.tokens, self.limit, self.optimization_level))
+
+
+def check_prompt(prompt: str, optimization_level: str) -> int:
+    """Return the prompt's estimated tokens, raising PromptTooLongError over the limit"""
+    tokens = estimate_tokens(prompt)
+    limit = max_prompt_tokens(optimization_level)
+    if tokens > limit:
+        raise PromptTooLongError(tokens, limit, optimization_level)
+    return tokens
+
+
+def test_max_new_tokens(requested: Optional[int] = None) -> int:
+    """The response length for a prompt test, clamped to TEST_MAX_NEW_TOKENS_LIMIT"""
+    if requested is None:
+        requested = TEST_MAX_NEW_TOKENS
+    return max(1, min(requested, TEST_MAX_NEW_TOKENS_LIMIT))
+
+
+def check_test_prompt(prompt: str, max_new_tokens: int) -> int:
+    """Return a tested prompt's estimated tokens, raising PromptTooLongError if
+    the prompt and its response would not fit in the test model's context"""
+    tokens = estimate_tokens(prompt)
+    limit = TEST_CONTEXT_TOKENS - max_new_tokens
+    if tokens > limit:
+        raise PromptTooLongError(tokens, limit, "test")
+    return tokens
+
+
+def chunk_sentences(sentences: List[str], max_tokens: int) -> List[str]:
+    """
+    Group consecutive sentences into chunks of at most max_tokens
+
+    A sentence longer than max_tokens becomes a chunk of its own rather than
+    being cut mid-sentence.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence)
+        if current and size + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
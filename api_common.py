@@ -0,0 +1,67 @@
+"""
+Request models, limits and counters shared by the API apps
+
+main.py and fast_server.py both serve /api/optimize and
+/api/optimize/batch. Their request bodies, the batch size limit and the
+prompt_requests_total counter live here so the two apps cannot drift apart.
+This module imports nothing that loads a model, so fast_server.py stays slim.
+"""
+import os
+from typing import List
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+import admission
+import metrics
+import template_store
+
+# Largest number of items accepted by the batch endpoints
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "256"))
+
+OPTIMIZATION_LEVELS = ("minimal", "fast", "balanced", "maximum")
+
+REQUESTS = metrics.register(metrics.Counter(
+    "prompt_requests_total", "Prompt requests by endpoint, optimization level and target model",
+    ["endpoint", "optimization_level", "target_model"]))
+
+
+class OptimizeRequest(BaseModel):
+    prompt: str
+    target_model: str
+    optimization_level: str = "balanced"
+
+
+class BatchOptimizeRequest(BaseModel):
+    items: List[OptimizeRequest]
+
+
+def count_request(endpoint: str, optimization_level: str, target_model: str) -> None:
+    """Count a prompt request for the prompt_requests_total metric"""
+    if not metrics.METRICS_ENABLED:
+        return
+    # Label values come from clients, so only known ones are kept as-is
+    model = target_model.lower().strip()
+    REQUESTS.inc(endpoint,
+                 optimization_level if optimization_level in OPTIMIZATION_LEVELS + ("",) else "other",
+                 model if model in template_store.current().practices else "other")
+
+
+def check_batch_size(items: list, limit: int = MAX_BATCH_ITEMS) -> None:
+    if len(items) > limit:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch has {len(items)} items, the limit is {limit}")
+
+
+def batch_results(results: list, key: str) -> list:
+    """Shape per-item results (values or exceptions) for a batch response"""
+    return [
+        {"status": "error", "detail": str(result)} if isinstance(result, Exception)
+        else {"status": "success", key: result}
+        for result in results
+    ]
+
+
+def prompt_too_long_error(e: admission.PromptTooLongError) -> HTTPException:
+    """Reject a prompt over its level's size limit before any work starts"""
+    return HTTPException(status_code=413, detail=str(e))
@@ -0,0 +1,144 @@
+import os
+import time
+import queue
+import logging
+import threading
+import contextlib
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, ContextManager, Dict, List, Tuple
+
+from metrics import Histogram
+
+# How many prompts one generation call may carry, and how long the first
+# queued prompt may wait for others to join it
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "8"))
+GENERATION_BATCH_WAIT_MS = float(os.getenv("GENERATION_BATCH_WAIT_MS", "10"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Live batchers, so their threads can be restarted in forked children
+_BATCHERS: "weakref.WeakSet[MicroBatcher]" = weakref.WeakSet()
+
+
+def prepare_for_batching(generator: Any) -> Any:
+    """Give a text-generation pipeline a pad token and left padding"""
+    tokenizer = getattr(generator, "tokenizer", None)
+    if tokenizer is not None:
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Decoder-only models must be padded on the left to continue the prompt
+        tokenizer.padding_side = "left"
+    return generator
+
+
+class MicroBatcher:
+    """
+    Collect concurrent generation calls and run them as one padded batch
+
+    Callers block in generate() while a background thread waits up to
+    max_wait_ms (or until max_batch_size prompts are queued), groups the
+    prompts by their generation kwargs and runs each group through the
+    pipeline in a single call, inside context() (e.g. torch.inference_mode).
+    """
+
+    def __init__(self, name: str, generator: Callable[..., Any],
+                 max_batch_size: int = GENERATION_BATCH_SIZE,
+                 max_wait_ms: float = GENERATION_BATCH_WAIT_MS,
+                 context: Callable[[], ContextManager] = contextlib.nullcontext):
+        self.name = name
+        self.context = context
+        self.generator = prepare_for_batching(generator)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batch_sizes = Histogram(f"{name}_batch_size", "Prompts per generation call",
+                                     BATCH_SIZE_BUCKETS)
+        self.wait_times = Histogram(f"{name}_batch_wait_seconds",
+                                    "Time a prompt waited for its batch to start")
+        self._start()
+        _BATCHERS.add(self)
+
+    def _start(self) -> None:
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any], float, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+        self._thread.start()
+
+    def generate(self, prompt: str, **kwargs) -> List[Dict[str, Any]]:
+        """Generate for one prompt; returns what the pipeline returns for it"""
+        future: Future = Future()
+        self._queue.put((prompt, kwargs, time.perf_counter(), future))
+        return future.result()
+
+    def run_batch(self, prompts: List[str], **kwargs) -> List[Any]:
+        """
+        Generate for prompts the caller has already batched, in the calling thread
+
+        Skips the queue, but runs inside context() and counts in the
+        batch-size histogram like a collected batch.
+        """
+        for start in range(0, len(prompts), self.max_batch_size):
+            self.batch_sizes.observe(min(self.max_batch_size, len(prompts) - start))
+        with self.context():
+            return self.generator(prompts, batch_size=self.max_batch_size, **kwargs)
+
+    def _collect(self) -> List[Tuple[str, Dict[str, Any], float, Future]]:
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run_group(self, group: List[Tuple[str, Dict[str, Any], float, Future]]) -> None:
+        prompts = [item[0] for item in group]
+        kwargs = group[0][1]
+        started = time.perf_counter()
+        for _, _, enqueued, _ in group:
+            self.wait_times.observe(started - enqueued)
+        self.batch_sizes.observe(len(group))
+        try:
+            with self.context():
+                outputs = self.generator(prompts, batch_size=len(prompts), **kwargs)
+        except Exception as e:
+            for _, _, _, future in group:
+                future.set_exception(e)
+            return
+        for (_, _, _, future), output in zip(group, outputs):
+            future.set_result(output)
+
+    def _loop(self) -> None:
+        while True:
+            items = self._collect()
+            groups: Dict[str, List] = {}
+            for item in items:
+                key = repr(sorted(item[1].items()))
+                groups.setdefault(key, []).append(item)
+            for group in groups.values():
+                try:
+                    self._run_group(group)
+                except Exception:
+                    logging.exception(f"{self.name} batcher failed")
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and wait-time histograms for this batcher"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_seconds": self.wait_times.snapshot(),
+        }
+
+
+def _restart_after_fork() -> None:
+    # Threads do not survive fork(); give every batcher a fresh queue and thread
+    for batcher in list(_BATCHERS):
+        batcher._start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
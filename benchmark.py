@@ -0,0 +1,396 @@
+"""
+Reproducible performance benchmark for the optimizer and the API
+
+Times every optimizer stage across prompt-length buckets, load-tests the
+generate and optimize endpoints in-process through an ASGI client at several
+concurrency levels and writes p50/p95/p99 latency, throughput, peak RSS and
+import/startup time to a JSON file that can be compared across commits.
+
+Usage:
+    python benchmark.py --stub --output bench.json
+    python benchmark.py --stub --output new.json --compare bench.json
+
+--stub replaces spaCy, punkt, GPT-2 and MiniLM with cheap deterministic
+stand-ins, so the benchmark runs offline without downloading weights and
+measures the application code around the models.
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import logging
+import platform
+import argparse
+import resource
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Approximate word count of each prompt-length bucket
+LENGTH_BUCKETS = {"short": 12, "medium": 60, "long": 250, "xlong": 1000}
+
+STAGES = ["generate_prompt", "clean_prompt", "split_sentences", "enhance_prompt_structure",
+          "rewrite_prompt", "extract_domain", "evaluate_prompt_effectiveness"]
+
+ENDPOINTS = {
+    "generate": ("/api/generate", lambda prompt: {
+        "goal": prompt, "target_model": "chatgpt", "style": "detailed",
+        "formats": ["standard", "persona", "constraints", "examples"]}),
+    "optimize_minimal": ("/api/optimize", lambda prompt: {
+        "prompt": prompt, "target_model": "chatgpt", "optimization_level": "minimal"}),
+    "optimize_fast": ("/api/optimize", lambda prompt: {
+        "prompt": prompt, "target_model": "chatgpt", "optimization_level": "fast"}),
+    "optimize_balanced": ("/api/optimize", lambda prompt: {
+        "prompt": prompt, "target_model": "chatgpt", "optimization_level": "balanced"}),
+    "optimize_maximum": ("/api/optimize", lambda prompt: {
+        "prompt": prompt, "target_model": "chatgpt", "optimization_level": "maximum"}),
+}
+
+SENTENCES = [
+    "Write a detailed guide about healthy eating for busy software engineers",
+    "Explain how gradient descent works in machine learning, step by step",
+    "Include examples, common mistakes and a short summary at the end",
+    "The audience is marketing managers with little technical background",
+    "Compare the costs, risks and benefits of each option in a table",
+    "Keep the tone friendly, avoid jargon and cite reliable sources",
+    "Describe the history of the topic, the current state and future trends",
+    "Focus on practical advice that a beginner could apply this week",
+]
+
+EMBEDDING_DIM = 384
+
+log = logging.getLogger("benchmark")
+
+
+def make_prompt(words: int, seed: int) -> str:
+    """Build a deterministic prompt of roughly the given number of words"""
+    rng = random.Random(seed)
+    sentences, count = [], 0
+    while count < words:
+        sentence = rng.choice(SENTENCES)
+        sentences.append(sentence + ".")
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def summarize(latencies: List[float], wall_seconds: Optional[float] = None) -> Dict[str, float]:
+    """Latency percentiles in milliseconds plus throughput in operations per second"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000.0
+    wall = wall_seconds if wall_seconds is not None else float(np.sum(latencies))
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "throughput_per_s": values.size / wall if wall > 0 else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+# Stub models: same interfaces as the real ones, no weights
+
+class _StubToken:
+    def __init__(self, text: str):
+        self.text = text
+        self.lemma_ = text.lower()
+        self.pos_ = "VERB" if self.lemma_ in _STUB_VERBS else "NOUN"
+
+
+class _StubSpan:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubDoc:
+    def __init__(self, text: str):
+        self.text = text
+        self._tokens = [_StubToken(word) for word in re.findall(r"\w+", text)]
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    @property
+    def noun_chunks(self):
+        return [_StubSpan(token.text) for token in self._tokens if len(token.text) > 6]
+
+
+_STUB_VERBS = {"write", "explain", "include", "compare", "keep", "avoid", "cite",
+               "describe", "focus", "apply", "works"}
+
+
+class StubNLP:
+    """Stands in for the spaCy pipeline"""
+
+    def __call__(self, text: str) -> _StubDoc:
+        return _StubDoc(text)
+
+    def pipe(self, texts):
+        for text in texts:
+            yield _StubDoc(text)
+
+
+class StubEmbedder:
+    """Stands in for MiniLM with hashed bag-of-words vectors"""
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+        return vector
+
+    def encode(self, texts, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(text) for text in texts]) if texts else \
+            np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+
+class StubGenerator:
+    """Stands in for the GPT-2 text-generation pipeline"""
+
+    tokenizer = None
+
+    def __init__(self, delay_ms: float = 0.0):
+        self.delay = delay_ms / 1000.0
+
+    def _generate(self, text: str) -> List[Dict[str, str]]:
+        return [{"generated_text": f"{text} A clear, specific version of the request with context."}]
+
+    def __call__(self, inputs, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        if isinstance(inputs, str):
+            return self._generate(inputs)
+        return [self._generate(text) for text in inputs]
+
+
+def install_stubs(generation_delay_ms: float = 0.0) -> None:
+    """Swap the optimizer's model loaders for the stubs above"""
+    import optimizer
+    from template_index import TemplateEmbeddingIndex
+
+    embedder = StubEmbedder()
+
+    def load_template_index():
+        index = TemplateEmbeddingIndex(optimizer.PROMPT_TEMPLATES_PATH, "stub-hashed-bow",
+                                       lambda texts: embedder.encode(texts))
+        index.ensure_current()
+        return index
+
+    optimizer.MODEL_LOADERS.update({
+        "nlp": StubNLP,
+        "punkt": lambda: True,
+        "generator": lambda: StubGenerator(generation_delay_ms),
+        "embedding_model": lambda: embedder,
+        "template_index": load_template_index,
+    })
+    # Split on sentence punctuation instead of importing NLTK
+    optimizer.sent_tokenize = lambda text: [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s]
+
+
+def time_stage(func: Callable[[str], Any], prompts: List[str]) -> Dict[str, float]:
+    latencies = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        func(prompt)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_stages(iterations: int, stages: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Time each optimizer stage on every prompt-length bucket"""
+    import optimizer
+    import models
+    import rules
+
+    practices = optimizer.MODEL_BEST_PRACTICES["chatgpt"]
+    # Fresh ParsedPrompt objects so the parse cache doesn't hide parsing cost
+    calls: Dict[str, Callable[[str], Any]] = {
+        "generate_prompt": lambda p: optimizer.generate_prompt(
+            p, "chatgpt", formats=["standard", "persona", "constraints", "examples"]),
+        "clean_prompt": optimizer.clean_prompt,
+        "split_sentences": rules.split_sentences,
+        "enhance_prompt_structure": lambda p: optimizer.enhance_prompt_structure(
+            p, practices, optimizer.ParsedPrompt(p)),
+        "rewrite_prompt": lambda p: optimizer.rewrite_prompt(
+            p, "chatgpt", practices, optimizer.ParsedPrompt(p)),
+        "extract_domain": optimizer.extract_domain,
+        "evaluate_prompt_effectiveness": models.evaluate_prompt_effectiveness,
+    }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for stage in stages:
+        results[stage] = {}
+        for bucket, words in LENGTH_BUCKETS.items():
+            prompts = [make_prompt(words, seed) for seed in range(iterations)]
+            calls[stage](prompts[0])  # warm-up, excluded from the timings
+            results[stage][bucket] = time_stage(calls[stage], prompts)
+            log.info(f"{stage} [{bucket}]: p50 {results[stage][bucket]['p50_ms']:.3f} ms")
+    return results
+
+
+async def _load(client, path: str, bodies: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(body):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(body) for body in bodies))
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary["errors"] = errors
+    return summary
+
+
+async def bench_endpoints(app, requests: int, concurrencies: List[int],
+                          endpoints: List[str], words: int) -> Dict[str, Dict[str, Any]]:
+    """Load-test the endpoints in-process at each concurrency level"""
+    import httpx
+
+    results: Dict[str, Dict[str, Any]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for name in endpoints:
+            path, make_body = ENDPOINTS[name]
+            results[name] = {}
+            await client.post(path, json=make_body(make_prompt(words, -1)))  # warm-up
+            for concurrency in concurrencies:
+                # Unique prompts, so no request is answered from a cache
+                bodies = [make_body(f"{make_prompt(words, i)} Request {concurrency}-{i}.")
+                          for i in range(requests)]
+                results[name][str(concurrency)] = await _load(client, path, bodies, concurrency)
+                log.info(f"{name} x{concurrency}: "
+                             f"{results[name][str(concurrency)]['throughput_per_s']:.1f} req/s")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Lines describing the p50 change of every measurement present in both reports"""
+    lines = []
+    for section in ("stages", "endpoints"):
+        for name, entries in current.get(section, {}).items():
+            for key, summary in entries.items():
+                old = baseline.get(section, {}).get(name, {}).get(key)
+                if not old or not old.get("p50_ms"):
+                    continue
+                ratio = summary["p50_ms"] / old["p50_ms"]
+                lines.append(f"{section}.{name}[{key}]: p50 {old['p50_ms']:.3f} -> "
+                             f"{summary['p50_ms']:.3f} ms ({ratio:.2f}x)")
+    return lines
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the optimizer stages and API endpoints")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="Earlier report to compare p50 latencies against")
+    parser.add_argument("--stub", action="store_true", help="Use stub models instead of real weights")
+    parser.add_argument("--stub-generation-ms", type=float, default=0.0,
+                        help="Simulated latency of each stub GPT-2 call")
+    parser.add_argument("--iterations", type=int, default=20, help="Calls per stage and length bucket")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per endpoint and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 4, 16])
+    parser.add_argument("--stages", nargs="*", choices=STAGES, default=STAGES)
+    parser.add_argument("--endpoints", nargs="*", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--endpoint-words", type=int, default=LENGTH_BUCKETS["medium"],
+                        help="Approximate prompt length used for the load test")
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="Leave the result and semantic caches enabled")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Set before the app modules read their configuration
+    if args.stub:
+        # Stubs only exist in this process, so generation must not be sent to a process pool
+        os.environ["GENERATION_PROCESSES"] = "0"
+    if not args.keep_caches:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+        os.environ["RESULT_CACHE_DB"] = ""
+        os.environ["SEMANTIC_CACHE_SIZE"] = "0"
+    # Synthetic prompts must not end up in the prompt history
+    os.environ["EMBEDDING_STORE_ENABLED"] = "0"
+
+    import_seconds: Dict[str, float] = {}
+    for module in ("optimizer", "models", "main"):
+        started = time.perf_counter()
+        __import__(module)
+        import_seconds[module] = time.perf_counter() - started
+    import optimizer
+    import executor
+    import main as api
+
+    # Keep per-request application logs out of the output
+    logging.getLogger().setLevel(logging.WARNING)
+    log.setLevel(logging.INFO)
+    started = time.perf_counter()
+    if args.stub:
+        install_stubs(args.stub_generation_ms)
+    optimizer.warm_up()
+    startup_seconds = time.perf_counter() - started
+    rss_after_startup = peak_rss_mb()
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stub": args.stub,
+            "args": vars(args),
+        },
+        "startup": {
+            "import_seconds": import_seconds,
+            "model_load_seconds": startup_seconds,
+            "peak_rss_mb": rss_after_startup,
+        },
+    }
+    try:
+        report["stages"] = bench_stages(args.iterations, args.stages)
+        report["endpoints"] = asyncio.run(bench_endpoints(
+            api.app, args.requests, args.concurrency, args.endpoints, args.endpoint_words))
+    finally:
+        executor.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    log.info(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(report, baseline):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Bulk optimization of large JSONL prompt corpora
+
+Each input line is a JSON object with a "prompt" (or "body") field and
+optional "id"/"request_id", "target_model" and "optimization_level" fields.
+Every output line is a JSON record carrying the input "offset" just past the
+line it came from, so a crashed job can be resumed from the last record.
+
+Usage:
+    python bulk.py prompts.jsonl results.ndjson --target-model chatgpt --level balanced
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import optimizer
+import models
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "32"))
+READ_CHUNK_SIZE = 1 << 20
+
+# (start offset, end offset, raw line)
+Line = Tuple[int, int, bytes]
+# (end offset, record id, optimize_prompt kwargs, error) with either the
+# kwargs or the error of a line that could not be parsed set
+Record = Tuple[int, Any, Optional[Dict[str, Any]], Optional[str]]
+
+
+def iter_lines(f, offset: int = 0, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Line]:
+    """Read a binary file in chunks and yield its non-empty lines with byte offsets"""
+    f.seek(offset)
+    buffer = b""
+    start = offset
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            end = start + len(line) + 1
+            if line.strip():
+                yield start, end, line
+            start = end
+    if buffer.strip():
+        yield start, start + len(buffer), buffer
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes], offset: int = 0) -> AsyncIterator[Line]:
+    """Async variant of iter_lines over a stream of byte chunks"""
+    buffer = b""
+    start = offset
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            end = start + len(line) + 1
+            if line.strip():
+                yield start, end, line
+            start = end
+    if buffer.strip():
+        yield start, start + len(buffer), buffer
+
+
+def iter_batches(lines: Iterable[Line], size: int = BULK_BATCH_SIZE) -> Iterator[List[Line]]:
+    """Group lines into lists of at most size items"""
+    batch: List[Line] = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_record(line: bytes, target_model: str, optimization_level: str) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Turn one input line into (record id, optimize_prompt kwargs)
+
+    Raises:
+        ValueError: If the line is not a JSON object with a prompt
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object")
+    prompt = record.get("prompt") or record.get("body")
+    if not prompt:
+        raise ValueError("Record has no 'prompt' or 'body' field")
+    record_id = record.get("id", record.get("request_id"))
+    return record_id, {
+        "prompt": prompt,
+        # null counts as absent; other wrong types fail the record in optimize_prompts
+        "target_model": record.get("target_model") or target_model,
+        "optimization_level": record.get("optimization_level") or optimization_level,
+    }
+
+
+def parse_batch(batch: List[Line], target_model: str = "default",
+                optimization_level: str = "balanced") -> List[Record]:
+    """Parse every line of a batch once, keeping the error of lines that fail"""
+    records = []
+    for _, end, line in batch:
+        try:
+            record_id, request = parse_record(line, target_model, optimization_level)
+        except ValueError as e:
+            records.append((end, None, None, str(e)))
+            continue
+        records.append((end, record_id, request, None))
+    return records
+
+
+def process_batch(records: List[Record], evaluate: bool = True) -> List[Dict[str, Any]]:
+    """Optimize (and optionally score) one parsed batch, keeping input order"""
+    outputs: List[Dict[str, Any]] = []
+    requests, positions = [], []
+    for i, (end, record_id, request, error) in enumerate(records):
+        if request is None:
+            outputs.append({"id": None, "offset": end, "status": "error", "detail": error})
+            continue
+        outputs.append({"id": record_id, "offset": end})
+        requests.append(request)
+        positions.append(i)
+
+    results = optimizer.optimize_prompts(requests)
+    succeeded = []
+    for i, result in zip(positions, results):
+        if isinstance(result, Exception):
+            outputs[i].update(status="error", detail=str(result))
+            continue
+        outputs[i].update(status="success", optimized_prompt=result)
+        succeeded.append(i)
+    if evaluate and succeeded:
+        evaluations = models.evaluate_prompts([outputs[i]["optimized_prompt"] for i in succeeded])
+        for i, evaluation in zip(succeeded, evaluations):
+            outputs[i]["evaluation"] = evaluation
+    return outputs
+
+
+def needs_generation(records: List[Record]) -> bool:
+    """Whether any record of a parsed batch asks for the (GPT-2) maximum level"""
+    return any(request is not None and request["optimization_level"] not in ("minimal", "fast", "balanced")
+               for _, _, request, _ in records)
+
+
+def resume_offset(output_path: str) -> int:
+    """
+    Find the input offset to resume from and drop any half-written last line
+
+    Returns:
+        The "offset" of the last complete output record, or 0
+    """
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        tail = b""
+        pos = size
+        # Walk backwards until the tail holds at least one complete line
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(READ_CHUNK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        if not tail.endswith(b"\n"):
+            cut = tail.rfind(b"\n") + 1
+            f.truncate(pos + cut)
+            tail = tail[:cut]
+        lines = tail.rstrip(b"\n").split(b"\n")
+        if not lines or not lines[-1]:
+            return 0
+        return int(json.loads(lines[-1])["offset"])
+
+
+def run_file(input_path: str, output_path: str, target_model: str = "default",
+             optimization_level: str = "balanced", batch_size: int = BULK_BATCH_SIZE,
+             evaluate: bool = True, resume: bool = True) -> int:
+    """
+    Optimize a JSONL file into an NDJSON results file in constant memory
+
+    Returns:
+        Number of records written by this run
+    """
+    offset = resume_offset(output_path) if resume else 0
+    if offset:
+        logging.info(f"Resuming {input_path} from byte {offset}")
+    written = 0
+    with open(input_path, "rb") as src, open(output_path, "ab" if resume else "wb") as dst:
+        for batch in iter_batches(iter_lines(src, offset), batch_size):
+            records = parse_batch(batch, target_model, optimization_level)
+            for output in process_batch(records, evaluate):
+                dst.write(json.dumps(output, ensure_ascii=False).encode("utf-8") + b"\n")
+            dst.flush()
+            os.fsync(dst.fileno())
+            written += len(batch)
+            logging.info(f"Processed {written} records (input offset {batch[-1][1]})")
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Optimize a JSONL file of prompts")
+    parser.add_argument("input", help="Input JSONL file")
+    parser.add_argument("output", help="Output NDJSON file (appended to when resuming)")
+    parser.add_argument("--target-model", default="default")
+    parser.add_argument("--level", default="balanced", choices=["minimal", "fast", "balanced", "maximum"])
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--no-evaluate", action="store_true", help="Skip effectiveness scoring")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing output and start over")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_file(args.input, args.output, args.target_model, args.level,
+             args.batch_size, not args.no_evaluate, not args.restart)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
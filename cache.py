@@ -0,0 +1,316 @@
+import os
+import glob
+import asyncio
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# In-process tier
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+# Optional on-disk tier shared by every worker on the host (empty = disabled)
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "")
+# How often (seconds) a coalesced request checks whether its client left
+COALESCE_POLL_INTERVAL = float(os.getenv("COALESCE_POLL_INTERVAL", "0.25"))
+
+DATA_GLOB = "data/*.json"
+# Data files are re-stat'ed at most this often (seconds)
+DATA_CHECK_INTERVAL = 1.0
+
+_MISSING = object()
+
+
+class DataVersion:
+    """Content hash of the template and best-practices files"""
+
+    def __init__(self, pattern: str = DATA_GLOB):
+        self.pattern = pattern
+        self._state = None
+        self._version = ""
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        now = time.monotonic()
+        if self._version and now - self._checked < DATA_CHECK_INTERVAL:
+            return self._version
+        with self._lock:
+            paths = sorted(glob.glob(self.pattern))
+            state = tuple((p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+            if state != self._state:
+                digest = hashlib.sha256()
+                for path in paths:
+                    with open(path, "rb") as f:
+                        digest.update(path.encode("utf-8") + b"\0" + f.read())
+                self._version = digest.hexdigest()[:16]
+                self._state = state
+            self._checked = now
+        return self._version
+
+
+DATA_VERSION = DataVersion()
+
+
+def make_key(kind: str, payload: Dict[str, Any]) -> str:
+    """Hash a normalized request payload together with the data file version"""
+    blob = json.dumps({"kind": kind, "payload": payload, "data": DATA_VERSION.current()},
+                      sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def generate_key(goal: str, target_model: str, context: Optional[str] = None,
+                 style: Optional[str] = "detailed", formats: Optional[list] = None) -> str:
+    """Cache key for generate_prompt arguments"""
+    return make_key("generate", {
+        "goal": goal,
+        "target_model": target_model.lower().strip(),
+        "context": context or None,
+        "style": style,
+        # generate_prompt only tests membership, so order and repeats don't matter
+        "formats": sorted(set(formats or [])),
+    })
+
+
+def optimize_key(prompt: str, target_model: str, optimization_level: str) -> str:
+    """Cache key for optimize_prompt arguments"""
+    return make_key("optimize", {
+        "prompt": prompt,
+        "target_model": target_model.lower().strip(),
+        "optimization_level": optimization_level,
+    })
+
+
+class ResultCache:
+    """
+    Two-tier result cache: a bounded LRU with TTL, optionally backed by SQLite
+
+    Keys already encode the data file version, so edits to data/*.json make
+    old entries unreachable; the memory tier is also dropped when the version
+    changes so stale results don't hold on to slots.
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 db_path: str = RESULT_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _check_version(self) -> None:
+        version = DATA_VERSION.current()
+        if version != self._version:
+            if self._version is not None:
+                logging.info("Data files changed, clearing result cache")
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            value = self._disk_get(key, now)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.disk_hits += 1
+            self._store(key, value, now)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._store(key, value, now)
+            self._disk_set(key, value, now)
+
+    def _store(self, key: str, value: Any, now: float) -> None:
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Any:
+        try:
+            db = self._connect()
+            if db is None:
+                return _MISSING
+            row = db.execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Result cache read failed: {e}")
+            return _MISSING
+        if row is None or row[0] <= now:
+            return _MISSING
+        return json.loads(row[1])
+
+    def _disk_set(self, key: str, value: Any, now: float) -> None:
+        try:
+            db = self._connect()
+            if db is None:
+                return
+            db.execute("INSERT OR REPLACE INTO results (key, expires, value) VALUES (?, ?, ?)",
+                       (key, now + self.ttl, json.dumps(value, ensure_ascii=False)))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+            db.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Result cache write failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "disk": bool(self.db_path),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+RESULT_CACHE = ResultCache()
+
+
+class ClientDisconnected(Exception):
+    """Raised to a coalesced request whose client went away while it waited"""
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Share one in-flight computation between concurrent identical requests
+
+    The first request for a key starts the computation as a task; requests
+    for the same key that arrive before it finishes wait on that task and get
+    the same result (or exception). A waiter whose client disconnects stops
+    waiting; the computation is cancelled once no waiter is left. Work it
+    already handed to an executor pool runs to the end and keeps its pool
+    slot until then (see BoundedPool.run_acquired). Only used from the event
+    loop, so no locking is needed.
+    """
+
+    def __init__(self, poll_interval: float = COALESCE_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.disconnected = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]],
+                 is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """
+        Return compute()'s result, sharing it with concurrent calls for key
+
+        Args:
+            key: Normalized request key (e.g. from optimize_key)
+            compute: Starts the work; only called when no flight for key exists
+            is_disconnected: Polled while waiting; when it returns True this
+                caller leaves and ClientDisconnected is raised
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(compute()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._land(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            if is_disconnected is None:
+                return await asyncio.shield(flight.task)
+            return await self._wait(flight, is_disconnected)
+        except (asyncio.CancelledError, ClientDisconnected):
+            if not flight.task.done():
+                self._leave(flight, key)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _wait(self, flight: _Flight, is_disconnected: Callable[[], Awaitable[bool]]) -> Any:
+        shared = asyncio.shield(flight.task)
+        while True:
+            done, _ = await asyncio.wait({shared}, timeout=self.poll_interval)
+            if done:
+                return shared.result()
+            if await is_disconnected():
+                shared.cancel()
+                self.disconnected += 1
+                raise ClientDisconnected("Client disconnected while waiting for a shared result")
+
+    def _leave(self, flight: _Flight, key: str) -> None:
+        # Called before this waiter's finally, so 1 means it was the last one
+        if flight.waiters <= 1:
+            self.abandoned += 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.task.cancel()
+
+    def _land(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody is left to retrieve an exception of a cancelled flight
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.started + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "computations": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / requests if requests else 0.0,
+            "disconnected_waiters": self.disconnected,
+            "abandoned_computations": self.abandoned,
+        }
+
+
+IN_FLIGHT = SingleFlight()
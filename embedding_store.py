@@ -0,0 +1,598 @@
+"""
+Prompt history with memory-mapped embeddings for similarity search
+
+Every prompt is stored once, append-only, as one row in a set of flat files:
+
+    vectors.bin  MiniLM embedding, int8 (plus a float32 scale in scales.bin)
+                 or float16, L2-normalized
+    index.bin    fixed-size record per row: id, text offset/length, text
+                 hash, creation time, kind, deleted flag
+    texts.bin    UTF-8 prompt texts
+
+The files are opened with np.memmap, so searching a million rows touches
+the page cache rather than the Python heap. Writers from several worker
+processes serialize on a lock file. Compaction rewrites the live rows into
+a new generation directory and switches CURRENT to it atomically.
+
+Usage:
+    python embedding_store.py stats
+    python embedding_store.py search "write a marketing plan" --top-k 5
+    python embedding_store.py compact
+"""
+import os
+import sys
+import json
+import time
+import queue
+import fcntl
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from template_index import normalize_rows
+
+# Off by default: recording embeds every prompt with MiniLM, which loads
+# torch into each API worker unless MODEL_SERVER_SOCKET is set
+EMBEDDING_STORE_ENABLED = os.getenv("EMBEDDING_STORE_ENABLED", "0") == "1"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", ".cache/prompt_store")
+# int8 (388 bytes per MiniLM vector) or float16 (768 bytes)
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "int8")
+# Oldest rows beyond this many are dropped at compaction (0 = keep everything)
+EMBEDDING_STORE_MAX_ROWS = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", "0"))
+# Seconds between compaction checks in the API (0 disables them)
+EMBEDDING_STORE_COMPACT_INTERVAL = float(os.getenv("EMBEDDING_STORE_COMPACT_INTERVAL", "3600"))
+# Share of deleted rows that makes a compaction worthwhile
+COMPACT_MIN_GARBAGE = 0.1
+
+# Prompts embedded per call by the background recorder, how long it waits
+# for a batch to fill, and how many prompts may wait before new ones are dropped
+RECORD_BATCH_SIZE = 64
+RECORD_WAIT_MS = 200
+RECORD_MAX_QUEUE = 10000
+
+# Rows upcast to float32 at a time during a search (NumPy has no fast
+# int8/float16 matrix product)
+SEARCH_BLOCK_ROWS = 16384
+
+KINDS = {"generate": 1, "optimize": 2}
+_KIND_NAMES = {value: name for name, value in KINDS.items()}
+
+INDEX_DTYPE = np.dtype([
+    ("id", "<u8"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("hash", "<u8"),
+    ("created", "<f8"),
+    ("kind", "u1"),
+    ("deleted", "u1"),
+])
+
+
+def text_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode normalized float32 rows as (int8 rows, per-row scales) or (float16 rows, None)"""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def bytes_per_row(dim: int, dtype: str, text_bytes: int = 0) -> int:
+    """Disk (and, when searched, page cache) bytes one stored prompt takes"""
+    vector = dim * 2 if dtype == "float16" else dim + 4
+    return vector + INDEX_DTYPE.itemsize + text_bytes
+
+
+class _Generation:
+    """Memory maps over the files of one generation directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dtype: str = meta["dtype"]
+        self.dim: int = meta["dim"]
+        self.rows = 0
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.vectors = np.zeros((0, self.dim), dtype=self.vector_dtype)
+        self.scales: Optional[np.ndarray] = None
+        self.texts: Optional[np.memmap] = None
+
+    @property
+    def vector_dtype(self) -> np.dtype:
+        return np.dtype(np.float16 if self.dtype == "float16" else np.int8)
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def committed_rows(self) -> int:
+        # index.bin is written last, so it decides which rows are complete
+        return os.path.getsize(self.file("index.bin")) // INDEX_DTYPE.itemsize
+
+    def remap(self) -> None:
+        """Map every row committed so far"""
+        rows = self.committed_rows()
+        if rows == self.rows and self.texts is not None:
+            return
+        self.rows = rows
+        if rows == 0:
+            return
+        self.index = np.memmap(self.file("index.bin"), dtype=INDEX_DTYPE, mode="r", shape=(rows,))
+        self.vectors = np.memmap(self.file("vectors.bin"), dtype=self.vector_dtype, mode="r",
+                                 shape=(rows, self.dim))
+        if self.dtype != "float16":
+            self.scales = np.memmap(self.file("scales.bin"), dtype=np.float32, mode="r", shape=(rows,))
+        end = int(self.index["offset"][-1] + self.index["length"][-1])
+        self.texts = np.memmap(self.file("texts.bin"), dtype=np.uint8, mode="r", shape=(end,)) if end else None
+
+    def text(self, row: int) -> str:
+        offset, length = int(self.index["offset"][row]), int(self.index["length"][row])
+        return bytes(self.texts[offset:offset + length]).decode("utf-8") if length else ""
+
+
+def _create_generation(path: str, dtype: str, dim: int) -> None:
+    os.makedirs(path, exist_ok=True)
+    for name in ("index.bin", "vectors.bin", "scales.bin", "texts.bin"):
+        open(os.path.join(path, name), "ab").close()
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dtype": dtype, "dim": dim}, f)
+
+
+class EmbeddingStore:
+    """
+    Append-only prompt store with int8/float16 embeddings and top-k cosine search
+
+    Row ids are assigned in insertion order and survive compaction. The same
+    text is only stored once; texts are checked against a sorted array of
+    64-bit hashes (plus a set of recent ones) instead of a dict per row.
+    """
+
+    def __init__(self, root: str = EMBEDDING_STORE_DIR, dtype: str = EMBEDDING_STORE_DTYPE,
+                 max_rows: int = EMBEDDING_STORE_MAX_ROWS):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unknown embedding store dtype {dtype!r}, use int8 or float16")
+        self.root = root
+        self.dtype = dtype
+        self.max_rows = max_rows
+        self._generation: Optional[_Generation] = None
+        self._generation_name = ""
+        self._sorted_hashes = np.zeros(0, dtype=np.uint64)
+        self._recent_hashes = set()
+        self._hashed_rows = 0
+        self._lock = threading.RLock()
+
+    # Files and generations
+
+    def _current_name(self) -> str:
+        try:
+            with open(os.path.join(self.root, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def _switch(self, name: str) -> None:
+        tmp = os.path.join(self.root, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(self.root, "CURRENT"))
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive across threads and processes"""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, "lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> Optional[_Generation]:
+        """Follow CURRENT and map rows appended by any process"""
+        with self._lock:
+            name = self._current_name()
+            if not name:
+                return None
+            if name != self._generation_name:
+                self._generation = _Generation(os.path.join(self.root, name))
+                self._generation_name = name
+                self._sorted_hashes = np.zeros(0, dtype=np.uint64)
+                self._recent_hashes = set()
+                self._hashed_rows = 0
+            generation = self._generation
+            generation.remap()
+            if generation.rows > self._hashed_rows:
+                self._recent_hashes.update(generation.index["hash"][self._hashed_rows:].tolist())
+                self._hashed_rows = generation.rows
+                if len(self._recent_hashes) > 65536:
+                    self._sorted_hashes = np.sort(generation.index["hash"])
+                    self._recent_hashes = set()
+            return generation
+
+    def missing(self, texts: List[str]) -> List[str]:
+        """The texts that aren't stored yet, without duplicates"""
+        with self._lock:
+            self._refresh()
+            hashes = {}
+            for text in texts:
+                h = text_hash(text)
+                if h not in hashes and not self._contains(h):
+                    hashes[h] = text
+            return list(hashes.values())
+
+    def _contains(self, h: int) -> bool:
+        if h in self._recent_hashes:
+            return True
+        i = np.searchsorted(self._sorted_hashes, np.uint64(h))
+        return i < len(self._sorted_hashes) and int(self._sorted_hashes[i]) == h
+
+    # Writing
+
+    def add(self, texts: List[str], vectors: np.ndarray, kind: str = "generate") -> int:
+        """
+        Append prompts that aren't stored yet
+
+        Args:
+            texts: Prompt texts
+            vectors: Their embeddings, one row per text
+            kind: What produced the prompts (generate or optimize)
+
+        Returns:
+            Number of rows added
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind {kind!r}, use one of {', '.join(KINDS)}")
+        vectors = normalize_rows(vectors)
+        with self._write_lock():
+            generation = self._refresh()
+            if generation is None:
+                name = "gen-000001"
+                _create_generation(os.path.join(self.root, name), self.dtype, vectors.shape[1])
+                self._switch(name)
+                generation = self._refresh()
+            keep, seen = [], set()
+            for i, text in enumerate(texts):
+                h = text_hash(text)
+                if h not in seen and not self._contains(h):
+                    seen.add(h)
+                    keep.append((i, h))
+            if not keep:
+                return 0
+            self._append(generation, [texts[i] for i, _ in keep], vectors[[i for i, _ in keep]],
+                         [h for _, h in keep], KINDS[kind])
+            self._refresh()
+        return len(keep)
+
+    def _append(self, generation: _Generation, texts: List[str], vectors: np.ndarray,
+                hashes: List[int], kind: Any, created: Optional[np.ndarray] = None,
+                ids: Optional[np.ndarray] = None) -> None:
+        rows = generation.committed_rows()
+        codes, scales = quantize(vectors, generation.dtype)
+        encoded = [text.encode("utf-8") for text in texts]
+        # Drop whatever an interrupted append left past the last committed row
+        text_end = int(generation.index["offset"][-1] + generation.index["length"][-1]) if rows else 0
+        records = np.zeros(len(texts), dtype=INDEX_DTYPE)
+        records["length"] = [len(data) for data in encoded]
+        records["offset"] = text_end + np.concatenate(([0], np.cumsum(records["length"])[:-1]))
+        next_id = int(generation.index["id"][-1]) + 1 if rows else 1
+        records["id"] = ids if ids is not None else np.arange(next_id, next_id + len(texts))
+        records["hash"] = hashes
+        records["created"] = created if created is not None else time.time()
+        records["kind"] = kind
+        for name, data, size in (
+            ("texts.bin", b"".join(encoded), text_end),
+            ("vectors.bin", codes.tobytes(), rows * generation.dim * generation.vector_dtype.itemsize),
+            ("scales.bin", scales.tobytes() if scales is not None else b"", rows * 4 if scales is not None else 0),
+            ("index.bin", records.tobytes(), rows * INDEX_DTYPE.itemsize),
+        ):
+            with open(generation.file(name), "r+b") as f:
+                f.truncate(size)
+                f.seek(size)
+                f.write(data)
+
+    def delete(self, ids: List[int]) -> int:
+        """Mark rows as deleted; compaction removes them from disk"""
+        with self._write_lock():
+            generation = self._refresh()
+            if generation is None or not ids:
+                return 0
+            wanted = np.asarray(ids, dtype=np.uint64)
+            rows = np.minimum(np.searchsorted(generation.index["id"], wanted), generation.rows - 1)
+            rows = rows[generation.index["id"][rows] == wanted]
+            index = np.memmap(generation.file("index.bin"), dtype=INDEX_DTYPE, mode="r+",
+                              shape=(generation.rows,))
+            index["deleted"][rows] = 1
+            index.flush()
+            return int(len(rows))
+
+    # Reading
+
+    def get(self, ids: List[int]) -> Dict[int, str]:
+        """Texts of the given row ids (missing or deleted ids are left out)"""
+        generation = self._refresh()
+        if generation is None or generation.rows == 0:
+            return {}
+        wanted = np.asarray(ids, dtype=np.uint64)
+        rows = np.searchsorted(generation.index["id"], wanted)
+        found = {}
+        for row, row_id in zip(rows.tolist(), wanted.tolist()):
+            if row < generation.rows and int(generation.index["id"][row]) == row_id \
+                    and not generation.index["deleted"][row]:
+                found[row_id] = generation.text(row)
+        return found
+
+    def search(self, queries: np.ndarray, top_k: int = 10, kind: Optional[str] = None,
+               min_score: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Top-k cosine search for a batch of query embeddings
+
+        The store is scanned in SEARCH_BLOCK_ROWS blocks; each block is
+        upcast once and scored against every query in one matrix product,
+        and the running top k per query is merged with argpartition.
+
+        Returns:
+            Per query, up to top_k hits ({"id", "score", "text", "kind",
+            "created"}) best first
+        """
+        queries = np.atleast_2d(normalize_rows(queries))
+        generation = self._refresh()
+        if generation is None or generation.rows == 0 or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        n_queries, rows = len(queries), generation.rows
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((n_queries, 0), dtype=np.int64)
+        kind_code = KINDS.get(kind) if kind else None
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, rows)
+            scores = generation.vectors[start:stop].astype(np.float32) @ queries.T
+            if generation.scales is not None:
+                scores *= generation.scales[start:stop, None]
+            index = generation.index[start:stop]
+            excluded = index["deleted"] != 0
+            if kind_code is not None:
+                excluded |= index["kind"] != kind_code
+            scores[excluded] = -np.inf
+            scores = scores.T
+            block_rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, block_rows], axis=1)
+            if merged_scores.shape[1] > top_k:
+                keep = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+                merged_scores = np.take_along_axis(merged_scores, keep, axis=1)
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best_scores, best_rows = merged_scores, merged_rows
+
+        results = []
+        for scores, rows_ in zip(best_scores, best_rows):
+            hits = []
+            for i in np.argsort(-scores, kind="stable"):
+                score = float(scores[i])
+                if not np.isfinite(score) or (min_score is not None and score < min_score):
+                    continue
+                row = int(rows_[i])
+                record = generation.index[row]
+                hits.append({"id": int(record["id"]), "score": score, "text": generation.text(row),
+                             "kind": _KIND_NAMES.get(int(record["kind"]), "other"),
+                             "created": float(record["created"])})
+            results.append(hits)
+        return results
+
+    # Maintenance
+
+    def needs_compaction(self) -> bool:
+        generation = self._refresh()
+        if generation is None or generation.rows == 0:
+            return False
+        deleted = int(np.count_nonzero(generation.index["deleted"]))
+        live = generation.rows - deleted
+        return (deleted > COMPACT_MIN_GARBAGE * generation.rows
+                or (self.max_rows > 0 and live > self.max_rows)
+                or generation.dtype != self.dtype)
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Rewrite the live rows into a new generation
+
+        Deleted rows and, with max_rows, the oldest rows beyond it are
+        dropped; vectors are re-encoded when the configured dtype changed.
+        Readers keep using the old generation's mappings until their next
+        refresh, after which the old directory is removed.
+        """
+        started = time.perf_counter()
+        with self._write_lock():
+            generation = self._refresh()
+            if generation is None:
+                return {"rows_before": 0, "rows_after": 0}
+            live = np.flatnonzero(generation.index["deleted"] == 0)
+            if self.max_rows > 0 and len(live) > self.max_rows:
+                live = live[-self.max_rows:]
+            number = int(self._generation_name.rsplit("-", 1)[-1]) + 1
+            name = f"gen-{number:06d}"
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            _create_generation(path, self.dtype, generation.dim)
+            target = _Generation(path)
+            for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                rows = live[start:start + SEARCH_BLOCK_ROWS]
+                vectors = generation.vectors[rows].astype(np.float32)
+                if generation.scales is not None:
+                    vectors *= generation.scales[rows, None]
+                index = generation.index[rows]
+                target.remap()
+                self._append(target, [generation.text(int(row)) for row in rows], vectors,
+                             index["hash"], index["kind"], created=index["created"], ids=index["id"])
+            self._switch(name)
+            old = generation.path
+            before = generation.rows
+            self._refresh()
+        shutil.rmtree(old, ignore_errors=True)
+        logging.info(f"Compacted prompt store from {before} to {len(live)} rows")
+        return {"rows_before": before, "rows_after": int(len(live)), "generation": name,
+                "seconds": time.perf_counter() - started}
+
+    def compact_if_needed(self) -> Optional[Dict[str, Any]]:
+        return self.compact() if self.needs_compaction() else None
+
+    def stats(self) -> Dict[str, Any]:
+        generation = self._refresh()
+        if generation is None:
+            return {"rows": 0, "dtype": self.dtype}
+        deleted = int(np.count_nonzero(generation.index["deleted"])) if generation.rows else 0
+        sizes = {name: os.path.getsize(generation.file(name))
+                 for name in ("vectors.bin", "scales.bin", "index.bin", "texts.bin")}
+        return {
+            "rows": generation.rows,
+            "deleted": deleted,
+            "dtype": generation.dtype,
+            "dim": generation.dim,
+            "generation": self._generation_name,
+            "bytes": sizes,
+            "bytes_per_row": sum(sizes.values()) / generation.rows if generation.rows else 0.0,
+        }
+
+
+STORE = EmbeddingStore()
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """MiniLM embeddings of texts, computed in this process"""
+    import optimizer
+
+    return optimizer.embed_prompts([optimizer.ParsedPrompt(text) for text in texts])
+
+
+def embed(texts: List[str]) -> np.ndarray:
+    """MiniLM embeddings of texts, from the model server when MODEL_SERVER_SOCKET is set"""
+    # With a model server, API workers never load MiniLM themselves
+    import model_server
+
+    if model_server.MODEL_SERVER_SOCKET:
+        return model_server.call(embed_texts, texts)
+    return embed_texts(texts)
+
+
+def similar(prompts: List[str], top_k: int = 10, kind: Optional[str] = None,
+            min_score: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+    """Embed prompts in one call and search the shared store for each"""
+    return STORE.search(embed(prompts), top_k, kind, min_score)
+
+
+class Recorder:
+    """
+    Adds prompts to the store from a background thread
+
+    record() only enqueues, so requests never wait for MiniLM or the disk;
+    the thread embeds whatever has queued (up to RECORD_BATCH_SIZE prompts)
+    in one call. If embedding is unavailable, recording is switched off.
+    """
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self.enabled = EMBEDDING_STORE_ENABLED
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=RECORD_MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def record(self, text: str, kind: str) -> None:
+        if not self.enabled or not text:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((text, kind))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        # Threads do not survive fork(), so each process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=RECORD_MAX_QUEUE)
+                self._thread = threading.Thread(target=self._loop, name="prompt-recorder", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self) -> List[Tuple[str, str]]:
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + RECORD_WAIT_MS / 1000.0
+        while len(items) < RECORD_BATCH_SIZE:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self) -> None:
+        while self.enabled:
+            items = self._collect()
+            try:
+                # Repeated prompts (e.g. result cache hits) are not embedded again
+                fresh = set(self.store.missing([text for text, _ in items]))
+                items = [item for item in items if item[0] in fresh]
+                if not items:
+                    continue
+                vectors = embed([text for text, _ in items])
+                for kind in dict.fromkeys(kind for _, kind in items):
+                    rows = [i for i, (_, k) in enumerate(items) if k == kind]
+                    self.recorded += self.store.add([items[i][0] for i in rows], vectors[rows], kind)
+            except ImportError as e:
+                logging.warning(f"Prompt history disabled, the embedding model is unavailable: {e}")
+                self.enabled = False
+            except Exception:
+                logging.exception("Failed to record prompts")
+
+
+RECORDER = Recorder(STORE)
+
+
+def record(text: str, kind: str) -> None:
+    """Queue a prompt for the history (no-op unless EMBEDDING_STORE_ENABLED=1)"""
+    RECORDER.record(text, kind)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect and maintain the prompt history store")
+    parser.add_argument("--dir", default=EMBEDDING_STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Rows, file sizes and bytes per row")
+    search = commands.add_parser("search", help="Find stored prompts similar to a text")
+    search.add_argument("text")
+    search.add_argument("--top-k", type=int, default=10)
+    search.add_argument("--kind", choices=list(KINDS))
+    commands.add_parser("compact", help="Drop deleted rows and rewrite the store")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    store = EmbeddingStore(args.dir)
+    if args.command == "stats":
+        output = store.stats()
+    elif args.command == "search":
+        output = store.search(embed([args.text]), args.top_k, args.kind)[0]
+    else:
+        output = store.compact()
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import os
+import time
+import heapq
+import queue
+import asyncio
+import functools
+import contextvars
+import logging
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+import batching
+
+# Light NLP work (templating, spaCy, sentence splitting) runs on threads
+NLP_THREADS = int(os.getenv("NLP_THREADS", "4"))
+NLP_MAX_QUEUE = int(os.getenv("NLP_MAX_QUEUE", "64"))
+
+# GPT-2 generation runs on a pool of GENERATION_THREADS threads, whose
+# concurrent calls the micro-batchers merge into padded batches. With
+# GENERATION_PROCESSES > 0 it runs in that many separate processes instead,
+# so it never holds the GIL of the API worker; each process handles one call
+# at a time, so nothing is batched there. Processes are the default only
+# when batching is switched off (GENERATION_BATCH_SIZE=1).
+GENERATION_PROCESSES = int(os.getenv("GENERATION_PROCESSES",
+                                     "0" if batching.GENERATION_BATCH_SIZE > 1 else "1"))
+GENERATION_THREADS = int(os.getenv("GENERATION_THREADS", "8"))
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "16"))
+GENERATION_START_METHOD = os.getenv("GENERATION_START_METHOD", "spawn")
+
+# When set, generation runs in the shared model server listening on this
+# Unix socket (see model_server.py) instead of a local process pool
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "")
+
+# Cost-aware scheduling: a waiting job is ordered as if it arrived
+# cost / PRIORITY_COST_PER_SECOND seconds later, so cheap jobs overtake
+# expensive ones without starving them
+PRIORITY_COST_PER_SECOND = float(os.getenv("PRIORITY_COST_PER_SECOND", "1000"))
+
+# Seconds suggested to clients in the Retry-After header when a queue is full
+QUEUE_RETRY_AFTER = int(os.getenv("QUEUE_RETRY_AFTER", "5"))
+
+
+class QueueFullError(Exception):
+    """Raised when a pool already has as many jobs as it is allowed to queue"""
+
+    def __init__(self, pool_name: str, retry_after: int = QUEUE_RETRY_AFTER):
+        super().__init__(f"The {pool_name} queue is full, please retry later")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedPool:
+    """
+    An executor with a hard cap on running plus queued jobs
+
+    At most max_workers jobs are handed to the executor at a time; the rest
+    wait here and start cheapest-first (see PRIORITY_COST_PER_SECOND), so a
+    short request is not stuck behind a queue of huge ones. The underlying
+    executor is created on first use so importing this module never starts
+    threads or processes.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Executor],
+                 max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.running = 0
+        self._waiting: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = 0
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._factory()
+        return self._executor
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def acquire(self) -> None:
+        """Take a slot, raising QueueFullError if the pool is saturated"""
+        with self._lock:
+            if self.pending >= self.capacity:
+                raise QueueFullError(self.name)
+            self.pending += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    @contextmanager
+    def reserve(self):
+        """Hold one slot of this pool for work that runs outside its executor"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def _start_turn(self, cost: float) -> None:
+        """Wait until one of the max_workers executor slots is ours"""
+        if self.running < self.max_workers and not self._waiting:
+            self.running += 1
+            return
+        turn = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._waiting,
+                       (time.monotonic() + cost / PRIORITY_COST_PER_SECOND, self._sequence, turn))
+        self._wake()
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                # The slot was handed to us just before the cancellation
+                self._end_turn()
+            raise
+
+    def _wake(self) -> None:
+        while self._waiting and self.running < self.max_workers:
+            _, _, turn = heapq.heappop(self._waiting)
+            if not turn.done():
+                self.running += 1
+                turn.set_result(None)
+
+    def _end_turn(self) -> None:
+        self.running -= 1
+        self._wake()
+
+    async def run(self, func: Callable[..., Any], *args, cost: float = 0.0, **kwargs) -> Any:
+        """
+        Run func in the pool, raising QueueFullError when saturated
+
+        cost is the job's estimated size (e.g. prompt tokens); cheaper jobs
+        start first when the pool is busy.
+        """
+        self.acquire()
+        return await self.run_acquired(func, *args, cost=cost, **kwargs)
+
+    async def run_acquired(self, func: Callable[..., Any], *args, cost: float = 0.0, **kwargs) -> Any:
+        """
+        Like run(), for a caller that already took a slot with acquire()
+
+        The slot is released when func returns. A caller cancelled while func
+        runs stops waiting, but func cannot be interrupted, so its slot stays
+        taken until it actually ends and the pool keeps refusing new work.
+        """
+        try:
+            await self._start_turn(cost)
+        except BaseException:
+            self.release()
+            raise
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(func, *args, **kwargs)
+            if isinstance(self.executor, ThreadPoolExecutor):
+                # Carry context variables (e.g. per-request stage timings) into the thread
+                call = functools.partial(contextvars.copy_context().run, call)
+            future = loop.run_in_executor(self.executor, call)
+        except BaseException:
+            self._end_turn()
+            self.release()
+            raise
+        future.add_done_callback(self._finished)
+        return await asyncio.shield(future)
+
+    def _finished(self, future: asyncio.Future) -> None:
+        # Nobody may be left to retrieve the error of an abandoned call
+        if not future.cancelled():
+            future.exception()
+        self._end_turn()
+        self.release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _make_light_executor() -> Executor:
+    return ThreadPoolExecutor(max_workers=NLP_THREADS, thread_name_prefix="nlp")
+
+
+def _make_heavy_executor() -> Executor:
+    if MODEL_SERVER_SOCKET:
+        return ThreadPoolExecutor(max_workers=GENERATION_THREADS, thread_name_prefix="model-client")
+    if GENERATION_PROCESSES <= 0:
+        return ThreadPoolExecutor(max_workers=GENERATION_THREADS, thread_name_prefix="generation")
+    logging.info(f"Starting {GENERATION_PROCESSES} generation worker process(es)")
+    return ProcessPoolExecutor(
+        max_workers=GENERATION_PROCESSES,
+        mp_context=multiprocessing.get_context(GENERATION_START_METHOD),
+    )
+
+
+LIGHT_POOL = BoundedPool("nlp", _make_light_executor, NLP_THREADS, NLP_MAX_QUEUE)
+HEAVY_POOL = BoundedPool("generation", _make_heavy_executor,
+                         GENERATION_PROCESSES if GENERATION_PROCESSES > 0 and not MODEL_SERVER_SOCKET
+                         else GENERATION_THREADS,
+                         GENERATION_MAX_QUEUE)
+
+
+async def run_light(func: Callable[..., Any], *args, cost: float = 0.0, **kwargs) -> Any:
+    """Run light, CPU-bound NLP work off the event loop"""
+    return await LIGHT_POOL.run(func, *args, cost=cost, **kwargs)
+
+
+async def run_heavy(func: Callable[..., Any], *args, cost: float = 0.0, **kwargs) -> Any:
+    """Run model generation in the generation process pool (or the model server)"""
+    if MODEL_SERVER_SOCKET:
+        import model_server
+        return await HEAVY_POOL.run(model_server.call, func, *args, cost=cost, **kwargs)
+    return await HEAVY_POOL.run(func, *args, cost=cost, **kwargs)
+
+
+# Carries streamed items out of the generation processes (started on first use)
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def _stream_channel() -> Tuple[Any, Any]:
+    """A queue and a stop event shared with wherever run_heavy runs its work"""
+    global _MANAGER
+    if GENERATION_PROCESSES > 0 and not MODEL_SERVER_SOCKET:
+        with _MANAGER_LOCK:
+            if _MANAGER is None:
+                _MANAGER = multiprocessing.get_context(GENERATION_START_METHOD).Manager()
+        return _MANAGER.Queue(), _MANAGER.Event()
+    return queue.Queue(), threading.Event()
+
+
+def _pump(func: Callable[..., Any], args: tuple, kwargs: dict, channel: Any, stop_event: Any) -> None:
+    """Put ("item", x) for everything func yields on channel, then ("done", None) or ("error", e)"""
+    try:
+        # func ends on its own once stop_event is set (and may set it itself when done)
+        if not stop_event.is_set():
+            for item in func(*args, stop_event=stop_event, **kwargs):
+                channel.put(("item", item))
+        channel.put(("done", None))
+    except Exception as e:
+        channel.put(("error", e))
+
+
+def stream_heavy(func: Callable[..., Any], *args, cost: float = 0.0, **kwargs) -> AsyncIterator[Any]:
+    """
+    Run a generator function on the generation backend, yielding its items
+
+    The work runs where run_heavy would run it (generation process, model
+    server or generation thread) and holds one slot of the generation pool
+    while it streams. func must accept a stop_event keyword, which is set
+    once the consumer stops iterating so that generation ends early.
+
+    Raises:
+        QueueFullError: At once, before anything streams, if the pool is saturated
+    """
+    HEAVY_POOL.acquire()
+    return _stream(func, args, kwargs, cost)
+
+
+async def _stream(func: Callable[..., Any], args: tuple, kwargs: dict, cost: float) -> AsyncIterator[Any]:
+    try:
+        channel, stop_event = _stream_channel()
+    except BaseException:
+        HEAVY_POOL.release()
+        raise
+    if MODEL_SERVER_SOCKET:
+        import model_server
+        func = functools.partial(model_server.stream, func)
+    task = asyncio.ensure_future(
+        HEAVY_POOL.run_acquired(_pump, func, args, kwargs, channel, stop_event, cost=cost))
+
+    def failed(task: asyncio.Future) -> None:
+        # e.g. a crashed generation process: _pump never sent its end marker
+        if not task.cancelled() and task.exception() is not None:
+            channel.put(("error", task.exception()))
+
+    task.add_done_callback(failed)
+    try:
+        while True:
+            kind, value = await asyncio.to_thread(channel.get)
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        # The pump stops after its current item and then releases the slot
+        stop_event.set()
+
+
+def shutdown() -> None:
+    """Stop both pools without waiting for queued work"""
+    global _MANAGER
+    LIGHT_POOL.shutdown()
+    HEAVY_POOL.shutdown()
+    if _MANAGER is not None:
+        _MANAGER.shutdown()
+        _MANAGER = None
@@ -0,0 +1,120 @@
+"""
+Slim API worker for the rule-only optimization levels
+
+Serves /api/optimize and /api/optimize/batch for the minimal and fast
+levels (see rules.py) without importing torch, transformers,
+sentence-transformers, NLTK or spaCy. A worker starts in well under a
+second, stays at a few tens of MB and answers in a fraction of a
+millisecond, so many of them fit on the cores a single model worker would
+take. Route rule-only traffic here and everything else to the full API.
+
+Usage:
+    python fast_server.py --workers 4 --port 8001
+"""
+import sys
+import logging
+import argparse
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+import admission
+import metrics
+import rules
+from api_common import (OptimizeRequest, BatchOptimizeRequest, batch_results, check_batch_size,
+                        count_request, prompt_too_long_error)
+
+# Modules that must never be imported by a fast worker
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "spacy", "nltk")
+
+app = FastAPI(title="AI Prompt Optimizer (rule-only levels)")
+
+
+class FastOptimizeRequest(OptimizeRequest):
+    # This worker serves only the rule levels, so it defaults to fast
+    optimization_level: str = "fast"
+
+
+class FastBatchOptimizeRequest(BatchOptimizeRequest):
+    items: List[FastOptimizeRequest]
+
+
+def heavy_modules_loaded() -> List[str]:
+    """The HEAVY_MODULES that have been imported into this process"""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def check_level(optimization_level: str) -> None:
+    if optimization_level not in rules.RULE_LEVELS:
+        raise HTTPException(status_code=400,
+                            detail=f"Optimization level {optimization_level!r} needs the full API, "
+                                   f"this worker serves {', '.join(rules.RULE_LEVELS)}")
+
+
+@app.on_event("startup")
+async def check_imports():
+    """Warn if something pulled a model library into the worker"""
+    loaded = heavy_modules_loaded()
+    if loaded:
+        logging.warning(f"Fast worker has imported {', '.join(loaded)}")
+
+
+@app.post("/api/optimize")
+async def optimize_prompt(request: FastOptimizeRequest):
+    """Optimize a prompt at the minimal or fast level"""
+    count_request("optimize", request.optimization_level, request.target_model)
+    check_level(request.optimization_level)
+    try:
+        # Regexes only, so the work runs on the event loop
+        optimized_prompt = rules.optimize_prompt(request.prompt, request.target_model,
+                                                 request.optimization_level)
+        return {"status": "success", "optimized_prompt": optimized_prompt}
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except Exception as e:
+        logging.error(f"Error optimizing prompt: {e}")
+        raise HTTPException(status_code=500, detail=f"Error optimizing prompt: {e}")
+
+
+@app.post("/api/optimize/batch")
+async def optimize_prompt_batch(request: FastBatchOptimizeRequest):
+    """Optimize many prompts at the minimal or fast level"""
+    check_batch_size(request.items)
+    for item in request.items:
+        count_request("optimize_batch", item.optimization_level, item.target_model)
+        check_level(item.optimization_level)
+    results = rules.optimize_prompts([item.dict() for item in request.items])
+    return {"status": "success", "results": batch_results(results, "optimized_prompt")}
+
+
+@app.get("/health")
+async def health():
+    """Liveness, and proof that no model library has been imported"""
+    return {"status": "ok", "levels": list(rules.RULE_LEVELS), "heavy_modules": heavy_modules_loaded()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latencies and request counters for Prometheus"""
+    return PlainTextResponse(metrics.render(metrics.REGISTRY), media_type="text/plain; version=0.0.4")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the rule-only optimization levels")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    import uvicorn
+    # No models to share, so plain uvicorn worker processes are enough
+    uvicorn.run("fast_server:app", host=args.host, port=args.port,
+                workers=args.workers, log_level=args.log_level)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
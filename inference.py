@@ -0,0 +1,208 @@
+"""
+CPU inference settings shared by optimizer.py and models.py
+
+INFERENCE_BACKEND selects how model weights are run:
+    default  fp32 weights, as loaded by transformers/sentence-transformers
+    int8     dynamic int8 quantization of every linear layer (weights are
+             quantized once at load time, activations on the fly)
+    onnx     int8 for generation models, ONNX Runtime for MiniLM embeddings
+
+Run `python inference.py` to compare the backends on this machine.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import platform
+import contextlib
+from typing import Any, Dict, List, Optional
+
+import admission
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "default").lower()
+# 0 keeps torch's defaults
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+
+BACKENDS = ("default", "int8", "onnx")
+
+_threads_configured = False
+
+
+def configure_threads() -> None:
+    """Apply TORCH_THREADS / TORCH_INTEROP_THREADS once per process"""
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+    if not (TORCH_THREADS or TORCH_INTEROP_THREADS):
+        return
+    import torch
+    if TORCH_THREADS:
+        torch.set_num_threads(TORCH_THREADS)
+    if TORCH_INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+        except RuntimeError as e:
+            # Only allowed before the first parallel torch op in the process
+            logging.warning(f"Could not set inter-op threads: {e}")
+    logging.info(f"torch threads: intra-op {torch.get_num_threads()}, "
+                 f"inter-op {torch.get_num_interop_threads()}")
+
+
+def inference_mode():
+    """torch.inference_mode() if torch is importable, else a no-op context"""
+    try:
+        import torch
+    except ImportError:
+        return contextlib.nullcontext()
+    return torch.inference_mode()
+
+
+def _conv1d_to_linear(model: Any) -> None:
+    """Swap GPT-2 style Conv1D layers for nn.Linear so they can be quantized"""
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for name, module in list(model.named_children()):
+        if isinstance(module, Conv1D):
+            in_features, out_features = module.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.weight.data = module.weight.data.t().contiguous()
+            linear.bias.data = module.bias.data
+            setattr(model, name, linear)
+        else:
+            _conv1d_to_linear(module)
+
+
+def quantize(model: Any, backend: str = INFERENCE_BACKEND) -> Any:
+    """Return model prepared for CPU inference under the given backend"""
+    model.eval()
+    if backend not in ("int8", "onnx"):
+        return model
+    import torch
+    _conv1d_to_linear(model)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_pipeline(text_pipeline: Any, backend: str = INFERENCE_BACKEND) -> Any:
+    """Quantize the model inside a transformers pipeline in place"""
+    configure_threads()
+    text_pipeline.model = quantize(text_pipeline.model, backend)
+    return text_pipeline
+
+
+def load_sentence_transformer(name: str, backend: str = INFERENCE_BACKEND) -> Any:
+    """Load a SentenceTransformer under the given backend"""
+    configure_threads()
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(name, backend="onnx")
+        except Exception as e:
+            logging.warning(f"ONNX export of {name} failed, using int8 PyTorch instead: {e}")
+            backend = "int8"
+    model = SentenceTransformer(name)
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+# Prompts used by compare_backends
+SAMPLE_PROMPTS = [
+    "Write a blog post about healthy eating for busy professionals.",
+    "Explain how gradient descent works in machine learning, step by step.",
+    "Create a marketing plan for a new fitness app targeting people aged 25-40.",
+    "Summarize the key differences between TCP and UDP.",
+    "Draft a polite email asking a client for overdue payment.",
+    "You are a data science tutor. Teach me about cross-validation with examples.",
+]
+
+
+def cpu_model() -> str:
+    """The CPU's model name, recorded with every backend report"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _timed(func, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats
+
+
+def compare_backends(backends: Optional[List[str]] = None, repeats: int = 3) -> Dict[str, Any]:
+    """
+    Measure latency and agreement with fp32 for each backend
+
+    Embedding accuracy is the mean cosine similarity to the fp32 embeddings;
+    generation accuracy is the share of greedy next tokens that match fp32
+    over the sample prompts, plus the change in mean loss on them. Generation
+    is timed for GENERATION_MAX_NEW_TOKENS new tokens, as the optimizer runs it.
+    """
+    import numpy as np
+    import torch
+    from transformers import pipeline
+
+    backends = list(backends or BACKENDS)
+    # The first backend is the reference, so fp32 goes first when present
+    if "default" in backends:
+        backends.remove("default")
+        backends.insert(0, "default")
+    report: Dict[str, Any] = {}
+    reference_embeddings = None
+    reference_tokens = None
+    reference_loss = None
+
+    for backend in backends:
+        entry: Dict[str, Any] = {}
+
+        embedder = load_sentence_transformer("all-MiniLM-L6-v2", backend)
+        embeddings = embedder.encode(SAMPLE_PROMPTS, convert_to_numpy=True, normalize_embeddings=True)
+        entry["embed_seconds_per_batch"] = _timed(
+            lambda: embedder.encode(SAMPLE_PROMPTS, convert_to_numpy=True), repeats)
+        if reference_embeddings is None:
+            reference_embeddings = embeddings
+        entry["embedding_cosine_vs_fp32"] = float(np.mean(np.sum(embeddings * reference_embeddings, axis=1)))
+
+        generator = prepare_pipeline(pipeline("text-generation", model="gpt2"), backend)
+        tokenizer, model = generator.tokenizer, generator.model
+        tokens, losses = [], []
+        with inference_mode():
+            for prompt in SAMPLE_PROMPTS:
+                ids = tokenizer(prompt, return_tensors="pt").input_ids
+                out = model(ids, labels=ids)
+                tokens.append(out.logits[0].argmax(-1))
+                losses.append(float(out.loss))
+            entry["generate_seconds_per_prompt"] = _timed(
+                lambda: generator(SAMPLE_PROMPTS[0], max_new_tokens=admission.GENERATION_MAX_NEW_TOKENS,
+                                  do_sample=False, pad_token_id=tokenizer.eos_token_id), repeats)
+        if reference_tokens is None:
+            reference_tokens, reference_loss = tokens, float(np.mean(losses))
+        matches = [float((a == b).float().mean()) for a, b in zip(tokens, reference_tokens)]
+        entry["next_token_agreement_vs_fp32"] = float(np.mean(matches))
+        entry["mean_loss_delta_vs_fp32"] = float(np.mean(losses)) - reference_loss
+        entry["torch_threads"] = torch.get_num_threads()
+        entry["cpu"] = cpu_model()
+        report[backend] = entry
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends")
+    parser.add_argument("--backends", nargs="*", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(json.dumps(compare_backends(args.backends, args.repeats), indent=2))
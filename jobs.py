@@ -0,0 +1,572 @@
+"""
+Persistent optimization jobs
+
+A job is a list of prompts to optimize that outlives the HTTP request that
+submitted it. Jobs live in a local SQLite database (JOBS_DB) and are run by
+worker processes that each load the optimizer models once, then claim
+batches of items, highest priority first. Every batch is committed as soon
+as it finishes, so a crashed worker only loses the batch it held: its lease
+expires and the items are claimed again. Failed rewrites are retried with
+exponential backoff.
+
+Usage:
+    python jobs.py worker --workers 4
+    python jobs.py submit prompts.jsonl --level maximum --priority high
+    python jobs.py status [JOB_ID]
+    python jobs.py results JOB_ID results.ndjson
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+JOBS_DB = os.getenv("JOBS_DB", ".cache/jobs.sqlite3")
+# Worker processes started together with the API (0 = run `python jobs.py worker`)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))
+# Items a worker claims and optimizes together (and commits as one checkpoint)
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "8"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# First retry delay in seconds, doubled on every further attempt
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "300"))
+# Seconds a claimed batch may take before another worker may take it over
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+MAX_JOB_ITEMS = int(os.getenv("MAX_JOB_ITEMS", "100000"))
+
+PRIORITIES = {"low": 0, "normal": 1, "high": 2}
+OPTIMIZATION_LEVELS = ("minimal", "fast", "balanced", "maximum")
+# Models each worker loads before claiming work
+WORKER_PRELOAD = ["punkt", "generator", "embedding_model"]
+# Rows per page when reading results back
+RESULTS_PAGE_SIZE = 1000
+# Items inserted per transaction while a job is submitted
+SUBMIT_CHUNK_ITEMS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    record_id TEXT,
+    prompt TEXT NOT NULL,
+    target_model TEXT NOT NULL,
+    optimization_level TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- queued: earliest next attempt; running: lease expiry
+    available REAL NOT NULL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_queue ON items (status, priority DESC);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL,
+    batches INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    retried INTEGER NOT NULL DEFAULT 0,
+    busy_seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+# (rowid, job id, prompt, target model, optimization level, attempts)
+ClaimedItem = Tuple[int, str, str, str, str, int]
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before the next attempt of an item that failed attempts times"""
+    delay = min(JOB_RETRY_BACKOFF * 2 ** (attempts - 1), JOB_RETRY_BACKOFF_MAX)
+    # Jitter keeps items that failed together from retrying together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def is_retryable(error: Exception) -> bool:
+    # Bad input (e.g. a prompt over the size limit) fails the same way every time
+    return not isinstance(error, ValueError)
+
+
+@contextmanager
+def _immediate(db: sqlite3.Connection):
+    """A write transaction that takes the database lock up front"""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+def _finish_jobs(db: sqlite3.Connection, job_ids: Iterable[str], now: float) -> None:
+    for job_id in job_ids:
+        db.execute("UPDATE jobs SET status = 'completed', finished = ?"
+                   " WHERE id = ? AND status = 'running' AND done + failed = total", (now, job_id))
+
+
+class JobStore:
+    """The SQLite job queue, shared by the API and the worker processes"""
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Transactions are opened explicitly so claims can take the write lock up front
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30,
+                                       isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def submit(self, items: Iterable[Dict[str, Any]], priority: str = "normal") -> Dict[str, Any]:
+        """
+        Queue a job
+
+        Items are inserted SUBMIT_CHUNK_ITEMS at a time, so a generator is
+        never read into memory as a whole.
+
+        Args:
+            items: Dicts with "prompt", "target_model", "optimization_level"
+                and an optional "id" echoed back with the result
+            priority: low, normal or high
+
+        Returns:
+            {"job_id": ..., "total": number of items}
+
+        Raises:
+            ValueError: On an unknown priority or level, an empty job or one
+                over MAX_JOB_ITEMS
+        """
+        job_id = self.open_job(priority)
+        try:
+            total, chunk = 0, []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == SUBMIT_CHUNK_ITEMS:
+                    total = self.add_items(job_id, chunk, total)
+                    chunk = []
+            total = self.add_items(job_id, chunk, total)
+            return self.close_job(job_id)
+        except BaseException:
+            self.drop_job(job_id)
+            raise
+
+    def open_job(self, priority: str = "normal") -> str:
+        """
+        Start a job whose items are added with add_items; nothing is claimed
+        from it until close_job
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, use one of {', '.join(PRIORITIES)}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                db.execute("INSERT INTO jobs (id, priority, status, total, created) VALUES (?, ?, ?, ?, ?)",
+                           (job_id, PRIORITIES[priority], "receiving", 0, time.time()))
+        return job_id
+
+    def add_items(self, job_id: str, items: List[Dict[str, Any]], start: int) -> int:
+        """Insert the items numbered from start, returning the next index"""
+        rows = []
+        for idx, item in enumerate(items, start):
+            if idx >= MAX_JOB_ITEMS:
+                raise ValueError(f"Job has more than {MAX_JOB_ITEMS} items")
+            level = item.get("optimization_level", "maximum")
+            if level not in OPTIMIZATION_LEVELS:
+                raise ValueError(f"Item {idx}: unknown optimization level {level!r}")
+            rows.append((job_id, idx, json.dumps(item.get("id")), item["prompt"],
+                         item.get("target_model", "default"), level, "receiving", 0))
+        if rows:
+            with self._lock:
+                db = self._connect()
+                with _immediate(db):
+                    db.executemany(
+                        "INSERT INTO items (job_id, idx, record_id, prompt, target_model, optimization_level,"
+                        " priority, status, available)"
+                        " SELECT ?, ?, ?, ?, ?, ?, priority, ?, ? FROM jobs WHERE id = ? AND status = 'receiving'",
+                        [row + (job_id,) for row in rows])
+        return start + len(rows)
+
+    def close_job(self, job_id: str) -> Dict[str, Any]:
+        """Queue the items added to an open job"""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                total = db.execute("SELECT COUNT(*) FROM items WHERE job_id = ?", (job_id,)).fetchone()[0]
+                if not total:
+                    raise ValueError("Job has no items")
+                # A job cancelled while its items came in stays cancelled
+                db.execute("UPDATE items SET status = 'queued', available = ?"
+                           " WHERE job_id = ? AND status = 'receiving'", (now, job_id))
+                db.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'receiving'", (job_id,))
+                db.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+        return {"job_id": job_id, "total": total}
+
+    def drop_job(self, job_id: str) -> None:
+        """Delete a job that was never closed, with the items added so far"""
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                if db.execute("DELETE FROM jobs WHERE id = ? AND status IN ('receiving', 'cancelled')",
+                              (job_id,)).rowcount:
+                    db.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """Progress of a job, raising KeyError if it doesn't exist"""
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT priority, status, total, done, failed, retries, created, started,"
+                             " finished FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(job_id)
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status",
+                                     (job_id,)).fetchall())
+        priority, status, total, done, failed, retries, created, started, finished = row
+        elapsed = ((finished or time.time()) - started) if started else 0.0
+        throughput = done / elapsed if elapsed > 0 else 0.0
+        remaining = counts.get("queued", 0) + counts.get("running", 0)
+        return {
+            "job_id": job_id,
+            "status": status,
+            "priority": {rank: name for name, rank in PRIORITIES.items()}.get(priority, priority),
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "retries": retries,
+            "progress": (done + failed) / total if total else 1.0,
+            "created": created,
+            "started": started,
+            "finished": finished,
+            "items_per_second": throughput,
+            "eta_seconds": remaining / throughput if throughput and remaining else None,
+        }
+
+    def results(self, job_id: str, after: int = -1) -> Iterator[Dict[str, Any]]:
+        """Yield a job's finished items in input order, one page of rows at a time"""
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT idx, record_id, status, attempts, result, error FROM items"
+                    " WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+                    (job_id, after, RESULTS_PAGE_SIZE)).fetchall()
+            for idx, record_id, status, attempts, result, error in rows:
+                if status not in ("done", "failed"):
+                    continue
+                output = {"index": idx, "id": json.loads(record_id), "status": status,
+                          "attempts": attempts}
+                if status == "done":
+                    output["optimized_prompt"] = result
+                else:
+                    output["detail"] = error
+                yield output
+            if len(rows) < RESULTS_PAGE_SIZE:
+                return
+            after = rows[-1][0]
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Drop a job's queued items; items already running still finish"""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                if db.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is None:
+                    raise KeyError(job_id)
+                db.execute("UPDATE items SET status = 'cancelled' WHERE job_id = ?"
+                           " AND status IN ('receiving', 'queued')",
+                           (job_id,))
+                db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?"
+                           " AND status NOT IN ('completed', 'cancelled')", (now, job_id))
+        return self.status(job_id)
+
+    def register_worker(self, name: str) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO workers (name, pid, started, heartbeat) VALUES (?, ?, ?, ?)",
+                       (name, os.getpid(), now, now))
+
+    def claim(self, worker: str, limit: int = JOB_BATCH_SIZE,
+              lease: float = JOB_LEASE_SECONDS) -> List[ClaimedItem]:
+        """
+        Take up to limit items for worker, highest priority and oldest first
+
+        Items whose lease expired (their worker died or hung) are put back
+        in the queue first, or failed once they used up JOB_MAX_ATTEMPTS, so
+        an item that crashes its worker cannot crash them all. Each claim
+        counts as an attempt.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                expired = db.execute("SELECT rowid, job_id, attempts FROM items"
+                                     " WHERE status = 'running' AND available <= ?", (now,)).fetchall()
+                for rowid, job_id, attempts in expired:
+                    if attempts < JOB_MAX_ATTEMPTS:
+                        db.execute("UPDATE items SET status = 'queued' WHERE rowid = ?", (rowid,))
+                        continue
+                    db.execute("UPDATE items SET status = 'failed', error = ? WHERE rowid = ?",
+                               (f"Worker lease expired on all {attempts} attempts", rowid))
+                    db.execute("UPDATE jobs SET failed = failed + 1 WHERE id = ?", (job_id,))
+                _finish_jobs(db, {row[1] for row in expired}, now)
+                rows = db.execute(
+                    "SELECT rowid, job_id, prompt, target_model, optimization_level, attempts FROM items"
+                    " WHERE status = 'queued' AND available <= ? ORDER BY priority DESC, rowid LIMIT ?",
+                    (now, limit)).fetchall()
+                db.executemany(
+                    "UPDATE items SET status = 'running', attempts = attempts + 1, worker = ?,"
+                    " available = ? WHERE rowid = ?",
+                    [(worker, now + lease, row[0]) for row in rows])
+                for job_id in {row[1] for row in rows}:
+                    db.execute("UPDATE jobs SET status = 'running', started = COALESCE(started, ?)"
+                               " WHERE id = ? AND status = 'queued'", (now, job_id))
+                db.execute("UPDATE workers SET heartbeat = ? WHERE name = ?", (now, worker))
+        return [row[:5] + (row[5] + 1,) for row in rows]
+
+    def complete(self, worker: str, claimed: List[ClaimedItem], results: List[Any],
+                 busy_seconds: float) -> Dict[str, int]:
+        """
+        Checkpoint a finished batch: store results, schedule retries, fail the rest
+
+        Items this worker no longer holds (its lease expired and another
+        worker took them, or the job was cancelled) are left alone.
+
+        Returns:
+            Counts of items marked done, failed and retried
+        """
+        now = time.time()
+        counts = {"done": 0, "failed": 0, "retried": 0}
+        per_job: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            db = self._connect()
+            with _immediate(db):
+                for (rowid, job_id, _, _, _, attempts), result in zip(claimed, results):
+                    if not isinstance(result, Exception):
+                        outcome = "done"
+                        cursor = db.execute(
+                            "UPDATE items SET status = 'done', result = ?, error = NULL"
+                            " WHERE rowid = ? AND status = 'running' AND worker = ?",
+                            (result, rowid, worker))
+                    elif is_retryable(result) and attempts < JOB_MAX_ATTEMPTS:
+                        outcome = "retried"
+                        cursor = db.execute(
+                            "UPDATE items SET status = 'queued', available = ?, error = ?"
+                            " WHERE rowid = ? AND status = 'running' AND worker = ?",
+                            (now + retry_delay(attempts), str(result), rowid, worker))
+                    else:
+                        outcome = "failed"
+                        cursor = db.execute(
+                            "UPDATE items SET status = 'failed', error = ?"
+                            " WHERE rowid = ? AND status = 'running' AND worker = ?",
+                            (str(result), rowid, worker))
+                    if cursor.rowcount:
+                        counts[outcome] += 1
+                        job = per_job.setdefault(job_id, {"done": 0, "failed": 0, "retried": 0})
+                        job[outcome] += 1
+                for job_id, job in per_job.items():
+                    db.execute("UPDATE jobs SET done = done + ?, failed = failed + ?, retries = retries + ?"
+                               " WHERE id = ?", (job["done"], job["failed"], job["retried"], job_id))
+                _finish_jobs(db, per_job, now)
+                db.execute("UPDATE workers SET heartbeat = ?, batches = batches + 1, done = done + ?,"
+                           " failed = failed + ?, retried = retried + ?, busy_seconds = busy_seconds + ?"
+                           " WHERE name = ?",
+                           (now, counts["done"], counts["failed"], counts["retried"], busy_seconds, worker))
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth per priority and throughput per worker"""
+        now = time.time()
+        names = {rank: name for name, rank in PRIORITIES.items()}
+        with self._lock:
+            db = self._connect()
+            queued = db.execute("SELECT priority, COUNT(*) FROM items WHERE status = 'queued'"
+                                " GROUP BY priority").fetchall()
+            running = db.execute("SELECT COUNT(*) FROM items WHERE status = 'running'").fetchone()[0]
+            jobs = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = db.execute("SELECT name, pid, started, heartbeat, batches, done, failed, retried,"
+                                 " busy_seconds FROM workers ORDER BY name").fetchall()
+        return {
+            "jobs": jobs,
+            "queued": {names.get(priority, priority): count for priority, count in queued},
+            "running": running,
+            "workers": [{
+                "name": name,
+                "pid": pid,
+                # A worker heartbeats at least once per poll or batch
+                "alive": now - heartbeat < max(JOB_LEASE_SECONDS, 10 * JOB_POLL_INTERVAL),
+                "batches": batches,
+                "done": done,
+                "failed": failed,
+                "retried": retried,
+                "busy_seconds": busy_seconds,
+                # Items per second while optimizing, and over the worker's lifetime
+                "items_per_busy_second": done / busy_seconds if busy_seconds else 0.0,
+                "items_per_second": done / (heartbeat - started) if heartbeat > started else 0.0,
+                "utilization": busy_seconds / (heartbeat - started) if heartbeat > started else 0.0,
+            } for name, pid, started, heartbeat, batches, done, failed, retried, busy_seconds in workers],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+STORE = JobStore()
+
+
+def run_worker(path: str = JOBS_DB, stop_event=None, name: Optional[str] = None) -> None:
+    """
+    Process queued items until stop_event is set
+
+    The optimizer models are loaded once, before the first claim.
+    """
+    import optimizer
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    store = JobStore(path)
+    store.register_worker(name)
+    optimizer.warm_up(WORKER_PRELOAD)
+    logging.info(f"Job worker {name} ready")
+    while stop_event is None or not stop_event.is_set():
+        claimed = store.claim(name)
+        if not claimed:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        started = time.perf_counter()
+        requests = [{"prompt": prompt, "target_model": target_model, "optimization_level": level}
+                    for _, _, prompt, target_model, level, _ in claimed]
+        try:
+            results = optimizer.optimize_prompts(requests)
+        except Exception as e:
+            logging.exception(f"Job worker {name} failed a batch")
+            results = [e] * len(claimed)
+        counts = store.complete(name, claimed, results, time.perf_counter() - started)
+        logging.info(f"Job worker {name}: {counts['done']} done, {counts['failed']} failed, "
+                     f"{counts['retried']} to retry in {time.perf_counter() - started:.1f}s")
+    store.close()
+
+
+_WORKERS: List[multiprocessing.Process] = []
+_STOP = None
+
+
+def start_workers(count: int = JOB_WORKERS, path: str = JOBS_DB) -> None:
+    """Start count worker processes for this process's lifetime"""
+    global _STOP
+    if count <= 0 or _WORKERS:
+        return
+    context = multiprocessing.get_context("spawn")
+    _STOP = context.Event()
+    for _ in range(count):
+        process = context.Process(target=run_worker, args=(path, _STOP), daemon=True)
+        process.start()
+        _WORKERS.append(process)
+    logging.info(f"Started {count} job worker process(es)")
+
+
+def stop_workers(timeout: float = 30.0) -> None:
+    """Let workers finish their current batch, then stop them"""
+    if _STOP is not None:
+        _STOP.set()
+    deadline = time.monotonic() + timeout
+    for process in _WORKERS:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            # Its lease expires and another worker redoes the batch
+            process.terminate()
+    _WORKERS.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Persistent prompt optimization jobs")
+    parser.add_argument("--db", default=JOBS_DB, help="SQLite job database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Run worker processes until interrupted")
+    worker.add_argument("--workers", type=int, default=1)
+    submit = commands.add_parser("submit", help="Queue a JSONL file of prompts as one job")
+    submit.add_argument("input")
+    submit.add_argument("--target-model", default="default")
+    submit.add_argument("--level", default="maximum", choices=list(OPTIMIZATION_LEVELS))
+    submit.add_argument("--priority", default="normal", choices=list(PRIORITIES))
+    status = commands.add_parser("status", help="Show a job, or the queue and workers")
+    status.add_argument("job_id", nargs="?")
+    results = commands.add_parser("results", help="Write a job's results as NDJSON")
+    results.add_argument("job_id")
+    results.add_argument("output", nargs="?", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = JobStore(args.db)
+
+    if args.command == "worker":
+        start_workers(args.workers, args.db)
+        try:
+            for process in _WORKERS:
+                process.join()
+        except KeyboardInterrupt:
+            stop_workers()
+    elif args.command == "submit":
+        import bulk
+
+        def records():
+            with open(args.input, "rb") as f:
+                for _, _, line in bulk.iter_lines(f):
+                    record_id, request = bulk.parse_record(line, args.target_model, args.level)
+                    yield dict(request, id=record_id)
+
+        print(json.dumps(store.submit(records(), args.priority)))
+    elif args.command == "status":
+        info = store.status(args.job_id) if args.job_id else store.stats()
+        print(json.dumps(info, indent=2))
+    else:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for output in store.results(args.job_id):
+                out.write(json.dumps(output, ensure_ascii=False) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+KEYWORDS_PATH = os.getenv("KEYWORDS_PATH", "data/keywords.json")
+
+# Words, keeping contractions such as "don't" together
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for both terms and searched text"""
+    return TOKEN_RE.findall(text.lower())
+
+
+class KeywordMatcher:
+    """
+    Word-boundary-correct multi-term matcher
+
+    Every term is stored as a tuple of lowercase word tokens in a hash table,
+    so a search is one pass over the text's words with one lookup per
+    candidate n-gram, regardless of how many terms are registered.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self._table: Dict[str, Set[str]] = {}
+        self._multiword_starts: Set[str] = set()
+        self.max_words = 1
+        for group, terms in groups.items():
+            for term in terms:
+                tokens = tokenize(term)
+                if not tokens:
+                    continue
+                self._table.setdefault(" ".join(tokens), set()).add(group)
+                if len(tokens) > 1:
+                    self._multiword_starts.add(tokens[0])
+                    self.max_words = max(self.max_words, len(tokens))
+
+    def match(self, text: str) -> Set[str]:
+        """Return the names of every group with at least one term in text"""
+        tokens = tokenize(text)
+        hits: Set[str] = set()
+        table = self._table
+        for i, token in enumerate(tokens):
+            groups = table.get(token)
+            if groups:
+                hits |= groups
+            if token in self._multiword_starts:
+                for n in range(2, min(self.max_words, len(tokens) - i) + 1):
+                    groups = table.get(" ".join(tokens[i:i + n]))
+                    if groups:
+                        hits |= groups
+        return hits
+
+
+class Vocabulary:
+    """Domain and evaluation keyword lists compiled into one matcher"""
+
+    def __init__(self, data: Dict):
+        self.domains: List[str] = list(data.get("domains", []))
+        self.fallback_domains: Dict[str, List[str]] = dict(data.get("fallback_domains", {}))
+        self.default_domain: str = data.get("default_domain", "AI assistant")
+        self.evaluation: Dict[str, List[str]] = dict(data.get("evaluation", {}))
+
+        groups: Dict[str, List[str]] = {}
+        for domain in self.domains:
+            groups[f"domain:{domain}"] = [domain]
+        for domain, words in self.fallback_domains.items():
+            groups[f"fallback:{domain}"] = words
+        for criterion, words in self.evaluation.items():
+            groups[f"eval:{criterion}"] = words
+        self.matcher = KeywordMatcher(groups)
+
+    def domain(self, text: str, hits: Optional[Set[str]] = None) -> str:
+        """Pick the first listed domain found in text, then the fallbacks"""
+        hits = self.matcher.match(text) if hits is None else hits
+        for domain in self.domains:
+            if f"domain:{domain}" in hits:
+                return domain
+        for domain in self.fallback_domains:
+            if f"fallback:{domain}" in hits:
+                return domain
+        return self.default_domain
+
+    def has(self, hits: Set[str], criterion: str) -> bool:
+        """Whether an evaluation keyword group was hit"""
+        return f"eval:{criterion}" in hits
+
+
+_VOCABULARY: Optional[Vocabulary] = None
+_VOCABULARY_STATE = None
+_VOCABULARY_LOCK = threading.Lock()
+
+
+def get_vocabulary(path: str = KEYWORDS_PATH) -> Vocabulary:
+    """Return the compiled vocabulary, recompiling it when the file changes"""
+    global _VOCABULARY, _VOCABULARY_STATE
+    stat = os.stat(path)
+    state = (path, stat.st_mtime_ns, stat.st_size)
+    if _VOCABULARY is not None and state == _VOCABULARY_STATE:
+        return _VOCABULARY
+    with _VOCABULARY_LOCK:
+        if _VOCABULARY is None or state != _VOCABULARY_STATE:
+            with open(path, "r", encoding="utf-8") as f:
+                _VOCABULARY = Vocabulary(json.load(f))
+            _VOCABULARY_STATE = state
+    return _VOCABULARY
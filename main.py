@@ -1,22 +1,83 @@
 from fastapi import FastAPI, Request, Form, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Union
 import logging
 
 import optimizer
 import models
+import executor
+import bulk
+import cache
+import metrics
+import admission
+import rules
+import variants
+import jobs
+import embedding_store
+from api_common import (OptimizeRequest, BatchOptimizeRequest, batch_results, check_batch_size,
+                        count_request, prompt_too_long_error)
 import json
+import os
+import time
+import asyncio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+IN_FLIGHT = metrics.register(metrics.Gauge(
+    "http_requests_in_flight", "API requests currently being handled", ["path"]))
+REQUEST_SECONDS = metrics.register(metrics.LabeledHistogram(
+    "http_request_duration_seconds", "Time until the response starts, per route", ["path"]))
+metrics.register(metrics.CallbackGauge(
+    "cache_hit_ratio", "Hit ratio of the result cache and the semantic rewrite cache", ["cache"],
+    lambda: {("results",): cache.RESULT_CACHE.stats()["hit_ratio"],
+             ("semantic",): optimizer.semantic_cache_stats().get("hit_ratio", 0.0),
+             **{("prefix_" + name,): stats["hit_ratio"]
+                for name, stats in models.prefix_cache_stats().items()}}))
+
+metrics.register(metrics.CallbackGauge(
+    "coalesced_requests_total", "Requests answered by joining an identical in-flight computation", [],
+    lambda: {(): cache.IN_FLIGHT.coalesced}, kind="counter"))
+metrics.register(metrics.CallbackGauge(
+    "coalesced_disconnects_total", "Coalesced requests whose client left before the shared result", [],
+    lambda: {(): cache.IN_FLIGHT.disconnected}, kind="counter"))
+metrics.register(metrics.CallbackGauge(
+    "coalescing_in_flight", "Distinct computations currently shared by coalesced requests", [],
+    lambda: {(): cache.IN_FLIGHT.stats()["in_flight"]}))
+
+class InstrumentedRoute(APIRoute):
+    """Route that records in-flight requests, latency and per-stage timings"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def instrumented(request: Request):
+            timings, token = metrics.start_request()
+            IN_FLIGHT.inc(path)
+            try:
+                response = await handler(request)
+            finally:
+                IN_FLIGHT.dec(path)
+                metrics.end_request(token)
+                total = time.perf_counter() - timings.started
+                REQUEST_SECONDS.labels(path).observe(total)
+            if metrics.METRICS_TIMING_HEADERS:
+                response.headers["Server-Timing"] = metrics.server_timing(timings, total)
+            return response
+
+        return instrumented
+
 # Create FastAPI app
 app = FastAPI(title="AI Prompt Generator & Optimizer")
+if metrics.METRICS_ENABLED:
+    app.router.route_class = InstrumentedRoute
 
 # Set up CORS middleware
 app.add_middleware(
@@ -32,6 +93,44 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+@app.on_event("startup")
+async def warm_up_models():
+    """Optionally preload optimizer models (see OPTIMIZER_WARMUP)"""
+    optimizer.warm_up_from_env()
+    jobs.start_workers(jobs.JOB_WORKERS)
+    if embedding_store.EMBEDDING_STORE_ENABLED and embedding_store.EMBEDDING_STORE_COMPACT_INTERVAL > 0:
+        asyncio.create_task(compact_prompt_store())
+
+async def compact_prompt_store():
+    """Periodically compact the prompt history once enough of it is garbage"""
+    while True:
+        await asyncio.sleep(embedding_store.EMBEDDING_STORE_COMPACT_INTERVAL)
+        try:
+            await executor.run_light(embedding_store.STORE.compact_if_needed)
+        except executor.QueueFullError:
+            continue
+        except Exception as e:
+            logging.error(f"Error compacting prompt store: {e}")
+
+@app.on_event("shutdown")
+async def stop_executors():
+    """Stop the NLP thread pool, the generation process pool and any job workers"""
+    executor.shutdown()
+    await asyncio.to_thread(jobs.stop_workers)
+
+def queue_full_error(e: executor.QueueFullError) -> HTTPException:
+    """Turn a saturated pool into a 503 the client can back off from"""
+    return HTTPException(status_code=503, detail=str(e),
+                         headers={"Retry-After": str(e.retry_after)})
+
+def client_disconnected_error(e: cache.ClientDisconnected) -> HTTPException:
+    """Nobody is listening any more; 499 (client closed request) for the access log"""
+    return HTTPException(status_code=499, detail=str(e))
+
+def disconnect_check(http_request: Optional[Request]):
+    """What a coalesced request polls to notice its client leaving"""
+    return http_request.is_disconnected if http_request is not None else None
+
 class PromptRequest(BaseModel):
     goal: str
     target_model: str
@@ -40,10 +139,86 @@ class PromptRequest(BaseModel):
     style: Optional[str] = "detailed"
     formats: Optional[List[str]] = ["standard"]
 
-class OptimizeRequest(BaseModel):
+class SimilarRequest(BaseModel):
+    prompt: Optional[str] = None
+    prompts: Optional[List[str]] = None
+    top_k: int = 10
+    kind: Optional[str] = None
+    min_score: Optional[float] = None
+
+class VariantRequest(BaseModel):
+    goal: str
+    context: Optional[str] = None
+    target_models: Optional[List[str]] = None
+    styles: Optional[List[str]] = None
+    formats: Optional[List[str]] = None
+    # None or 0 returns every variant
+    top_k: Optional[int] = Field(10, ge=0)
+    criteria: Optional[List[str]] = None
+
+class JobItem(BaseModel):
     prompt: str
-    target_model: str
-    optimization_level: str = "balanced"
+    target_model: Optional[str] = None
+    optimization_level: Optional[str] = None
+    id: Optional[Union[int, str]] = None
+
+class JobRequest(BaseModel):
+    items: List[JobItem]
+    target_model: str = "default"
+    optimization_level: str = "maximum"
+    priority: str = "normal"
+
+class TestPromptRequest(BaseModel):
+    prompt: str
+    target_model: str = "default"
+    max_new_tokens: Optional[int] = None
+
+# Scoring is cheap, so /api/evaluate/batch accepts far larger lists
+MAX_EVALUATE_ITEMS = int(os.getenv("MAX_EVALUATE_ITEMS", "100000"))
+
+class EvaluateRequest(BaseModel):
+    prompt: str
+    criteria: Optional[List[str]] = None
+
+class BatchEvaluateRequest(BaseModel):
+    prompts: List[str]
+    criteria: Optional[List[str]] = None
+
+class BatchPromptRequest(BaseModel):
+    items: List[PromptRequest]
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator may keep reading the request body
+
+    The stock response listens for a client disconnect on the same receive
+    channel on older ASGI servers, which would swallow request body chunks.
+    A disconnect still surfaces as a failed send.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            logging.info("Client disconnected from a streaming response")
+
+# Optimization levels whose output is deterministic and therefore cacheable
+CACHEABLE_LEVELS = ("minimal", "fast", "balanced")
+# Levels that never run GPT-2 and stay out of the process pool
+LIGHT_LEVELS = rules.RULE_LEVELS + ("balanced",)
+
+async def cached_batch(keys: list, items: list, run, func, costs: Optional[list] = None) -> list:
+    """Serve batch items from the result cache and compute only the misses"""
+    results = [cache.RESULT_CACHE.get(key) if key else None for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        cost = sum(costs[i] for i in missing) if costs else 0
+        computed = await run(func, [items[i] for i in missing], cost=cost)
+        for i, result in zip(missing, computed):
+            results[i] = result
+            if keys[i] and not isinstance(result, Exception):
+                cache.RESULT_CACHE.set(keys[i], result)
+    return results
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -51,38 +226,510 @@ async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/api/generate")
-async def generate_prompt(request: PromptRequest):
+async def generate_prompt(request: PromptRequest, http_request: Request = None):
     """Generate a new prompt based on user goals and target model"""
+    metrics.mark_validated()
+    count_request("generate", "", request.target_model)
     try:
-        generated_prompt = optimizer.generate_prompt(
-            goal=request.goal,
-            target_model=request.target_model,
-            context=request.context,
-            style=request.style,
-            formats=request.formats
-        )
+        key = cache.generate_key(request.goal, request.target_model, request.context,
+                                 request.style, request.formats)
+        generated_prompt = cache.RESULT_CACHE.get(key)
+        if generated_prompt is None:
+            async def compute():
+                result = await executor.run_light(
+                    optimizer.generate_prompt,
+                    goal=request.goal,
+                    target_model=request.target_model,
+                    context=request.context,
+                    style=request.style,
+                    formats=request.formats,
+                    cost=admission.estimate_tokens(f"{request.goal} {request.context or ''}")
+                )
+                cache.RESULT_CACHE.set(key, result)
+                return result
+            # Identical requests already in flight share one computation
+            generated_prompt = await cache.IN_FLIGHT.do(key, compute, disconnect_check(http_request))
         logging.info(f"Generated prompt: {generated_prompt}")
+        embedding_store.record(generated_prompt, "generate")
         return {"status": "success", "prompt": generated_prompt}
+    except cache.ClientDisconnected as e:
+        raise client_disconnected_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
     except Exception as e:
         logging.error(f"Error generating prompt: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating prompt: {e}")
 
 @app.post("/api/optimize")
-async def optimize_prompt(request: OptimizeRequest):
+async def optimize_prompt(request: OptimizeRequest, http_request: Request = None):
     """Optimize an existing prompt for better results"""
+    metrics.mark_validated()
+    count_request("optimize", request.optimization_level, request.target_model)
     try:
-        optimized_prompt = optimizer.optimize_prompt(
-            prompt=request.prompt,
-            target_model=request.target_model,
-            optimization_level=request.optimization_level
-        )
+        tokens = admission.check_prompt(request.prompt, request.optimization_level)
+        if request.optimization_level in rules.RULE_LEVELS and tokens <= rules.RULES_INLINE_TOKENS:
+            # A few regexes: cheaper than a thread hop or a cache lookup
+            optimized_prompt = rules.optimize_prompt(request.prompt, request.target_model,
+                                                     request.optimization_level)
+            embedding_store.record(request.prompt, "optimize")
+            return {"status": "success", "optimized_prompt": optimized_prompt}
+        # Only the maximum level runs GPT-2, so only it goes to the process pool
+        light = request.optimization_level in LIGHT_LEVELS
+        cacheable = request.optimization_level in CACHEABLE_LEVELS
+        key = cache.optimize_key(request.prompt, request.target_model, request.optimization_level)
+        optimized_prompt = cache.RESULT_CACHE.get(key) if cacheable else None
+        if optimized_prompt is None:
+            async def compute():
+                run = executor.run_light if light else executor.run_heavy
+                result = await run(
+                    optimizer.optimize_prompt,
+                    prompt=request.prompt,
+                    target_model=request.target_model,
+                    optimization_level=request.optimization_level,
+                    cost=tokens
+                )
+                if cacheable:
+                    cache.RESULT_CACHE.set(key, result)
+                return result
+            # Identical requests already in flight (maximum level included)
+            # share one computation
+            optimized_prompt = await cache.IN_FLIGHT.do(key, compute, disconnect_check(http_request))
         logging.info(f"Optimized prompt: {optimized_prompt}")
+        embedding_store.record(request.prompt, "optimize")
         return {"status": "success", "optimized_prompt": optimized_prompt}
+    except cache.ClientDisconnected as e:
+        raise client_disconnected_error(e)
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
     except Exception as e:
         logging.error(f"Error optimizing prompt: {e}")
         raise HTTPException(status_code=500, detail=f"Error optimizing prompt: {e}")
 
+@app.post("/api/generate/batch")
+async def generate_prompt_batch(request: BatchPromptRequest):
+    """Generate prompts for many goals in one request"""
+    metrics.mark_validated()
+    check_batch_size(request.items)
+    for item in request.items:
+        count_request("generate_batch", "", item.target_model)
+    try:
+        items = [item.dict(exclude={"existing_prompt"}) for item in request.items]
+        keys = [cache.generate_key(**item) for item in items]
+        costs = [admission.estimate_tokens(f"{item['goal']} {item['context'] or ''}") for item in items]
+        results = await cached_batch(keys, items, executor.run_light, optimizer.generate_prompts, costs)
+        return {"status": "success", "results": batch_results(results, "prompt")}
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error generating prompt batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating prompt batch: {e}")
+
+@app.post("/api/optimize/batch")
+async def optimize_prompt_batch(request: BatchOptimizeRequest):
+    """Optimize many prompts in one request, batching the NLP models"""
+    metrics.mark_validated()
+    check_batch_size(request.items)
+    for item in request.items:
+        count_request("optimize_batch", item.optimization_level, item.target_model)
+    try:
+        items = [item.dict() for item in request.items]
+        costs = [admission.estimate_tokens(item["prompt"]) for item in items]
+        if all(item["optimization_level"] in rules.RULE_LEVELS for item in items) \
+                and sum(costs) <= rules.RULES_INLINE_TOKENS:
+            results = rules.optimize_prompts(items)
+            return {"status": "success", "results": batch_results(results, "optimized_prompt")}
+        light = all(item["optimization_level"] in LIGHT_LEVELS for item in items)
+        run = executor.run_light if light else executor.run_heavy
+        keys = [cache.optimize_key(**item) if item["optimization_level"] in CACHEABLE_LEVELS else None
+                for item in items]
+        # Items over their level's size limit fail individually in optimize_prompts
+        results = await cached_batch(keys, items, run, optimizer.optimize_prompts, costs)
+        return {"status": "success", "results": batch_results(results, "optimized_prompt")}
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error optimizing prompt batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error optimizing prompt batch: {e}")
+
+@app.post("/api/generate/variants")
+async def generate_prompt_variants(request: VariantRequest):
+    """
+    Generate every (target model x style x formats) variant of a prompt and rank them
+
+    The grid is rendered in chunks on the NLP threads in parallel, then all
+    variants are scored together and the top_k best are returned.
+    """
+    metrics.mark_validated()
+    models_requested = request.target_models or []
+    count_request("variants", "", models_requested[0] if len(models_requested) == 1 else "")
+    size = variants.grid_size(request.target_models, request.styles, request.formats)
+    if size > variants.MAX_VARIANTS:
+        raise HTTPException(status_code=413,
+                            detail=f"Grid has {size} variants, the limit is {variants.MAX_VARIANTS}")
+    try:
+        tokens = admission.check_prompt(f"{request.goal} {request.context or ''}", "balanced")
+        cells = variants.expand_grid(request.target_models, request.styles, request.formats)
+        step = max(1, variants.VARIANT_CHUNK_SIZE)
+        chunks = await asyncio.gather(*(
+            executor.run_light(variants.generate_variants, request.goal, cells[i:i + step],
+                               request.context, cost=tokens)
+            for i in range(0, len(cells), step)
+        ))
+        generated = [variant for chunk in chunks for variant in chunk]
+        ranking = await executor.run_light(
+            variants.rank_variants, request.goal, generated, request.top_k, request.criteria,
+            cost=tokens * len(generated)
+        )
+        return {"status": "success", **ranking}
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error generating prompt variants: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating prompt variants: {e}")
+
+# Largest number of queries accepted by /api/similar
+MAX_SIMILAR_QUERIES = int(os.getenv("MAX_SIMILAR_QUERIES", "64"))
+
+@app.post("/api/similar")
+async def similar_prompts(request: SimilarRequest):
+    """Find stored prompts most similar to one prompt (or to each of several)"""
+    metrics.mark_validated()
+    queries = ([request.prompt] if request.prompt else []) + (request.prompts or [])
+    if not queries:
+        raise HTTPException(status_code=400, detail="Give a prompt or a list of prompts")
+    check_batch_size(queries, MAX_SIMILAR_QUERIES)
+    if request.kind is not None and request.kind not in embedding_store.KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown kind {request.kind!r}")
+    try:
+        results = await executor.run_light(
+            embedding_store.similar, queries, max(0, min(request.top_k, 1000)), request.kind,
+            request.min_score, cost=sum(admission.estimate_tokens(query) for query in queries)
+        )
+        return {"status": "success", "results": results}
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error searching similar prompts: {e}")
+        raise HTTPException(status_code=500, detail=f"Error searching similar prompts: {e}")
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/api/optimize/events")
+async def optimize_prompt_events(request: Request, body: OptimizeRequest):
+    """
+    Optimize a prompt and stream the result as server-sent events
+
+    For the maximum level each GPT-2 token is sent as {"token": ...} as soon
+    as it is generated; every level ends with {"optimized_prompt": ...}.
+    Generation stops as soon as the client disconnects.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if body.optimization_level in LIGHT_LEVELS:
+        result = await optimize_prompt(body)
+        return StreamingResponse(iter([sse_event({"optimized_prompt": result["optimized_prompt"]})]),
+                                 media_type="text/event-stream", headers=headers)
+
+    metrics.mark_validated()
+    count_request("optimize", body.optimization_level, body.target_model)
+    try:
+        tokens = admission.check_prompt(body.prompt, body.optimization_level)
+        # GPT-2 runs where run_heavy would run it (process pool or model server)
+        items = executor.stream_heavy(optimizer.stream_rewrite, body.prompt, body.target_model,
+                                      cost=tokens)
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+
+    async def events():
+        try:
+            async for item in items:
+                if await request.is_disconnected():
+                    logging.info("Client disconnected, stopping generation")
+                    break
+                yield sse_event(item)
+        except Exception as e:
+            logging.error(f"Error streaming optimized prompt: {e}")
+            yield sse_event({"error": f"Error optimizing prompt: {e}"})
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.post("/api/test-prompt")
+async def test_prompt(request: TestPromptRequest):
+    """Run a prompt on the local test model (phi-1_5) and return its response"""
+    metrics.mark_validated()
+    count_request("test", "", request.target_model)
+    try:
+        max_new_tokens = admission.test_max_new_tokens(request.max_new_tokens)
+        tokens = admission.check_test_prompt(request.prompt, max_new_tokens)
+        result = await executor.run_heavy(
+            models.test_with_huggingface, request.prompt, request.target_model, max_new_tokens,
+            cost=tokens + max_new_tokens
+        )
+        return {"status": "success", "result": result, "max_new_tokens": max_new_tokens}
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error testing prompt: {e}")
+        raise HTTPException(status_code=500, detail=f"Error testing prompt: {e}")
+
+@app.post("/api/test-prompt/events")
+async def test_prompt_events(request: Request, body: TestPromptRequest):
+    """
+    Run a prompt on the local test model and stream the response as server-sent events
+
+    Each generated piece is sent as {"token": ...}, followed by {"result": ...}
+    with the whole response. Generation stops as soon as the client disconnects.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    metrics.mark_validated()
+    count_request("test", "", body.target_model)
+    try:
+        max_new_tokens = admission.test_max_new_tokens(body.max_new_tokens)
+        tokens = admission.check_test_prompt(body.prompt, max_new_tokens)
+        items = executor.stream_heavy(models.stream_test, body.prompt, body.target_model,
+                                      max_new_tokens, cost=tokens + max_new_tokens)
+    except admission.PromptTooLongError as e:
+        raise prompt_too_long_error(e)
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+
+    async def events():
+        try:
+            async for item in items:
+                if await request.is_disconnected():
+                    logging.info("Client disconnected, stopping generation")
+                    break
+                yield sse_event(item)
+        except Exception as e:
+            logging.error(f"Error streaming prompt test: {e}")
+            yield sse_event({"error": f"Error testing prompt: {e}"})
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.post("/api/evaluate")
+async def evaluate_prompt(request: EvaluateRequest):
+    """Score a prompt's likely effectiveness"""
+    try:
+        evaluation = await executor.run_light(
+            models.evaluate_prompt_effectiveness, request.prompt, request.criteria,
+            cost=admission.estimate_tokens(request.prompt)
+        )
+        return {"status": "success", **evaluation}
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error evaluating prompt: {e}")
+        raise HTTPException(status_code=500, detail=f"Error evaluating prompt: {e}")
+
+@app.post("/api/evaluate/batch")
+async def evaluate_prompt_batch(request: BatchEvaluateRequest):
+    """Score many prompts in one vectorized pass"""
+    check_batch_size(request.prompts, MAX_EVALUATE_ITEMS)
+    try:
+        # Roughly four characters per token; exact estimates would cost a pass over every prompt
+        cost = sum(len(prompt) for prompt in request.prompts) / 4
+        results = await executor.run_light(models.evaluate_prompts, request.prompts, request.criteria,
+                                           cost=cost)
+        return {"status": "success", "results": results}
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error evaluating prompt batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error evaluating prompt batch: {e}")
+
+@app.post("/api/optimize/stream")
+async def optimize_prompt_stream(request: Request, target_model: str = "default",
+                                 optimization_level: str = "balanced", offset: int = 0,
+                                 evaluate: bool = True):
+    """
+    Optimize an NDJSON request body and stream NDJSON results back
+
+    The body is read incrementally and processed in bounded batches. Each
+    result carries the byte offset just past its input line (counted from
+    `offset`), so a client can resume an interrupted upload from there.
+    """
+    async def results():
+        lines = bulk.aiter_lines(request.stream(), offset)
+        batch = []
+        async for line in lines:
+            batch.append(line)
+            if len(batch) >= bulk.BULK_BATCH_SIZE:
+                async for chunk in run_batch(batch):
+                    yield chunk
+                batch = []
+        if batch:
+            async for chunk in run_batch(batch):
+                yield chunk
+
+    async def run_batch(batch):
+        # Parsed once here, so the pool is chosen from the same levels the batch runs with
+        records = bulk.parse_batch(batch, target_model, optimization_level)
+        run = executor.run_heavy if bulk.needs_generation(records) else executor.run_light
+        try:
+            # Input bytes / 4 approximates the batch's tokens
+            outputs = await run(bulk.process_batch, records, evaluate,
+                                cost=sum(end - start for start, end, _ in batch) / 4)
+        except Exception as e:
+            logging.error(f"Error optimizing prompt stream: {e}")
+            outputs = [{"id": None, "offset": end, "status": "error", "detail": str(e)}
+                       for _, end, _ in batch]
+        for output in outputs:
+            yield json.dumps(output, ensure_ascii=False) + "\n"
+
+    return BodyStreamingResponse(results(), media_type="application/x-ndjson")
+
+def job_not_found(job_id: str) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+@app.post("/api/jobs")
+async def submit_job(request: JobRequest):
+    """Queue prompts for background optimization and return the job ID to poll"""
+    metrics.mark_validated()
+    count_request("jobs", request.optimization_level, request.target_model)
+    items = [{"prompt": item.prompt, "id": item.id,
+              "target_model": item.target_model or request.target_model,
+              "optimization_level": item.optimization_level or request.optimization_level}
+             for item in request.items]
+    try:
+        job = await executor.run_light(jobs.STORE.submit, items, request.priority)
+        return {"status": "success", **job}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error submitting job: {e}")
+        raise HTTPException(status_code=500, detail=f"Error submitting job: {e}")
+
+@app.post("/api/jobs/jsonl")
+async def submit_job_jsonl(request: Request, target_model: str = "default",
+                           optimization_level: str = "maximum", priority: str = "normal"):
+    """
+    Queue a JSONL request body (the bulk.py input format) as one job
+
+    Records are parsed as the body streams in and stored
+    jobs.SUBMIT_CHUNK_ITEMS at a time, so large files are never held in
+    memory. Workers see the job once the whole body has been stored.
+    """
+    metrics.mark_validated()
+    count_request("jobs", optimization_level, target_model)
+    job_id = None
+    try:
+        job_id = await executor.run_light(jobs.STORE.open_job, priority)
+        total, chunk = 0, []
+        async for _, _, line in bulk.aiter_lines(request.stream()):
+            try:
+                record_id, item = bulk.parse_record(line, target_model, optimization_level)
+            except ValueError as e:
+                raise ValueError(f"Record {total + len(chunk) + 1}: {e}")
+            chunk.append(dict(item, id=record_id))
+            if len(chunk) == jobs.SUBMIT_CHUNK_ITEMS:
+                total = await executor.run_light(jobs.STORE.add_items, job_id, chunk, total)
+                chunk = []
+        await executor.run_light(jobs.STORE.add_items, job_id, chunk, total)
+        job = await executor.run_light(jobs.STORE.close_job, job_id)
+        job_id = None
+        return {"status": "success", **job}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except executor.QueueFullError as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        logging.error(f"Error submitting job: {e}")
+        raise HTTPException(status_code=500, detail=f"Error submitting job: {e}")
+    finally:
+        # A bad record or a dropped connection leaves nothing behind
+        if job_id is not None:
+            await asyncio.to_thread(jobs.STORE.drop_job, job_id)
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Progress, throughput and ETA of a job"""
+    try:
+        return {"status": "success", "job": await asyncio.to_thread(jobs.STORE.status, job_id)}
+    except KeyError:
+        raise job_not_found(job_id)
+
+@app.get("/api/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Finished items of a job as NDJSON, in input order (partial while the job runs)"""
+    try:
+        await asyncio.to_thread(jobs.STORE.status, job_id)
+    except KeyError:
+        raise job_not_found(job_id)
+
+    def lines():
+        for output in jobs.STORE.results(job_id):
+            yield json.dumps(output, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job's queued items"""
+    try:
+        return {"status": "success", "job": await asyncio.to_thread(jobs.STORE.cancel, job_id)}
+    except KeyError:
+        raise job_not_found(job_id)
+
+@app.get("/api/stats/jobs")
+async def job_stats():
+    """Job queue depth per priority and throughput per worker"""
+    return await asyncio.to_thread(jobs.STORE.stats)
+
+@app.get("/api/stats/prompt-store")
+async def prompt_store_stats():
+    """Rows, file sizes and bytes per row of the prompt history, plus recorder counters"""
+    stats = await asyncio.to_thread(embedding_store.STORE.stats)
+    recorder = embedding_store.RECORDER
+    return {**stats, "recorder": {"enabled": recorder.enabled, "recorded": recorder.recorded,
+                                  "dropped": recorder.dropped}}
+
+@app.get("/api/stats/batching")
+async def batching_stats():
+    """Batch-size and wait-time histograms of the generation micro-batchers"""
+    return {"optimizer": optimizer.batching_stats(), "models": models.batching_stats()}
+
+@app.get("/api/stats/cache")
+async def cache_stats():
+    """Hit/miss counters of the result, semantic rewrite and prompt-test prefix caches and request coalescing"""
+    return {"results": cache.RESULT_CACHE.stats(), "semantic": optimizer.semantic_cache_stats(),
+            "prefix": models.prefix_cache_stats(), "coalescing": cache.IN_FLIGHT.stats()}
+
+def component_histograms() -> list:
+    """Histograms of model components that have been started in this process"""
+    histograms = []
+    if optimizer.is_loaded("generation_batcher"):
+        batcher = optimizer.get_model("generation_batcher")
+        histograms += [batcher.batch_sizes, batcher.wait_times]
+    for entry in models.LOADED_MODELS.values():
+        if "batcher" in entry:
+            histograms += [entry["batcher"].batch_sizes, entry["batcher"].wait_times]
+        if "tester" in entry:
+            histograms += [entry["tester"].batcher.batch_sizes, entry["tester"].batcher.wait_times]
+    if optimizer.is_loaded("semantic_cache"):
+        histograms.append(optimizer.get_model("semantic_cache").similarities)
+    return histograms
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latencies, request counters and cache/batcher statistics for Prometheus"""
+    return PlainTextResponse(metrics.render(metrics.REGISTRY + component_histograms()),
+                             media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     models.initialize_models() # Initialize models
-    uvicorn.run(app, host="localhost", port=8000)
+    uvicorn.run(app, host="localhost", port=8000)
\ No newline at end of file
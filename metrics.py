@@ -0,0 +1,278 @@
+import os
+import time
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Stage timers and request metrics; when off, stage() is a shared no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Add a Server-Timing header with the stage breakdown to API responses
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "0") == "1"
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative bucketed histogram, safe to observe from several threads"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        """Return cumulative bucket counts plus sum and count"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + [float("inf")], counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+Labels = Tuple[str, ...]
+
+
+class LabeledHistogram:
+    """A Histogram per combination of label values"""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children: Dict[Labels, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(
+                    values, Histogram(self.name, self.description, self.buckets))
+        return child
+
+    def children(self) -> List[Tuple[Labels, Histogram]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter:
+    """Monotonic counter per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def samples(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    """Value that can go up and down, per combination of label values"""
+
+    kind = "gauge"
+
+    def set(self, *values: str, value: float) -> None:
+        with self._lock:
+            self._values[values] = value
+
+    def dec(self, *values: str, amount: float = 1.0) -> None:
+        self.inc(*values, amount=-amount)
+
+
+class CallbackGauge:
+    """Gauge (or counter kept elsewhere) whose samples are read by a callback at scrape time"""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Labels, float]], kind: str = "gauge"):
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[Tuple[Labels, float]]:
+        return list(self.callback().items())
+
+
+STAGE_SECONDS = LabeledHistogram("prompt_stage_seconds",
+                                 "Time spent in each stage of prompt generation and optimization",
+                                 ["stage"])
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time taken to load each model component",
+                           ["component"])
+
+# Metrics rendered by /metrics, in order
+REGISTRY: List[object] = [STAGE_SECONDS, MODEL_LOAD_SECONDS]
+
+
+def register(metric):
+    """Add a metric to REGISTRY and return it"""
+    REGISTRY.append(metric)
+    return metric
+
+
+class RequestTimings:
+    """Stage durations of the request being handled (for Server-Timing)"""
+
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+
+_REQUEST_TIMINGS: "contextvars.ContextVar[Optional[RequestTimings]]" = \
+    contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request() -> Tuple[RequestTimings, contextvars.Token]:
+    """Begin collecting stage timings for the current request"""
+    timings = RequestTimings()
+    return timings, _REQUEST_TIMINGS.set(timings)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _REQUEST_TIMINGS.reset(token)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        timings.stages.append((name, seconds))
+
+
+def mark_validated() -> None:
+    """Record the time from request start to the handler as the validation stage"""
+    if not METRICS_ENABLED:
+        return
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        observe_stage("validation", time.perf_counter() - timings.started)
+
+
+class _StageTimer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def stage(name: str):
+    """Context manager timing one stage into prompt_stage_seconds{stage=name}"""
+    return _StageTimer(name) if METRICS_ENABLED else _NOOP_TIMER
+
+
+def timed(name: str):
+    """Decorator timing every call of a function as a stage (a no-op when disabled)"""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    """Server-Timing header value with each stage and the total, in milliseconds"""
+    parts = [f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in timings.stages]
+    parts.append(f"total;dur={total * 1000.0:.2f}")
+    return ", ".join(parts)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _render_histogram(lines: List[str], name: str, names: Sequence[str],
+                      values: Sequence[str], histogram: Histogram) -> None:
+    snapshot = histogram.snapshot()
+    for bound, count in snapshot["buckets"].items():
+        le = f'le="{bound}"'
+        lines.append(f"{name}_bucket{_labels(names, values, le)} {count}")
+    lines.append(f"{name}_sum{_labels(names, values)} {snapshot['sum']}")
+    lines.append(f"{name}_count{_labels(names, values)} {snapshot['count']}")
+
+
+def _render_one(metric) -> List[str]:
+    lines = [f"# HELP {metric.name} {metric.description}"]
+    if isinstance(metric, Histogram):
+        lines.append(f"# TYPE {metric.name} histogram")
+        _render_histogram(lines, metric.name, (), (), metric)
+    elif isinstance(metric, LabeledHistogram):
+        lines.append(f"# TYPE {metric.name} histogram")
+        for values, child in metric.children():
+            _render_histogram(lines, metric.name, metric.labelnames, values, child)
+    else:
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for values, value in metric.samples():
+            lines.append(f"{metric.name}{_labels(metric.labelnames, values)} {value}")
+    return lines
+
+
+def render(metrics: Sequence[object]) -> str:
+    """Prometheus text exposition format for the given metrics"""
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(_render_one(metric))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,236 @@
+"""
+Local model server shared by every API worker on a host
+
+One process loads the optimizer (and optionally phi-1_5) models once and
+serves calls from API workers over a Unix socket. Each connection is handled
+on its own thread, so concurrent GPT-2 calls from all workers meet in the
+same micro-batcher.
+
+Protocol: every message is a 4-byte big-endian length followed by a pickled
+tuple. Requests are (module, function name, args, kwargs) for one of
+ALLOWED_CALLS; replies are ("ok", result) or ("error", exception). A request
+with a fifth element set to True streams one of ALLOWED_STREAMS instead: the
+server replies ("item", x) per item, then ("done", None) or ("error", e),
+and stops generating when the client closes the connection. The socket is
+created owner-only (0600) because pickle trusts its peer.
+
+Usage:
+    python model_server.py --socket /tmp/prompt-models.sock
+    MODEL_SERVER_SOCKET=/tmp/prompt-models.sock uvicorn main:app --workers 4
+"""
+import os
+import sys
+import pickle
+import socket
+import struct
+import logging
+import argparse
+import importlib
+import threading
+import socketserver
+from typing import Any, Callable, Iterator, Optional
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "")
+
+# Functions API workers may run in the model server
+ALLOWED_CALLS = {
+    ("optimizer", "optimize_prompt"),
+    ("optimizer", "optimize_prompts"),
+    ("optimizer", "rewrite_prompt"),
+    ("bulk", "process_batch"),
+    ("models", "test_with_huggingface"),
+    ("embedding_store", "embed_texts"),
+}
+
+# Generator functions API workers may stream from the model server; each
+# takes a stop_event keyword
+ALLOWED_STREAMS = {
+    ("optimizer", "stream_rewrite"),
+    ("models", "stream_test"),
+}
+
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock: socket.socket, payload: Any) -> None:
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Model server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Any:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            module_name, func_name, args, kwargs = message[:4]
+            streaming = len(message) > 4 and message[4]
+            try:
+                if (module_name, func_name) not in (ALLOWED_STREAMS if streaming else ALLOWED_CALLS):
+                    raise PermissionError(f"{module_name}.{func_name} is not served")
+                func = getattr(importlib.import_module(module_name), func_name)
+                if streaming:
+                    if not self._stream(func, args, kwargs):
+                        return
+                    continue
+                reply = ("ok", func(*args, **kwargs))
+            except Exception as e:
+                logging.error(f"Model server call {module_name}.{func_name} failed: {e}")
+                reply = ("error", e)
+            try:
+                send_message(self.request, reply)
+            except OSError:
+                return
+
+    def _stream(self, func: Callable[..., Any], args: tuple, kwargs: dict) -> bool:
+        """Send every item of a generator call; False once the client has gone away"""
+        stop_event = threading.Event()
+        items = None
+        try:
+            try:
+                items = iter(func(*args, stop_event=stop_event, **kwargs))
+                for item in items:
+                    try:
+                        send_message(self.request, ("item", item))
+                    except OSError:
+                        return False
+                reply = ("done", None)
+            except Exception as e:
+                logging.error(f"Model server stream {func.__module__}.{func.__name__} failed: {e}")
+                reply = ("error", e)
+        finally:
+            stop_event.set()
+            if hasattr(items, "close"):
+                items.close()
+        try:
+            send_message(self.request, reply)
+        except OSError:
+            return False
+        return True
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+_local = threading.local()
+
+
+def _connection(path: str) -> socket.socket:
+    sock = getattr(_local, "sock", None)
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        _local.sock = sock
+    return sock
+
+
+def call(func: Callable[..., Any], *args, path: Optional[str] = None, **kwargs) -> Any:
+    """
+    Run func in the model server and return its result
+
+    Each calling thread keeps one persistent connection and reconnects once
+    if the server was restarted.
+    """
+    path = path or MODEL_SERVER_SOCKET
+    request = (func.__module__, func.__name__, args, kwargs)
+    for attempt in range(2):
+        try:
+            sock = _connection(path)
+            send_message(sock, request)
+            status, value = recv_message(sock)
+            break
+        except (ConnectionError, OSError):
+            sock = getattr(_local, "sock", None)
+            if sock is not None:
+                sock.close()
+            _local.sock = None
+            if attempt:
+                raise
+    if status == "error":
+        raise value
+    return value
+
+
+def stream(func: Callable[..., Any], *args, stop_event: Optional[threading.Event] = None,
+           path: Optional[str] = None, **kwargs) -> Iterator[Any]:
+    """
+    Run the generator function func in the model server, yielding its items
+
+    A stream gets a connection of its own, closed when the stream ends or is
+    abandoned (or stop_event is set), which stops generation in the server.
+    """
+    path = path or MODEL_SERVER_SOCKET
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        send_message(sock, (func.__module__, func.__name__, args, kwargs, True))
+        while stop_event is None or not stop_event.is_set():
+            status, value = recv_message(sock)
+            if status == "item":
+                yield value
+            elif status == "error":
+                raise value
+            else:
+                return
+    finally:
+        sock.close()
+
+
+def serve(path: str, load_test_model: bool = False) -> None:
+    """Load the models and serve them on a Unix socket until interrupted"""
+    import optimizer
+    import models
+
+    optimizer.warm_up()
+    if load_test_model:
+        models.initialize_models()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    old_umask = os.umask(0o177)
+    try:
+        server = ModelServer(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    logging.info(f"Model server listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve optimizer models to local API workers")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "/tmp/prompt-models.sock")
+    parser.add_argument("--load-test-model", action="store_true",
+                        help="Also load the phi-1_5 model from models.py")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(args.socket, args.load_test_model)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,18 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-from typing import Dict, Any, List, Optional
-import torch
+from typing import Dict, Any, Iterator, List, Optional
 import json
 import os
+import time
+import threading
 from dotenv import load_dotenv
 import traceback
+import numpy as np
+
+from batching import MicroBatcher
+from prompt_testing import PromptTester
+import admission
+import keywords
+import inference
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -14,11 +22,16 @@ MODEL_NAME = "microsoft/phi-1_5"
 
 # Keep loaded models in memory
 LOADED_MODELS = {}
+_INIT_LOCK = threading.Lock()
 
 def initialize_models():
     """Initialize and load the model at startup"""
     try:
+        from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+        inference.configure_threads()
         print(f"Loading model {MODEL_NAME}...")
+        started = time.perf_counter()
 
         # Load with token from environment
         token = os.getenv("HUGGINGFACE_TOKEN")
@@ -34,16 +47,23 @@ def initialize_models():
             trust_remote_code=True
         )
         print(f"Model loaded: {type(model)}")  # Debug print
+        model = inference.quantize(model)
 
+        text_pipeline = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer
+        )
         LOADED_MODELS["default"] = { # Use a generic key like "default"
             "model": model,
             "tokenizer": tokenizer,
-            "pipeline": pipeline(
-                "text-generation",
-                model=model,
-                tokenizer=tokenizer
-            )
+            "pipeline": text_pipeline,
+            # Concurrent callers share padded batches through this scheduler
+            "batcher": MicroBatcher("phi", text_pipeline, context=inference.inference_mode),
+            # Prompt tests: batched greedy generation with prefix key/value reuse
+            "tester": PromptTester("phi", model, tokenizer)
         }
+        metrics.MODEL_LOAD_SECONDS.set(MODEL_NAME, value=time.perf_counter() - started)
 
     except Exception as e:
         print(f"Error loading model {MODEL_NAME}:")
@@ -51,6 +71,69 @@ def initialize_models():
         # Removed: st.error(f"Failed to load model {MODEL_NAME}. Please check configuration and HUGGINGFACE_TOKEN.")
 
 
+def batching_stats() -> Dict[str, Any]:
+    """Histograms of the micro-batchers for each loaded model"""
+    stats = {}
+    for name, entry in LOADED_MODELS.items():
+        if "batcher" in entry:
+            stats[name] = entry["batcher"].stats()
+        if "tester" in entry:
+            stats[f"{name}_test"] = entry["tester"].batcher.stats()
+    return stats
+
+
+def prefix_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the prompt-test prefix caches"""
+    return {name: entry["tester"].prefix_cache.stats() for name, entry in LOADED_MODELS.items()
+            if "tester" in entry}
+
+
+def get_tester(model_type: str = "default") -> PromptTester:
+    """
+    The prompt tester for model_type, loading the models on first use
+
+    model_type is the model the prompt was written for; prompts for models
+    that aren't loaded locally are tested on the default model.
+    """
+    if "default" not in LOADED_MODELS:
+        with _INIT_LOCK:
+            if "default" not in LOADED_MODELS:
+                initialize_models()
+    entry = LOADED_MODELS.get(model_type.lower().strip()) or LOADED_MODELS.get("default")
+    if entry is None:
+        raise RuntimeError(f"Model {MODEL_NAME} is not loaded")
+    return entry["tester"]
+
+
+def test_with_huggingface(prompt: str, model_type: str = "default",
+                          max_new_tokens: Optional[int] = None) -> str:
+    """
+    Run a prompt on the local test model and return its response
+
+    Args:
+        prompt: The prompt to test
+        model_type: The model the prompt was written for
+        max_new_tokens: Response length (default TEST_MAX_NEW_TOKENS)
+
+    Returns:
+        The generated response, without the prompt
+
+    Raises:
+        PromptTooLongError: If the prompt and response don't fit in the context
+    """
+    max_new_tokens = admission.test_max_new_tokens(max_new_tokens)
+    admission.check_test_prompt(prompt, max_new_tokens)
+    return get_tester(model_type).generate(prompt, max_new_tokens)
+
+
+def stream_test(prompt: str, model_type: str = "default", max_new_tokens: Optional[int] = None,
+                stop_event: Optional[threading.Event] = None) -> Iterator[Dict[str, str]]:
+    """Like test_with_huggingface, yielding {"token": ...} pieces and then {"result": ...}"""
+    max_new_tokens = admission.test_max_new_tokens(max_new_tokens)
+    admission.check_test_prompt(prompt, max_new_tokens)
+    return get_tester(model_type).stream(prompt, max_new_tokens, stop_event)
+
+
 def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Dict[str, Any]:
     """
     Evaluate a prompt's potential effectiveness
@@ -69,6 +152,10 @@ def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Di
     scores = {criterion: 0 for criterion in criteria}
     suggestions = []
 
+    # Find every keyword group in one pass over the prompt
+    vocabulary = keywords.get_vocabulary()
+    hits = vocabulary.matcher.match(prompt)
+
     # Evaluate clarity
     if "clarity" in criteria:
         # Check sentence structure
@@ -84,7 +171,7 @@ def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Di
     # Evaluate specificity
     if "specificity" in criteria:
         # Look for specific instructions
-        if any(word in prompt.lower() for word in ["specific", "exactly", "precisely"]):
+        if vocabulary.has(hits, "specificity"):
             scores["specificity"] = 0.9
         else:
             scores["specificity"] = 0.6
@@ -93,7 +180,7 @@ def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Di
     # Evaluate context
     if "context" in criteria:
         # Check if context is provided
-        if "context" in prompt.lower() or len(prompt.split()) > 30:
+        if vocabulary.has(hits, "context") or len(prompt.split()) > 30:
             scores["context"] = 0.8
         else:
             scores["context"] = 0.4
@@ -102,8 +189,7 @@ def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Di
     # Evaluate constraints
     if "constraints" in criteria:
         # Check if constraints or limitations are specified
-        constraint_words = ["limit", "constraint", "must", "should", "only", "don't"]
-        if any(word in prompt.lower() for word in constraint_words):
+        if vocabulary.has(hits, "constraints"):
             scores["constraints"] = 0.8
         else:
             scores["constraints"] = 0.5
@@ -117,3 +203,85 @@ def evaluate_prompt_effectiveness(prompt: str, criteria: List[str] = None) -> Di
         "overall_score": overall_score,
         "suggestions": suggestions
     }
+
+
+# Scores and suggestions per criterion as (passed, failed, suggestion on failure)
+_CRITERION_SCORES = {
+    "clarity": (0.9, 0.5, "Consider using shorter sentences for clarity."),
+    "specificity": (0.9, 0.6, "Add more specific instructions or examples."),
+    "context": (0.8, 0.4, "Add more context for better results."),
+    "constraints": (0.8, 0.5, "Consider adding constraints or limitations."),
+}
+
+
+def evaluate_prompts(prompts: List[str], criteria: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluate many prompts at once
+
+    Per-prompt features (word and sentence counts, keyword hits) are
+    collected into NumPy arrays and every criterion is scored as one
+    vectorized comparison. Results are identical to calling
+    evaluate_prompt_effectiveness on each prompt.
+
+    Args:
+        prompts: The prompts to evaluate
+        criteria: Specific criteria to evaluate (clarity, specificity, etc.)
+
+    Returns:
+        One evaluation dictionary per prompt, in input order
+    """
+    if criteria is None:
+        criteria = ["clarity", "specificity", "context", "constraints"]
+    criteria = list(dict.fromkeys(criteria))
+    if not criteria:
+        raise ValueError("At least one criterion is required")
+    n = len(prompts)
+    if n == 0:
+        return []
+
+    vocabulary = keywords.get_vocabulary()
+    hits = [vocabulary.matcher.match(prompt) for prompt in prompts]
+
+    # passed[criterion] is a boolean array over prompts
+    passed: Dict[str, np.ndarray] = {}
+    if "clarity" in criteria:
+        # Same as averaging len(s.split()) over prompt.split(".")
+        words_between_dots = np.fromiter((len(p.replace(".", " ").split()) for p in prompts), float, n)
+        sentence_counts = np.fromiter((p.count(".") + 1 for p in prompts), float, n)
+        passed["clarity"] = ~(words_between_dots / sentence_counts > 25)
+    if "specificity" in criteria:
+        passed["specificity"] = np.fromiter((vocabulary.has(h, "specificity") for h in hits), bool, n)
+    if "context" in criteria:
+        word_counts = np.fromiter((len(p.split()) for p in prompts), int, n)
+        has_context = np.fromiter((vocabulary.has(h, "context") for h in hits), bool, n)
+        passed["context"] = has_context | (word_counts > 30)
+    if "constraints" in criteria:
+        passed["constraints"] = np.fromiter((vocabulary.has(h, "constraints") for h in hits), bool, n)
+
+    score_columns = {}
+    for criterion in criteria:
+        if criterion in _CRITERION_SCORES:
+            good, bad, _ = _CRITERION_SCORES[criterion]
+            score_columns[criterion] = np.where(passed[criterion], good, bad)
+        else:
+            score_columns[criterion] = np.zeros(n, dtype=int)
+
+    # Add in criteria order so floating point results match the scalar sum
+    total = np.zeros(n)
+    for criterion in criteria:
+        total = total + score_columns[criterion]
+    overall = total / len(criteria)
+
+    columns = {criterion: score_columns[criterion].tolist() for criterion in criteria}
+    overall_list = overall.tolist()
+    suggestion_order = [c for c in _CRITERION_SCORES if c in criteria]
+    failed = {c: (~passed[c]).tolist() for c in suggestion_order}
+
+    results = []
+    for i in range(n):
+        results.append({
+            "scores": {criterion: columns[criterion][i] for criterion in criteria},
+            "overall_score": overall_list[i],
+            "suggestions": [_CRITERION_SCORES[c][2] for c in suggestion_order if failed[c][i]],
+        })
+    return results
@@ -1,36 +1,283 @@
+import os
 import re
-import json
-from typing import List, Dict, Any, Optional
-import spacy
-import nltk
-from nltk.tokenize import sent_tokenize
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer, util
-
-# Download necessary NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except:
-    spacy.cli.download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
-
-# Load prompt templates and best practices
-with open("data/prompt_templates.json", "r") as f:
-    PROMPT_TEMPLATES = json.load(f)
-
-with open("data/model_best_practices.json", "r") as f:
-    MODEL_BEST_PRACTICES = json.load(f)
-
-# Initialize models
-generator = pipeline("text-generation", model="gpt2")
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+
+import numpy as np
+
+import keywords
+import inference
+import admission
+import metrics
+import rules
+import template_store
+
+PROMPT_TEMPLATES_PATH = template_store.PROMPT_TEMPLATES_PATH
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Prompt templates and best practices live in the shared, hot-reloaded
+# template_store; PROMPT_TEMPLATES and MODEL_BEST_PRACTICES below resolve to
+# its current snapshot
+
+# Lazily loaded heavy components. Nothing here is imported or built until a
+# code path actually needs it, so generation-only workers never pay for them.
+_LOADED: Dict[str, Any] = {}
+# Re-entrant: some loaders load the components they depend on
+_LOAD_LOCK = threading.RLock()
+
+# Only noun chunks, POS tags, lemmas and sentence boundaries are used, so the
+# named-entity recognizer is never loaded
+SPACY_EXCLUDE = ["ner"]
+
+def _load_nlp():
+    """Load the spaCy English pipeline, downloading it if missing"""
+    import spacy
+    try:
+        return spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+    except OSError:
+        spacy.cli.download("en_core_web_sm")
+        return spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+
+def _load_punkt():
+    """Make sure the NLTK punkt tokenizer data is available"""
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
+    return True
+
+def _load_generator():
+    """Build the GPT-2 text-generation pipeline"""
+    from transformers import pipeline
+    return inference.prepare_pipeline(pipeline("text-generation", model="gpt2"))
+
+def _load_embedding_model():
+    """Load the MiniLM sentence embedding model"""
+    return inference.load_sentence_transformer(EMBEDDING_MODEL_NAME)
+
+def _load_template_index():
+    """Build (or open from disk) the normalized template embedding matrix"""
+    from template_index import TemplateEmbeddingIndex
+
+    def encode(texts: List[str]):
+        return get_model("embedding_model").encode(texts, convert_to_numpy=True)
+
+    # Quantized backends give slightly different vectors, so they get their own cache file
+    model_key = f"{EMBEDDING_MODEL_NAME}-{inference.INFERENCE_BACKEND}"
+    index = TemplateEmbeddingIndex(PROMPT_TEMPLATES_PATH, model_key, encode)
+    index.ensure_current()
+    return index
+
+def _load_generation_batcher():
+    """Put a micro-batching scheduler in front of the GPT-2 pipeline"""
+    from batching import MicroBatcher
+    return MicroBatcher("gpt2", get_model("generator"), context=inference.inference_mode)
+
+def _load_semantic_cache():
+    """Create the near-duplicate cache of GPT-2 rewrites"""
+    from semantic_cache import SemanticCache
+    return SemanticCache()
+
+MODEL_LOADERS: Dict[str, Callable[[], Any]] = {
+    "nlp": _load_nlp,
+    "punkt": _load_punkt,
+    "generator": _load_generator,
+    "embedding_model": _load_embedding_model,
+    "template_index": _load_template_index,
+    "generation_batcher": _load_generation_batcher,
+    "semantic_cache": _load_semantic_cache,
+}
+
+def get_model(name: str) -> Any:
+    """
+    Return a heavy component, loading it on first use
+
+    Args:
+        name: One of the keys of MODEL_LOADERS
+
+    Returns:
+        The loaded component (cached for the lifetime of the process)
+    """
+    model = _LOADED.get(name)
+    if model is not None:
+        return model
+    if name not in MODEL_LOADERS:
+        raise KeyError(f"Unknown model component: {name}")
+    with _LOAD_LOCK:
+        if name not in _LOADED:
+            logging.info(f"Loading optimizer component '{name}'...")
+            started = time.perf_counter()
+            _LOADED[name] = MODEL_LOADERS[name]()
+            metrics.MODEL_LOAD_SECONDS.set(name, value=time.perf_counter() - started)
+        return _LOADED[name]
+
+def is_loaded(name: str) -> bool:
+    """Whether a heavy component has already been loaded"""
+    return name in _LOADED
+
+def warm_up(names: Optional[List[str]] = None) -> None:
+    """Eagerly load the given components (all of them when names is None)"""
+    for name in names or list(MODEL_LOADERS):
+        get_model(name)
+
+def warm_up_from_env() -> None:
+    """Warm up the components listed in OPTIMIZER_WARMUP ("all" or comma-separated names)"""
+    value = os.getenv("OPTIMIZER_WARMUP", "").strip()
+    if not value:
+        return
+    if value.lower() == "all":
+        warm_up()
+    else:
+        warm_up([name.strip() for name in value.split(",") if name.strip()])
+
+def batching_stats() -> Dict[str, Any]:
+    """Histograms of the GPT-2 micro-batcher, if it has been started"""
+    if not is_loaded("generation_batcher"):
+        return {}
+    return {"gpt2": get_model("generation_batcher").stats()}
+
+def semantic_cache_stats() -> Dict[str, Any]:
+    """Hit rate and similarity distribution of the rewrite cache, if started"""
+    if not is_loaded("semantic_cache"):
+        return {}
+    return get_model("semantic_cache").stats()
+
+def sent_tokenize(text: str) -> List[str]:
+    """Sentence-split text with NLTK, fetching punkt on first use"""
+    get_model("punkt")
+    from nltk.tokenize import sent_tokenize as _nltk_sent_tokenize
+    return _nltk_sent_tokenize(text)
+
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "256"))
+# Prompts longer than this many estimated tokens are parsed and embedded in
+# sentence-aligned chunks (MiniLM truncates its input at 256 word pieces)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+
+class ParsedPrompt:
+    """
+    One prompt's NLP analysis, computed at most once and shared by every stage
 
+    NLTK sentences and the spaCy docs are each produced lazily on first
+    access, so the minimal path never parses and the balanced path never
+    runs spaCy. Long prompts are handled as sentence-aligned chunks of at
+    most CHUNK_TOKENS, with one spaCy doc per chunk.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._sentences: Optional[List[str]] = None
+        self._chunks: Optional[List[str]] = None
+        self._docs = None
+
+    @property
+    def sentences(self) -> List[str]:
+        if self._sentences is None:
+            with metrics.stage("sentence_split"):
+                self._sentences = sent_tokenize(self.text)
+        return self._sentences
+
+    @property
+    def chunks(self) -> List[str]:
+        if self._chunks is None:
+            if admission.estimate_tokens(self.text) <= CHUNK_TOKENS:
+                self._chunks = [self.text]
+            else:
+                self._chunks = admission.chunk_sentences(self.sentences, CHUNK_TOKENS)
+        return self._chunks
+
+    @property
+    def docs(self) -> list:
+        if self._docs is None:
+            parse_all([self])
+        return self._docs
+
+    @property
+    def key_phrases(self) -> List[str]:
+        return [chunk.text for doc in self.docs for chunk in doc.noun_chunks]
+
+    @property
+    def verbs(self) -> List[str]:
+        return [token.lemma_ for doc in self.docs for token in doc if token.pos_ == "VERB"]
+
+def parse_all(parsed: List[ParsedPrompt]) -> None:
+    """Parse the chunks of every not yet parsed prompt with one nlp.pipe call"""
+    todo = [p for p in parsed if p._docs is None]
+    if not todo:
+        return
+    nlp = get_model("nlp")
+    texts = [chunk for p in todo for chunk in p.chunks]
+    with metrics.stage("spacy_parse"):
+        docs = [nlp(texts[0])] if len(texts) == 1 else list(nlp.pipe(texts))
+    start = 0
+    for p in todo:
+        p._docs = docs[start:start + len(p.chunks)]
+        start += len(p.chunks)
+
+def embed_prompts(parsed: List[ParsedPrompt]) -> np.ndarray:
+    """
+    Embed prompts with one encode call
+
+    Prompts split into several chunks get the mean of their chunk
+    embeddings (normalized, weighted by chunk length).
+
+    Returns:
+        One embedding row per prompt
+    """
+    embedding_model = get_model("embedding_model")
+    texts, spans = [], []
+    for p in parsed:
+        spans.append((len(texts), len(texts) + len(p.chunks)))
+        texts.extend(p.chunks)
+    with metrics.stage("embedding"):
+        vectors = embedding_model.encode(texts, convert_to_numpy=True)
+    if len(texts) == len(parsed):
+        return vectors
+    pooled = np.empty((len(parsed), vectors.shape[1]), dtype=np.float32)
+    for row, (start, end) in enumerate(spans):
+        if end - start == 1:
+            pooled[row] = vectors[start]
+            continue
+        block = vectors[start:end]
+        block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        weights = np.array([admission.estimate_tokens(text) for text in texts[start:end]],
+                           dtype=np.float32)
+        pooled[row] = weights @ block / weights.sum()
+    return pooled
+
+_PARSE_CACHE: "OrderedDict[str, ParsedPrompt]" = OrderedDict()
+_PARSE_LOCK = threading.Lock()
+
+def parse_prompt(prompt: str) -> ParsedPrompt:
+    """Return the (cached) ParsedPrompt for a prompt, keyed by its hash"""
+    key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    with _PARSE_LOCK:
+        parsed = _PARSE_CACHE.get(key)
+        if parsed is not None:
+            _PARSE_CACHE.move_to_end(key)
+            return parsed
+        parsed = ParsedPrompt(prompt)
+        _PARSE_CACHE[key] = parsed
+        while len(_PARSE_CACHE) > PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
+        return parsed
+
+def __getattr__(name: str) -> Any:
+    # Keep `optimizer.nlp`, `optimizer.generator` and `optimizer.embedding_model`
+    # working for existing callers while deferring the actual load.
+    if name in ("nlp", "generator", "embedding_model"):
+        return get_model(name)
+    if name == "PROMPT_TEMPLATES":
+        return template_store.current().templates
+    if name == "MODEL_BEST_PRACTICES":
+        return template_store.current().practices
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@metrics.timed("generate_prompt")
 def generate_prompt(goal: str, target_model: str, context: str = None,
                    style: str = "detailed", formats: List[str] = ["standard"]) -> str:
     """
@@ -47,46 +294,20 @@ def generate_prompt(goal: str, target_model: str, context: str = None,
         A generated prompt optimized for the target model
     """
     target_model = target_model.lower().strip()
-    template = PROMPT_TEMPLATES.get(target_model, PROMPT_TEMPLATES["default"])
-    practices = MODEL_BEST_PRACTICES.get(target_model, MODEL_BEST_PRACTICES["default"])
-
-    components = []
-
-    if "persona" in formats:
-        components.append(f"As an expert {extract_domain(goal)},")
-    components.append(goal)
-    if context:
-        components.append(f"Context: {context}")
-    if style == "detailed":
-        components.append(practices["detailed_format"])
-    elif style == "step-by-step":
-        components.append(practices["step_instructions"])
-    elif style == "concise":
-        components.append(practices["concise_format"])
-
-    prompt = f"{template['prefix']} {' '.join(components)}"
-    if "constraints" in formats:
-        prompt += f"\n\n{practices['constraints']}"
-    if "examples" in formats:
-        prompt += f"\n\n{practices['example_format']}"
-    prompt += template["suffix"]
-
-    prompt = re.sub(r'\s+', ' ', prompt).strip()
-    prompt = prompt.replace(" .", ".").replace(" ,", ",")
-
-    return prompt
-
-def _optimize_minimal(prompt: str) -> str:
-    """Clean up and add minimal formatting."""
-    return clean_prompt(prompt)
-
-def _optimize_balanced(prompt: str, practices: Dict[str, str]) -> str:
+    domain = extract_domain(goal) if "persona" in formats else None
+    # The template, style and formats are precompiled; only the request
+    # values are substituted here
+    return template_store.current().render(target_model, goal, context, style, formats, domain)
+
+def _optimize_balanced(prompt: str, practices: Dict[str, str],
+                       parsed: Optional[ParsedPrompt] = None) -> str:
     """Restructure and enhance the prompt."""
-    return enhance_prompt_structure(prompt, practices)
+    return enhance_prompt_structure(prompt, practices, parsed)
 
-def _optimize_maximum(prompt: str, target_model: str, practices: Dict[str, str]) -> str:
+def _optimize_maximum(prompt: str, target_model: str, practices: Dict[str, str],
+                      parsed: Optional[ParsedPrompt] = None) -> str:
     """Completely rewrite the prompt with model-specific optimizations."""
-    return rewrite_prompt(prompt, target_model, practices)
+    return rewrite_prompt(prompt, target_model, practices, parsed)
 
 def optimize_prompt(prompt: str, target_model: str, optimization_level: str = "balanced") -> str:
     """
@@ -95,103 +316,197 @@ def optimize_prompt(prompt: str, target_model: str, optimization_level: str = "b
     Args:
         prompt: The existing prompt to optimize
         target_model: The target AI model
-        optimization_level: How aggressively to optimize (minimal, balanced, maximum)
+        optimization_level: How aggressively to optimize (minimal, fast, balanced, maximum)
 
     Returns:
         An optimized version of the prompt
+
+    Raises:
+        admission.PromptTooLongError: If the prompt is over the level's size limit
     """
-    doc = nlp(prompt)
+    if optimization_level in rules.RULE_LEVELS:
+        # minimal and fast need no model (see rules.py)
+        return rules.optimize_prompt(prompt, target_model, optimization_level)
+    admission.check_prompt(prompt, optimization_level)
     target_model = target_model.lower().strip()
-    practices = MODEL_BEST_PRACTICES.get(target_model, MODEL_BEST_PRACTICES["default"])
-    sentences = sent_tokenize(prompt)
+    practices = template_store.current().practices_for(target_model)
 
-    if optimization_level == "minimal":
-        optimized = _optimize_minimal(prompt)
-    elif optimization_level == "balanced":
-        optimized = _optimize_balanced(prompt, practices)
-    else:  # maximum
-        optimized = _optimize_maximum(prompt, target_model, practices)
+    with metrics.stage(f"optimize_{optimization_level}"):
+        if optimization_level == "balanced":
+            optimized = _optimize_balanced(prompt, practices, parse_prompt(prompt))
+        else:  # maximum
+            optimized = _optimize_maximum(prompt, target_model, practices, parse_prompt(prompt))
 
     return optimized
 
-def clean_prompt(prompt: str) -> str:
-    """Clean and format a prompt with minimal changes"""
-    # Remove excessive whitespace
-    cleaned = re.sub(r'\s+', ' ', prompt).strip()
-
-    # Fix basic punctuation issues
-    cleaned = re.sub(r'\s([,.!?;:])', r'\1', cleaned)
-
-    # Ensure the prompt ends with a clear instruction or question
-    if not re.search(r'[.!?]$', cleaned):
-        cleaned += "."
-
-    return cleaned
-
-def enhance_prompt_structure(prompt: str, practices: Dict[str, str]) -> str:
-    """Enhance prompt structure while preserving core content"""
-    sentences = sent_tokenize(prompt)
+def stream_rewrite(prompt: str, target_model: str,
+                   stop_event: Optional[threading.Event] = None) -> Iterator[Dict[str, str]]:
+    """
+    Rewrite a prompt with GPT-2, yielding text as it is generated
 
-    # Identify parts of the prompt
-    intro_part = sentences[0] if sentences else ""
-    body_parts = sentences[1:-1] if len(sentences) > 2 else sentences[1:] if len(sentences) > 1 else []
-    conclusion_part = sentences[-1] if len(sentences) > 1 else ""
+    Generation runs in a background thread and stops early once stop_event
+    is set (e.g. when the client disconnects).
 
-    # Enhance introduction with clear role/task
-    if not re.search(r'(you are|act as|as an?|assume the role)', intro_part.lower()):
-        domain = extract_domain(prompt)
-        enhanced_intro = f"As a specialized {domain} expert, {intro_part}"
-    else:
-        enhanced_intro = intro_part
-
-    # Enhance body with structure markers
-    enhanced_body = []
-    for i, part in enumerate(body_parts):
-        if len(part) > 100 and "," in part:  # Long complex sentence
-            subparts = part.split(", ")
-            if len(subparts) > 2:
-                # Convert to bullet points
-                enhanced_body.append(f"Key points:")
-                enhanced_body.extend([f"- {subpart.strip()}" for subpart in subparts])
-                continue
-        enhanced_body.append(part)
+    Args:
+        prompt: The existing prompt to rewrite
+        target_model: The target AI model
+        stop_event: Set it to abort generation
 
-    # Enhance conclusion with clear output expectations
-    if not re.search(r'(please provide|i need|output format|format your response)', conclusion_part.lower()):
-        enhanced_conclusion = f"{conclusion_part} {practices['output_format']}"
-    else:
-        enhanced_conclusion = conclusion_part
+    Yields:
+        {"token": text} pieces while generating, then a final
+        {"optimized_prompt": text} identical in form to rewrite_prompt's result
+    """
+    from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 
-    # Combine enhanced parts
-    result = f"{enhanced_intro} {' '.join(enhanced_body)} {enhanced_conclusion}"
+    target_model = target_model.lower().strip()
+    practices = template_store.current().practices_for(target_model)
+    generator = get_model("generator")
+    stop_event = stop_event or threading.Event()
+
+    class _StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return stop_event.is_set()
+
+    generation_prompt = _generation_prompt(prompt, target_model)
+    inputs = generator.tokenizer(generation_prompt, return_tensors="pt")
+    streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors: List[Exception] = []
+
+    def generate():
+        try:
+            with inference.inference_mode():
+                generator.model.generate(
+                    **inputs,
+                    max_new_tokens=admission.GENERATION_MAX_NEW_TOKENS,
+                    do_sample=True,
+                    pad_token_id=generator.tokenizer.eos_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopOnEvent()]),
+                )
+        except Exception as e:
+            # Unblock the consumer below, which re-raises the error
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=generate, daemon=True)
+    thread.start()
+
+    generated = []
+    try:
+        for text in streamer:
+            if stop_event.is_set():
+                break
+            if text:
+                generated.append(text)
+                yield {"token": text}
+    finally:
+        stop_event.set()
+    if errors:
+        raise errors[0]
+
+    final = _finish_rewrite(generation_prompt + "".join(generated), practices)
+    # Send whatever the formatting step appended as one more token
+    streamed = "".join(generated).split("Optimized version:")[-1].strip()
+    if final.startswith(streamed) and len(final) > len(streamed):
+        yield {"token": final[len(streamed):]}
+    yield {"optimized_prompt": final}
+
+def _run_each(func: Callable[..., Any], items: List[Dict[str, Any]]) -> List[Any]:
+    """Call func per item, capturing the exception of any item that fails"""
+    results = []
+    for item in items:
+        try:
+            results.append(func(**item))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def _optimize_args(item: Dict[str, Any]) -> Tuple[str, str, str]:
+    """The prompt, target model and level of an optimize_prompts item"""
+    args = (item.get("prompt"), item.get("target_model"), item.get("optimization_level", "balanced"))
+    for name, value in zip(("prompt", "target_model", "optimization_level"), args):
+        if not isinstance(value, str):
+            raise ValueError(f"'{name}' must be a string, not {type(value).__name__}")
+    return args
+
+def generate_prompts(requests: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Generate prompts for a batch of requests
 
-    # Add optimization hint based on target model
-    result += f"\n\n{practices['optimization_hint']}"
+    Args:
+        requests: Keyword arguments for generate_prompt, one dict per prompt
 
-    return result
+    Returns:
+        The generated prompt for each request, or the exception it raised,
+        in input order
+    """
+    return _run_each(generate_prompt, requests)
 
-def rewrite_prompt(prompt: str, target_model: str, practices: Dict[str, str]) -> str:
-    """Completely rewrite a prompt for optimal results"""
-    # Extract core intent and key concepts
-    doc = nlp(prompt)
-    key_phrases = [chunk.text for chunk in doc.noun_chunks]
-    verbs = [token.lemma_ for token in doc if token.pos_ == "VERB"]
+def optimize_prompts(requests: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Optimize a batch of prompts
 
-    # Use embedding model to find most similar template
-    prompt_embedding = embedding_model.encode(prompt, convert_to_tensor=True)
+    Minimal, fast and balanced items are handled one by one (they are cheap);
+    maximum items are rewritten together through rewrite_prompts. If the
+    batched rewrite fails, maximum items fall back to one call each so a
+    single bad prompt only fails its own slot.
 
-    template_texts = list(PROMPT_TEMPLATES.keys())
-    template_embeddings = embedding_model.encode(template_texts, convert_to_tensor=True)
+    Args:
+        requests: Keyword arguments for optimize_prompt, one dict per prompt
 
-    similarities = util.pytorch_cos_sim(prompt_embedding, template_embeddings)[0]
-    best_template_idx = similarities.argmax().item()
-    template = PROMPT_TEMPLATES[template_texts[best_template_idx]]
+    Returns:
+        The optimized prompt for each request, or the exception it raised,
+        in input order
+    """
+    results: List[Any] = [None] * len(requests)
+    rewrite_idx, prompts, target_models, practices = [], [], [], []
+    store = template_store.current()
+    for i, item in enumerate(requests):
+        # Anything wrong with one item (missing or mistyped fields, size) fails only its slot
+        try:
+            prompt, target_model, level = _optimize_args(item)
+            if level in rules.RULE_LEVELS + ("balanced",):
+                results[i] = optimize_prompt(prompt, target_model, level)
+                continue
+            admission.check_prompt(prompt, level)
+            target_model = target_model.lower().strip()
+            practices.append(store.practices_for(target_model))
+        except Exception as e:
+            results[i] = e
+            continue
+        rewrite_idx.append(i)
+        prompts.append(prompt)
+        target_models.append(target_model)
+
+    if rewrite_idx:
+        try:
+            rewritten = rewrite_prompts(prompts, target_models, practices)
+        except Exception:
+            logging.exception("Batched rewrite failed, retrying items one by one")
+            rewritten = _run_each(optimize_prompt, [
+                {"prompt": prompt, "target_model": model, "optimization_level": requests[i].get(
+                    "optimization_level", "balanced")}
+                for i, prompt, model in zip(rewrite_idx, prompts, target_models)])
+        for i, result in zip(rewrite_idx, rewritten):
+            results[i] = result
+
+    return results
+
+# The rule-only steps are shared with the slim fast_server.py workers
+clean_prompt = rules.clean_prompt
+extract_domain = rules.extract_domain
+
+def enhance_prompt_structure(prompt: str, practices: Dict[str, str],
+                             parsed: Optional[ParsedPrompt] = None) -> str:
+    """Enhance prompt structure while preserving core content"""
+    return rules.restructure(prompt, (parsed or parse_prompt(prompt)).sentences, practices)
 
-    # Generate new prompt using transformer pipeline
-    # This is just a placeholder - in a real app you'd use a more sophisticated approach
-    generation_prompt = f"Rewrite this prompt for {target_model}: {prompt}\n\nOptimized version:"
-    generated = generator(generation_prompt, max_length=150, num_return_sequences=1)[0]['generated_text']
+def _generation_prompt(prompt: str, target_model: str) -> str:
+    """Build the GPT-2 instruction used to rewrite a prompt"""
+    return f"Rewrite this prompt for {target_model}: {prompt}\n\nOptimized version:"
 
+def _finish_rewrite(generated: str, practices: Dict[str, str]) -> str:
+    """Extract the rewritten part of a generation and apply model formatting"""
     # Extract the generated part
     rewritten = generated.split("Optimized version:")[-1].strip()
 
@@ -202,24 +517,77 @@ def rewrite_prompt(prompt: str, target_model: str, practices: Dict[str, str]) ->
 
     return rewritten
 
-def extract_domain(text: str) -> str:
-    """Extract likely domain/field from text"""
-    # Define common domains
-    domains = ["AI", "machine learning", "data science", "marketing", "business", "writing",
-               "programming", "development", "design", "research", "teaching", "academic",
-               "engineering", "healthcare", "technology", "science", "communication"]
-
-    # Check for explicit domain mentions
-    for domain in domains:
-        if domain.lower() in text.lower():
-            return domain
-
-    # Default domains based on common words
-    if any(word in text.lower() for word in ["code", "programming", "algorithm", "software", "developer"]):
-        return "software engineering"
-    elif any(word in text.lower() for word in ["write", "essay", "blog", "article", "content"]):
-        return "content creation"
-    elif any(word in text.lower() for word in ["analyze", "research", "study", "investigate"]):
-        return "analytical research"
-    else:
-        return "AI assistant"
+def _rewrite_scope(target_model: str, practices: Dict[str, str]) -> str:
+    """Semantic cache scope of a rewrite: its target model and the format text
+    _finish_rewrite appends, so edited best practices never reuse stale rewrites"""
+    return f"{target_model}\0{practices['detailed_format']}"
+
+def rewrite_prompt(prompt: str, target_model: str, practices: Dict[str, str],
+                   parsed: Optional[ParsedPrompt] = None) -> str:
+    """Completely rewrite a prompt for optimal results"""
+    semantic_cache = get_model("semantic_cache")
+    parsed = parsed or parse_prompt(prompt)
+
+    # Paraphrases of an already rewritten prompt reuse its rewrite
+    prompt_embedding = embed_prompts([parsed])[0]
+    scope = _rewrite_scope(target_model, practices)
+    with metrics.stage("semantic_cache"):
+        cached = semantic_cache.lookup(prompt_embedding, scope)
+    if cached is not None:
+        return cached
+
+    # Generate new prompt using transformer pipeline
+    # This is just a placeholder - in a real app you'd use a more sophisticated approach
+    generator = get_model("generation_batcher")
+    generation_prompt = _generation_prompt(prompt, target_model)
+    with metrics.stage("generation"):
+        generated = generator.generate(generation_prompt, max_new_tokens=admission.GENERATION_MAX_NEW_TOKENS,
+                                       num_return_sequences=1)[0]['generated_text']
+
+    rewritten = _finish_rewrite(generated, practices)
+    semantic_cache.add(prompt_embedding, scope, rewritten)
+    return rewritten
+
+def rewrite_prompts(prompts: List[str], target_models: List[str],
+                    practices: List[Dict[str, str]]) -> List[str]:
+    """
+    Rewrite several prompts with one pass of each model
+
+    All prompts are embedded with a single encode call and GPT-2 generates
+    for the whole list in one padded batch.
+
+    Args:
+        prompts: The prompts to rewrite
+        target_models: The target model of each prompt
+        practices: The best practices of each prompt's target model
+
+    Returns:
+        The rewritten prompts, in input order
+    """
+    if not prompts:
+        return []
+    batcher = get_model("generation_batcher")
+    semantic_cache = get_model("semantic_cache")
+
+    # One encode call for every prompt; paraphrases of earlier prompts are
+    # answered from the semantic cache and skip generation
+    prompt_embeddings = embed_prompts([parse_prompt(prompt) for prompt in prompts])
+    scopes = [_rewrite_scope(model, p) for model, p in zip(target_models, practices)]
+    with metrics.stage("semantic_cache"):
+        results: List[Optional[str]] = [semantic_cache.lookup(embedding, scope)
+                                        for embedding, scope in zip(prompt_embeddings, scopes)]
+    todo = [i for i, result in enumerate(results) if result is None]
+    if not todo:
+        return results
+
+    generation_prompts = [_generation_prompt(prompts[i], target_models[i]) for i in todo]
+    with metrics.stage("generation"):
+        # Already one batch: run it directly, under the batcher's inference_mode()
+        outputs = batcher.run_batch(generation_prompts,
+                                    max_new_tokens=admission.GENERATION_MAX_NEW_TOKENS,
+                                    num_return_sequences=1)
+
+    for i, output in zip(todo, outputs):
+        results[i] = _finish_rewrite(output[0]['generated_text'], practices[i])
+        semantic_cache.add(prompt_embeddings[i], scopes[i], results[i])
+    return results
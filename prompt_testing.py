@@ -0,0 +1,280 @@
+import os
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import inference
+from batching import MicroBatcher
+
+# Total prompt tokens whose attention keys/values are kept for reuse (0 disables).
+# phi-1_5 needs about 0.4 MB per cached token in fp32.
+PREFIX_CACHE_TOKENS = int(os.getenv("PREFIX_CACHE_TOKENS", "2048"))
+# Shorter shared prefixes are recomputed rather than copied out of the cache
+PREFIX_CACHE_MIN_TOKENS = int(os.getenv("PREFIX_CACHE_MIN_TOKENS", "16"))
+
+TokenIds = Tuple[int, ...]
+
+
+def _common_prefix(a: TokenIds, b: TokenIds, limit: int) -> int:
+    n = min(len(a), len(b), limit)
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class PrefixCache:
+    """
+    LRU of attention key/value caches for the token prefixes of tested prompts
+
+    A prompt reuses the entry sharing its longest token prefix, so re-testing
+    a prompt, or a variant that keeps its opening (template prefix, persona,
+    goal), only runs the model over the tokens that differ. Entries are
+    bounded by their total token count since memory grows with it.
+    """
+
+    def __init__(self, max_tokens: int = PREFIX_CACHE_TOKENS,
+                 min_tokens: int = PREFIX_CACHE_MIN_TOKENS):
+        self.max_tokens = max_tokens
+        self.min_tokens = max(1, min_tokens)
+        self.tokens = 0
+        self._entries: "OrderedDict[TokenIds, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def lookup(self, ids: TokenIds) -> Tuple[int, Optional[Any]]:
+        """
+        Find the cached prefix shared with ids
+
+        At least the last token of ids is left uncached so generation has an
+        input to start from. Returns (shared length, key/value cache), or
+        (0, None) when nothing of at least min_tokens is shared. The returned
+        cache may cover more than the shared length and must be copied before
+        use.
+        """
+        with self._lock:
+            best_length, best_key = self._longest(ids)
+            if best_length < self.min_tokens:
+                self.misses += 1
+                return 0, None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.reused_tokens += best_length
+            return best_length, self._entries[best_key]
+
+    def shared(self, ids: TokenIds) -> int:
+        """Length lookup() would reuse for ids, without counting a lookup"""
+        with self._lock:
+            length, _ = self._longest(ids)
+        return length if length >= self.min_tokens else 0
+
+    def _longest(self, ids: TokenIds) -> Tuple[int, Optional[TokenIds]]:
+        best_length, best_key = 0, None
+        for key in self._entries:
+            length = _common_prefix(key, ids, len(ids) - 1)
+            if length > best_length:
+                best_length, best_key = length, key
+        return best_length, best_key
+
+    def store(self, ids: TokenIds, past_key_values: Any) -> bool:
+        """Keep past_key_values for ids, evicting the least recently used entries"""
+        if len(ids) < self.min_tokens or len(ids) > self.max_tokens:
+            return False
+        with self._lock:
+            if ids in self._entries:
+                self._entries.move_to_end(ids)
+                return False
+            self._entries[ids] = past_key_values
+            self.tokens += len(ids)
+            while self.tokens > self.max_tokens:
+                key, _ = self._entries.popitem(last=False)
+                self.tokens -= len(key)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "reused_tokens": self.reused_tokens,
+        }
+
+
+class PromptTester:
+    """
+    Runs prompts on a causal language model to show how it responds
+
+    Concurrent generate() calls are collected by a MicroBatcher. In each
+    batch, identical prompts are generated once (decoding is greedy, so they
+    would get the same response); prompts with a cached prefix prefill only
+    their new tokens from a copy of that cache; the remaining prompts run as
+    one left-padded batch, or, when only one is left, through the prefix
+    cache so that it can be reused next time.
+    """
+
+    def __init__(self, name: str, model: Any, tokenizer: Any,
+                 cache_tokens: int = PREFIX_CACHE_TOKENS):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        self.prefix_cache = PrefixCache(cache_tokens)
+        self._use_prefix_cache = cache_tokens > 0
+        self.batcher = MicroBatcher(f"{name}_test", self._generate_batch,
+                                    context=inference.inference_mode)
+
+    def generate(self, prompt: str, max_new_tokens: int) -> str:
+        """Return the model's response to prompt (without the prompt itself)"""
+        return self.batcher.generate(prompt, max_new_tokens=max_new_tokens)
+
+    def _encode(self, prompt: str) -> List[int]:
+        return self.tokenizer(prompt)["input_ids"]
+
+    def _prefill(self, ids: List[int]) -> Optional[Any]:
+        """
+        Key/value cache covering all but the last token of ids
+
+        Starts from the longest cached prefix and runs the model over the
+        rest; the result is stored for later prompts. Returns None when the
+        prefix cache is off or unsupported by the model.
+        """
+        if not self._use_prefix_cache or len(ids) <= self.prefix_cache.min_tokens:
+            return None
+        import torch
+        try:
+            from transformers import DynamicCache
+
+            head = tuple(ids[:-1])
+            length, cached = self.prefix_cache.lookup(tuple(ids))
+            if cached is None:
+                past_key_values = DynamicCache()
+            else:
+                past_key_values = copy.deepcopy(cached)
+                if past_key_values.get_seq_length() > length:
+                    past_key_values.crop(length)
+            if len(head) > length:
+                with inference.inference_mode():
+                    self.model(input_ids=torch.tensor([head[length:]]),
+                               past_key_values=past_key_values, use_cache=True)
+            if self.prefix_cache.store(head, past_key_values):
+                # The stored cache must not be extended by generation
+                past_key_values = copy.deepcopy(past_key_values)
+            return past_key_values
+        except Exception as e:
+            logging.warning(f"Prefix caching is not supported by {self.name}, disabling it: {e}")
+            self._use_prefix_cache = False
+            self.prefix_cache.clear()
+            return None
+
+    def _generate_ids(self, ids: List[int], max_new_tokens: int, **kwargs) -> str:
+        import torch
+
+        past_key_values = self._prefill(ids)
+        input_ids = torch.tensor([ids])
+        if past_key_values is not None:
+            kwargs["past_key_values"] = past_key_values
+        with inference.inference_mode():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **kwargs,
+            )
+        return self.tokenizer.decode(output[0, len(ids):], skip_special_tokens=True)
+
+    def _generate_padded(self, prompts: List[str], max_new_tokens: int) -> List[str]:
+        # Decoder-only models must be padded on the left to continue the prompt
+        self.tokenizer.padding_side = "left"
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        output = self.model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        width = inputs["input_ids"].shape[1]
+        return self.tokenizer.batch_decode(output[:, width:], skip_special_tokens=True)
+
+    def _generate_batch(self, prompts: List[str], batch_size: int, max_new_tokens: int) -> List[str]:
+        # Called by the MicroBatcher thread, already inside inference_mode()
+        responses: Dict[str, str] = {}
+        uncached: List[str] = []
+        for prompt in dict.fromkeys(prompts):
+            ids = self._encode(prompt)
+            if self._use_prefix_cache and self.prefix_cache.shared(tuple(ids)):
+                responses[prompt] = self._generate_ids(ids, max_new_tokens)
+            else:
+                uncached.append(prompt)
+        if len(uncached) == 1:
+            responses[uncached[0]] = self._generate_ids(self._encode(uncached[0]), max_new_tokens)
+        elif uncached:
+            responses.update(zip(uncached, self._generate_padded(uncached, max_new_tokens)))
+        return [responses[prompt] for prompt in prompts]
+
+    def stream(self, prompt: str, max_new_tokens: int,
+               stop_event: Optional[threading.Event] = None) -> Iterator[Dict[str, str]]:
+        """
+        Generate a response, yielding text as it is generated
+
+        Streams are not batched, but use the prefix cache like generate().
+        Generation stops early once stop_event is set.
+
+        Yields:
+            {"token": text} pieces while generating, then {"result": text}
+            with the whole response
+        """
+        from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+        stop_event = stop_event or threading.Event()
+
+        class _StopOnEvent(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return stop_event.is_set()
+
+        ids = self._encode(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors: List[Exception] = []
+
+        def generate():
+            try:
+                self._generate_ids(ids, max_new_tokens, streamer=streamer,
+                                   stopping_criteria=StoppingCriteriaList([_StopOnEvent()]))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+
+        generated = []
+        try:
+            for text in streamer:
+                if stop_event.is_set():
+                    break
+                if text:
+                    generated.append(text)
+                    yield {"token": text}
+        finally:
+            stop_event.set()
+        if errors:
+            raise errors[0]
+        yield {"result": "".join(generated)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"prefix_cache": self.prefix_cache.stats(), "batching": self.batcher.stats()}
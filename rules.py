@@ -0,0 +1,171 @@
+"""
+Rule-only prompt optimization
+
+The minimal and fast optimization levels need only regexes, the keyword
+vocabulary and the templates' best practices. This module imports nothing
+that loads a model, so fast_server.py can serve these levels from workers
+that never import torch, transformers or spaCy. optimizer.py uses the same
+functions for its balanced level.
+"""
+import os
+import re
+from typing import Any, Dict, List
+
+import admission
+import keywords
+import metrics
+import template_store
+
+# Levels that run without any model: minimal cleans the prompt, fast
+# restructures it like balanced but splits sentences with a regex
+RULE_LEVELS = ("minimal", "fast")
+
+# Rule-only prompts up to this many estimated tokens are optimized directly
+# on the API's event loop instead of going through the thread pool and cache
+RULES_INLINE_TOKENS = int(os.getenv("RULES_INLINE_TOKENS", "4000"))
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e",
+    "cf", "al", "approx", "fig", "no", "vol", "inc", "ltd", "co", "corp", "dept",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+# A word, its end punctuation and any closing quotes or brackets, followed
+# by whitespace and something that can start a sentence
+SENTENCE_END_RE = re.compile(r"""(\S*?)([.!?]+)["')\]]*(?=\s+["'(\[]?[A-Z0-9])""")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences with one regex pass (a fast stand-in for NLTK punkt)
+
+    A sentence ends at ".", "!" or "?" followed by whitespace and a capital
+    letter, digit or opening quote, unless the period follows a known
+    abbreviation or a single-letter initial.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_RE.finditer(text):
+        word = match.group(1).lstrip("\"'([").lower()
+        if match.group(2) == "." and (word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())):
+            continue
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+@metrics.timed("clean")
+def clean_prompt(prompt: str) -> str:
+    """Clean and format a prompt with minimal changes"""
+    # Remove excessive whitespace
+    cleaned = re.sub(r'\s+', ' ', prompt).strip()
+
+    # Fix basic punctuation issues
+    cleaned = re.sub(r'\s([,.!?;:])', r'\1', cleaned)
+
+    # Ensure the prompt ends with a clear instruction or question
+    if not re.search(r'[.!?]$', cleaned):
+        cleaned += "."
+
+    return cleaned
+
+
+def extract_domain(text: str) -> str:
+    """Extract likely domain/field from text"""
+    # Domains and fallback keywords live in data/keywords.json and are
+    # matched on word boundaries in a single pass
+    with metrics.stage("domain"):
+        return keywords.get_vocabulary().domain(text)
+
+
+@metrics.timed("restructure")
+def restructure(prompt: str, sentences: List[str], practices: Dict[str, str]) -> str:
+    """Enhance prompt structure while preserving core content"""
+    # Identify parts of the prompt
+    intro_part = sentences[0] if sentences else ""
+    body_parts = sentences[1:-1] if len(sentences) > 2 else sentences[1:] if len(sentences) > 1 else []
+    conclusion_part = sentences[-1] if len(sentences) > 1 else ""
+
+    # Enhance introduction with clear role/task
+    if not re.search(r'(you are|act as|as an?|assume the role)', intro_part.lower()):
+        domain = extract_domain(prompt)
+        enhanced_intro = f"As a specialized {domain} expert, {intro_part}"
+    else:
+        enhanced_intro = intro_part
+
+    # Enhance body with structure markers
+    enhanced_body = []
+    for i, part in enumerate(body_parts):
+        if len(part) > 100 and "," in part:  # Long complex sentence
+            subparts = part.split(", ")
+            if len(subparts) > 2:
+                # Convert to bullet points
+                enhanced_body.append(f"Key points:")
+                enhanced_body.extend([f"- {subpart.strip()}" for subpart in subparts])
+                continue
+        enhanced_body.append(part)
+
+    # Enhance conclusion with clear output expectations
+    if not re.search(r'(please provide|i need|output format|format your response)', conclusion_part.lower()):
+        enhanced_conclusion = f"{conclusion_part} {practices['output_format']}"
+    else:
+        enhanced_conclusion = conclusion_part
+
+    # Combine enhanced parts
+    result = f"{enhanced_intro} {' '.join(enhanced_body)} {enhanced_conclusion}"
+
+    # Add optimization hint based on target model
+    result += f"\n\n{practices['optimization_hint']}"
+
+    return result
+
+
+def optimize_prompt(prompt: str, target_model: str, optimization_level: str = "fast") -> str:
+    """
+    Optimize a prompt at one of the rule-only levels
+
+    Args:
+        prompt: The existing prompt to optimize
+        target_model: The target AI model
+        optimization_level: "minimal" or "fast"
+
+    Returns:
+        An optimized version of the prompt
+
+    Raises:
+        ValueError: If the level needs a model
+        admission.PromptTooLongError: If the prompt is over the level's size limit
+    """
+    if optimization_level not in RULE_LEVELS:
+        raise ValueError(f"Optimization level {optimization_level!r} is not rule-only, "
+                         f"use one of {', '.join(RULE_LEVELS)}")
+    admission.check_prompt(prompt, optimization_level)
+    with metrics.stage(f"optimize_{optimization_level}"):
+        if optimization_level == "minimal":
+            return clean_prompt(prompt)
+        practices = template_store.current().practices_for(target_model.lower().strip())
+        with metrics.stage("sentence_split"):
+            sentences = split_sentences(prompt)
+        return restructure(prompt, sentences, practices)
+
+
+def optimize_prompts(requests: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Optimize a batch of prompts at rule-only levels
+
+    Returns:
+        The optimized prompt for each request, or the exception it raised,
+        in input order
+    """
+    results = []
+    for item in requests:
+        try:
+            results.append(optimize_prompt(**item))
+        except Exception as e:
+            results.append(e)
+    return results
@@ -0,0 +1,140 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import Histogram
+from template_index import normalize_rows
+
+# Rows kept per process (0 disables the cache) and the cosine similarity a
+# new prompt needs to reuse a stored rewrite
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Rows upcast to float32 at a time during a lookup (NumPy has no fast
+# float16 matrix product)
+LOOKUP_BLOCK_ROWS = 4096
+
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99, 1.0)
+
+
+class SemanticCache:
+    """
+    Reuse rewrites of prompts that are paraphrases of earlier ones
+
+    Embeddings are stored as a preallocated float16 matrix, so a lookup is
+    one matrix-vector product over at most max_size rows. Rows are scoped
+    (e.g. to a target model and the best practices the output was built
+    with) and evicted least-recently-used once the matrix is full. A scope
+    is forgotten with its last row, so client-chosen scopes cannot grow the
+    cache past max_size entries.
+    """
+
+    def __init__(self, max_size: int = SEMANTIC_CACHE_SIZE,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._matrix: Optional[np.ndarray] = None
+        self._scopes = np.full(max(max_size, 0), -1, dtype=np.int32)
+        self._last_used = np.zeros(max(max_size, 0), dtype=np.int64)
+        self._outputs = [None] * max(max_size, 0)
+        self._scope_ids: Dict[str, int] = {}
+        self._scope_names: Dict[int, str] = {}
+        self._scope_rows: Dict[int, int] = {}
+        self._free_scope_ids: List[int] = []
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similarities = Histogram("semantic_cache_similarity",
+                                      "Best cosine similarity found per lookup",
+                                      SIMILARITY_BUCKETS)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _take_scope(self, scope: str) -> int:
+        """The id of scope, counting one more row in it"""
+        scope_id = self._scope_ids.get(scope)
+        if scope_id is None:
+            scope_id = self._free_scope_ids.pop() if self._free_scope_ids else len(self._scope_ids)
+            self._scope_ids[scope] = scope_id
+            self._scope_names[scope_id] = scope
+            self._scope_rows[scope_id] = 0
+        self._scope_rows[scope_id] += 1
+        return scope_id
+
+    def _release_scope(self, scope_id: int) -> None:
+        """Count one row less in a scope, forgetting the scope with its last row"""
+        self._scope_rows[scope_id] -= 1
+        if self._scope_rows[scope_id] == 0:
+            del self._scope_rows[scope_id]
+            del self._scope_ids[self._scope_names.pop(scope_id)]
+            self._free_scope_ids.append(scope_id)
+
+    def lookup(self, embedding: np.ndarray, scope: str) -> Optional[Any]:
+        """Return the stored output of the closest prompt in scope if it passes the threshold"""
+        if not self.enabled:
+            return None
+        query = normalize_rows(embedding)
+        with self._lock:
+            self._clock += 1
+            scope_id = self._scope_ids.get(scope)
+            best, score = self._best_match(query, scope_id) if scope_id is not None else (None, 0.0)
+            if best is not None:
+                self.similarities.observe(score)
+            if best is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[best] = self._clock
+            return self._outputs[best]
+
+    def _best_match(self, query: np.ndarray, scope_id: int) -> Tuple[Optional[int], float]:
+        if self._size == 0:
+            return None, 0.0
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, LOOKUP_BLOCK_ROWS):
+            block = self._matrix[start:min(start + LOOKUP_BLOCK_ROWS, self._size)]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        scores = np.where(self._scopes[:self._size] == scope_id, scores, -np.inf)
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return None, 0.0
+        return best, float(scores[best])
+
+    def add(self, embedding: np.ndarray, scope: str, output: Any) -> None:
+        """Store an output, evicting the least recently used row when full"""
+        if not self.enabled:
+            return
+        vector = normalize_rows(embedding).astype(np.float16)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float16)
+            if self._size < self.max_size:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._release_scope(int(self._scopes[slot]))
+            self._clock += 1
+            self._matrix[slot] = vector
+            self._scopes[slot] = self._take_scope(scope)
+            self._last_used[slot] = self._clock
+            self._outputs[slot] = output
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_size": self.max_size,
+            "scopes": len(self._scope_ids),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "similarity": self.similarities.snapshot(),
+        }
@@ -0,0 +1,121 @@
+"""
+Run several API workers that share preloaded model weights copy-on-write
+
+The parent process loads the models once, freezes the garbage collector so
+reference-count updates don't touch the shared pages, then forks the
+workers. Every worker serves the same listening socket with uvicorn.
+
+Usage:
+    python serve.py --workers 4 --port 8000 --load-test-model
+"""
+import os
+
+# Workers must use the preloaded models in-process rather than spawning a
+# generation process pool that would load its own copy
+os.environ.setdefault("GENERATION_PROCESSES", "0")
+
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+from typing import Dict, List
+
+# Components whose weights are loaded before forking. Anything that starts
+# threads or runs inference at load time stays lazy and is built per worker.
+PRELOAD_COMPONENTS = ["punkt", "generator", "embedding_model"]
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, app, log_level: str) -> None:
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _fork_worker(sock: socket.socket, app, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _run_worker(sock, app, log_level)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the API from forked workers sharing model weights")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--load-test-model", action="store_true",
+                        help="Also preload the phi-1_5 model from models.py")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    import optimizer
+    import models
+    import main as api
+
+    started = time.perf_counter()
+    optimizer.warm_up(PRELOAD_COMPONENTS)
+    if args.load_test_model:
+        models.initialize_models()
+    logging.info(f"Preloaded models in {time.perf_counter() - started:.1f}s")
+
+    sock = _bind(args.host, args.port)
+    gc.collect()
+    gc.freeze()
+
+    workers: Dict[int, int] = {}
+    for index in range(args.workers):
+        workers[_fork_worker(sock, api.app, args.log_level)] = index
+    logging.info(f"Started {len(workers)} workers on {args.host}:{args.port}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            logging.warning(f"Worker {index} exited with status {status}, restarting it")
+            workers[_fork_worker(sock, api.app, args.log_level)] = index
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
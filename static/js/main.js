@@ -89,22 +89,18 @@ document.addEventListener('DOMContentLoaded', function() {
             promptOutput.textContent = "Optimizing prompt...";
             resultContainer.classList.remove('hidden');
             
-            // API call to optimize prompt
-            const response = await fetch('/api/optimize', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    prompt,
-                    target_model: targetModel,
-                    optimization_level: optimizationLevel
-                })
+            // API call to optimize prompt; the result is streamed so maximum
+            // rewrites appear token by token
+            const optimizedPrompt = await streamOptimizedPrompt({
+                prompt,
+                target_model: targetModel,
+                optimization_level: optimizationLevel
+            }, (text) => {
+                promptOutput.textContent = text;
             });
             
-            const data = await response.json();
-            if (data.status === 'success') {
-                promptOutput.textContent = data.optimized_prompt;
+            if (optimizedPrompt !== null) {
+                promptOutput.textContent = optimizedPrompt;
                 
                 // Display optimization notes (placeholders for now)
                 const notesList = document.getElementById('optimization-notes');
@@ -122,15 +118,62 @@ document.addEventListener('DOMContentLoaded', function() {
                     li.textContent = note;
                     notesList.appendChild(li);
                 });
-            } else {
-                promptOutput.textContent = "Error optimizing prompt: " + data.detail;
             }
         } catch (error) {
             console.error('Error:', error);
-            alert('An error occurred while optimizing the prompt');
+            document.getElementById('optimized-prompt').textContent = "Error optimizing prompt: " + error.message;
         }
     });
     
+    // Read the server-sent events of /api/optimize/events, calling onText with
+    // the text received so far; resolves to the final optimized prompt
+    async function streamOptimizedPrompt(body, onText) {
+        const response = await fetch('/api/optimize/events', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(body)
+        });
+        
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.detail || response.statusText);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let started = false;
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const event of events) {
+                if (!event.startsWith('data: ')) continue;
+                const data = JSON.parse(event.slice(6));
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                if (data.optimized_prompt !== undefined) {
+                    return data.optimized_prompt;
+                }
+                if (data.token !== undefined) {
+                    // Drop the whitespace GPT-2 emits before the rewrite
+                    text += started ? data.token : data.token.trimStart();
+                    started = started || text.length > 0;
+                    onText(text);
+                }
+            }
+        }
+        return text || null;
+    }
+    
     // Test prompt functionality
     const runTestBtn = document.getElementById('run-test');
     runTestBtn.addEventListener('click', async () => {
@@ -1,13 +1,21 @@
 import streamlit as st
 from models import test_with_huggingface, initialize_models
 import optimizer
-import json
-from typing import List
+import admission
+import template_store
+from typing import List, Optional
 
 def load_prompt_templates():
-    """Loads prompt templates from JSON."""
-    with open('data/prompt_templates.json', 'r') as f:
-        return json.load(f)
+    """Prompt templates from the shared store (reloaded only when the file changes)"""
+    return template_store.current().templates
+
+def run_prompt_test(prompt: str, model_type: str, max_new_tokens: Optional[int] = None) -> str:
+    """Test a prompt with the shared tester, showing errors instead of raising them"""
+    try:
+        return test_with_huggingface(prompt, model_type, max_new_tokens)
+    except Exception as e:
+        st.error(f"Error testing prompt: {e}")
+        return ""
 
 # Set page config
 st.set_page_config(
@@ -88,7 +96,7 @@ with tab1:
 
             if st.button("Test Prompt"):
                 with st.spinner("Testing prompt..."):
-                    response = test_with_huggingface(prompt_area, model_type)
+                    response = run_prompt_test(prompt_area, model_type)
                     st.text_area("AI Response", value=response, height=200, help="The AI's response to the generated prompt.")
 
 with tab2:
@@ -106,9 +114,17 @@ with tab2:
         # Model is now fixed to "gemma"
         test_model = "gemma"
 
+        max_new_tokens = st.slider(
+            "Response length (tokens)",
+            min_value=16,
+            max_value=admission.TEST_MAX_NEW_TOKENS_LIMIT,
+            value=min(admission.TEST_MAX_NEW_TOKENS, admission.TEST_MAX_NEW_TOKENS_LIMIT),
+            help="Maximum number of tokens the model generates."
+        )
+
         if st.button("Run Test", type="primary"):
             with st.spinner("Testing prompt..."):
-                response = test_with_huggingface(test_prompt, test_model)
+                response = run_prompt_test(test_prompt, test_model, max_new_tokens)
                 st.session_state.test_response = response
 
     with col2:
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# Where precomputed template embeddings are persisted between worker restarts
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so a dot product equals cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        norm = np.linalg.norm(matrix)
+        return matrix / norm if norm else matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class TemplateEmbeddingIndex:
+    """
+    Normalized embedding matrix over the keys of a template file
+
+    The matrix is built once per (model name, file hash) and saved as a .npy
+    file that later workers open memory-mapped instead of re-encoding. The
+    template file is re-stat'ed on every lookup and the index is rebuilt only
+    when it actually changes.
+    """
+
+    def __init__(self, path: str, model_name: str,
+                 encoder: Callable[[List[str]], np.ndarray],
+                 cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.path = path
+        self.model_name = model_name
+        self.encoder = encoder
+        self.cache_dir = cache_dir
+        # (keys, matrix), swapped in one assignment so that a lookup during
+        # a rebuild never pairs the new keys with the old matrix
+        self._entries: Optional[Tuple[List[str], np.ndarray]] = None
+        self._file_state = None
+        self._lock = threading.Lock()
+
+    @property
+    def keys(self) -> List[str]:
+        entries = self._entries
+        return entries[0] if entries is not None else []
+
+    @property
+    def matrix(self) -> Optional[np.ndarray]:
+        entries = self._entries
+        return entries[1] if entries is not None else None
+
+    def _cache_path(self, file_hash: str) -> str:
+        safe_model = self.model_name.replace("/", "_")
+        return os.path.join(self.cache_dir, f"templates-{safe_model}-{file_hash}.npy")
+
+    def _build(self, raw: bytes) -> None:
+        keys = list(json.loads(raw).keys())
+        file_hash = hashlib.sha256(raw).hexdigest()[:16]
+        cache_path = self._cache_path(file_hash)
+
+        matrix = None
+        if os.path.exists(cache_path):
+            try:
+                matrix = np.load(cache_path, mmap_mode="r")
+                if matrix.shape[0] != len(keys):
+                    matrix = None
+            except (OSError, ValueError):
+                matrix = None
+
+        if matrix is None:
+            logging.info(f"Building template embedding index for {self.path}")
+            matrix = normalize_rows(self.encoder(keys))
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, matrix)
+                os.replace(tmp_path, cache_path)
+                matrix = np.load(cache_path, mmap_mode="r")
+            except OSError as e:
+                logging.warning(f"Could not persist template embeddings: {e}")
+
+        self._entries = (keys, matrix)
+
+    def ensure_current(self) -> None:
+        """Rebuild the index if the template file changed since the last build"""
+        stat = os.stat(self.path)
+        state = (stat.st_mtime_ns, stat.st_size)
+        if state == self._file_state and self._entries is not None:
+            return
+        with self._lock:
+            if state == self._file_state and self._entries is not None:
+                return
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            self._build(raw)
+            self._file_state = state
+
+    def nearest(self, embedding: np.ndarray) -> Tuple[str, float]:
+        """
+        Find the template key closest to an embedding
+
+        Args:
+            embedding: A single query embedding (normalized or not)
+
+        Returns:
+            Tuple of (template key, cosine similarity)
+        """
+        self.ensure_current()
+        keys, matrix = self._entries
+        scores = matrix @ normalize_rows(embedding)
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+PROMPT_TEMPLATES_PATH = "data/prompt_templates.json"
+BEST_PRACTICES_PATH = "data/model_best_practices.json"
+
+# Minimum seconds between two checks of the data files for changes
+TEMPLATE_RELOAD_INTERVAL = float(os.getenv("TEMPLATE_RELOAD_INTERVAL", "1.0"))
+
+# Styles with a best-practices fragment; any other style adds none
+STYLE_FIELDS = {
+    "detailed": "detailed_format",
+    "step-by-step": "step_instructions",
+    "concise": "concise_format",
+}
+
+WHITESPACE_RE = re.compile(r'\s+')
+# Slots stand in for request values while fixed text is normalized
+SLOT_RE = re.compile(r'\x00(\w+)\x00')
+# A value that normalize() would change, or that would interact with the text
+# around its slot: surrounding, repeated or non-space whitespace, or " ." / " ,"
+UNCLEAN_RE = re.compile(r'^\s|\s$|^[.,]|\s\s|[^\S ]| [.,]')
+
+# (template key, practices key, style field, persona, context, constraints, examples)
+FragmentKey = Tuple[str, str, Optional[str], bool, bool, bool, bool]
+
+
+def normalize(prompt: str) -> str:
+    """Collapse whitespace and tidy spaces before punctuation"""
+    prompt = WHITESPACE_RE.sub(' ', prompt).strip()
+    return prompt.replace(" .", ".").replace(" ,", ",")
+
+
+def _slot(name: str) -> str:
+    return f"\x00{name}\x00"
+
+
+def assemble(template: Dict[str, str], practices: Dict[str, str], goal: str,
+             context: Optional[str] = None, style_field: Optional[str] = None,
+             domain: Optional[str] = None, constraints: bool = False,
+             examples: bool = False) -> str:
+    """Build an unnormalized prompt from a template, best practices and request values"""
+    components = []
+    if domain is not None:
+        components.append(f"As an expert {domain},")
+    components.append(goal)
+    if context:
+        components.append(f"Context: {context}")
+    if style_field:
+        components.append(practices[style_field])
+
+    prompt = f"{template['prefix']} {' '.join(components)}"
+    if constraints:
+        prompt += f"\n\n{practices['constraints']}"
+    if examples:
+        prompt += f"\n\n{practices['example_format']}"
+    return prompt + template["suffix"]
+
+
+class Fragment:
+    """A normalized prompt with slots for the request values"""
+
+    __slots__ = ("parts", "slots")
+
+    def __init__(self, text: str):
+        pieces = SLOT_RE.split(text)
+        self.parts: List[str] = pieces[0::2]
+        self.slots: List[str] = pieces[1::2]
+
+    def fill(self, values: Dict[str, str]) -> str:
+        out = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:]):
+            out.append(values[slot])
+            out.append(part)
+        return "".join(out)
+
+
+class TemplateSnapshot:
+    """
+    One consistent version of the templates and best practices
+
+    Every reachable (model, style, formats) combination is compiled into a
+    Fragment when the snapshot is built, so generating a prompt is a lookup
+    and one substitution of the request values.
+    """
+
+    def __init__(self, templates: Dict[str, Dict[str, str]],
+                 practices: Dict[str, Dict[str, str]], loaded_at: float):
+        self.templates = templates
+        self.practices = practices
+        self.loaded_at = loaded_at
+        self._fragments: Dict[FragmentKey, Fragment] = {}
+        for model in set(templates) | set(practices) | {"default"}:
+            template_key, practices_key = self._keys(model)
+            for style_field in list(STYLE_FIELDS.values()) + [None]:
+                for flags in range(16):
+                    key = (template_key, practices_key, style_field,
+                           bool(flags & 1), bool(flags & 2), bool(flags & 4), bool(flags & 8))
+                    if key not in self._fragments:
+                        self._fragments[key] = self._compile(key)
+
+    def _keys(self, model: str) -> Tuple[str, str]:
+        return (model if model in self.templates else "default",
+                model if model in self.practices else "default")
+
+    def template_for(self, model: str) -> Dict[str, str]:
+        return self.templates.get(model, self.templates["default"])
+
+    def practices_for(self, model: str) -> Dict[str, str]:
+        return self.practices.get(model, self.practices["default"])
+
+    def _compile(self, key: FragmentKey) -> Fragment:
+        template_key, practices_key, style_field, persona, context, constraints, examples = key
+        text = assemble(self.templates[template_key], self.practices[practices_key],
+                        _slot("goal"), _slot("context") if context else None, style_field,
+                        _slot("domain") if persona else None, constraints, examples)
+        return Fragment(normalize(text))
+
+    def render(self, model: str, goal: str, context: Optional[str], style: Optional[str],
+               formats: List[str], domain: Optional[str] = None) -> str:
+        """
+        Fill the precompiled prompt for a request
+
+        Args:
+            model: Normalized target model name
+            goal: The user's goal
+            context: Optional additional context
+            style: Prompt style (detailed, step-by-step, concise)
+            formats: Prompt formats to include
+            domain: Expert domain, required when formats includes "persona"
+
+        Returns:
+            The same prompt the unoptimized template code would build
+        """
+        template_key, practices_key = self._keys(model)
+        style_field = STYLE_FIELDS.get(style)
+        persona = "persona" in formats
+        key = (template_key, practices_key, style_field, persona, bool(context),
+               "constraints" in formats, "examples" in formats)
+        values = {"goal": goal}
+        if context:
+            values["context"] = context
+        if persona:
+            values["domain"] = domain
+        if any(UNCLEAN_RE.search(value) for value in values.values()) or not goal:
+            # Values that normalization would touch can merge with the text
+            # around them, so build and normalize the whole prompt instead
+            return normalize(assemble(self.templates[template_key], self.practices[practices_key],
+                                      goal, context, style_field, domain if persona else None,
+                                      key[5], key[6]))
+        return self._fragments[key].fill(values)
+
+
+class TemplateStore:
+    """
+    Shared, hot-reloaded templates and best practices
+
+    The data files are re-stat'ed at most every TEMPLATE_RELOAD_INTERVAL
+    seconds. A change builds a new TemplateSnapshot and swaps it in with a
+    single assignment, so readers always see one complete version; a file
+    that fails to parse keeps the previous snapshot.
+    """
+
+    def __init__(self, templates_path: str = PROMPT_TEMPLATES_PATH,
+                 practices_path: str = BEST_PRACTICES_PATH,
+                 interval: float = TEMPLATE_RELOAD_INTERVAL):
+        self.paths = (templates_path, practices_path)
+        self.interval = interval
+        self._snapshot: Optional[TemplateSnapshot] = None
+        self._state = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _file_state(self):
+        return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in self.paths)
+
+    def current(self) -> TemplateSnapshot:
+        """Return the current snapshot, reloading it if the files changed"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked < self.interval:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is not None and now - self._checked < self.interval:
+                return self._snapshot
+            state = self._file_state()
+            if state != self._state:
+                try:
+                    self._snapshot = self._load()
+                    self._state = state
+                    self.reloads += 1
+                except (OSError, ValueError, KeyError) as e:
+                    if self._snapshot is None:
+                        raise
+                    logging.warning(f"Keeping previous templates, reload failed: {e}")
+            self._checked = now
+        return self._snapshot
+
+    def _load(self) -> TemplateSnapshot:
+        templates_path, practices_path = self.paths
+        with open(templates_path, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+        with open(practices_path, "r", encoding="utf-8") as f:
+            practices = json.load(f)
+        snapshot = TemplateSnapshot(templates, practices, time.time())
+        logging.info(f"Loaded {len(templates)} templates and {len(practices)} best-practice sets")
+        return snapshot
+
+
+TEMPLATE_STORE = TemplateStore()
+
+
+def current() -> TemplateSnapshot:
+    """The current snapshot of the shared template store"""
+    return TEMPLATE_STORE.current()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    """Data files are opened relative to the repository root"""
+    monkeypatch.chdir(ROOT)
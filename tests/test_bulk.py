@@ -0,0 +1,54 @@
+import json
+
+import bulk
+
+
+def lines(*records):
+    data = b"".join((json.dumps(record) if not isinstance(record, str) else record).encode() + b"\n"
+                    for record in records)
+    return list(bulk.iter_lines(_Reader(data))), data
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data, self.pos = data, 0
+
+    def seek(self, pos: int) -> None:
+        self.pos = pos
+
+    def read(self, size: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def test_null_fields_take_the_batch_defaults():
+    batch, _ = lines({"prompt": "a", "optimization_level": None, "target_model": None},
+                     {"prompt": "b", "optimization_level": "maximum"})
+    records = bulk.parse_batch(batch[:1], "claude", "fast")
+    assert records[0][2] == {"prompt": "a", "target_model": "claude", "optimization_level": "fast"}
+    assert not bulk.needs_generation(records)
+    assert bulk.needs_generation(bulk.parse_batch(batch, "claude", "fast"))
+
+
+def test_each_line_is_parsed_once(monkeypatch):
+    batch, _ = lines(*({"prompt": f"prompt {i}", "id": i} for i in range(5)))
+    calls = []
+    real_loads = json.loads
+    monkeypatch.setattr(bulk.json, "loads", lambda *args, **kwargs: calls.append(args) or real_loads(*args, **kwargs))
+    records = bulk.parse_batch(batch, "default", "fast")
+    bulk.needs_generation(records)
+    bulk.process_batch(records, evaluate=False)
+    # Data files loaded on the way are read as str, input lines as bytes
+    assert sum(isinstance(args[0], bytes) for args in calls) == 5
+
+
+def test_process_batch_keeps_order_and_offsets():
+    batch, data = lines({"prompt": "Write a poem about rain", "id": "x"}, "not json",
+                        {"body": "Explain tides", "request_id": 7}, {"id": 3})
+    outputs = bulk.process_batch(bulk.parse_batch(batch, "default", "minimal"))
+    assert [output["id"] for output in outputs] == ["x", None, 7, None]
+    assert [output["status"] for output in outputs] == ["success", "error", "success", "error"]
+    assert outputs[0]["optimized_prompt"] == "Write a poem about rain."
+    assert "evaluation" in outputs[2]
+    assert outputs[-1]["offset"] == len(data)
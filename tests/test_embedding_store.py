@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pytest
+
+import embedding_store
+
+
+def random_vectors(count: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(vectors: np.ndarray, queries: np.ndarray, top_k: int, dtype: str) -> np.ndarray:
+    """Rows of the top_k stored vectors per query, after the store's quantization"""
+    codes, scales = embedding_store.quantize(vectors, dtype)
+    stored = codes.astype(np.float32) * (scales[:, None] if scales is not None else 1)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ stored.T), axis=1, kind="stable")[:, :top_k]
+
+
+@pytest.fixture(params=["int8", "float16"])
+def store(request, tmp_path):
+    return embedding_store.EmbeddingStore(str(tmp_path / "store"), dtype=request.param)
+
+
+def test_add_skips_stored_and_repeated_texts(store):
+    vectors = random_vectors(3)
+    assert store.add(["a", "b", "a"], vectors) == 2
+    assert store.add(["b", "c"], vectors[:2]) == 1
+    assert store.missing(["a", "d", "d", "c"]) == ["d"]
+    assert store.get([1, 2, 3, 4]) == {1: "a", 2: "b", 3: "c"}
+
+
+def test_search_matches_brute_force(store, monkeypatch):
+    # Small blocks so the running top k is merged across many of them
+    monkeypatch.setattr(embedding_store, "SEARCH_BLOCK_ROWS", 7)
+    vectors = random_vectors(100)
+    texts = [f"prompt {i}" for i in range(100)]
+    store.add(texts, vectors)
+    queries = vectors[[3, 50, 99]] + random_vectors(3, seed=1) * 0.05
+
+    hits = store.search(queries, top_k=5)
+    expected = brute_force(vectors, queries, 5, store.dtype)
+    for query_hits, rows in zip(hits, expected):
+        assert [hit["text"] for hit in query_hits] == [texts[row] for row in rows]
+        assert [hit["id"] for hit in query_hits] == [row + 1 for row in rows]
+        scores = [hit["score"] for hit in query_hits]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_search_filters_kind_and_min_score(store):
+    vectors = random_vectors(4)
+    store.add(["g1", "g2"], vectors[:2], kind="generate")
+    store.add(["o1", "o2"], vectors[2:], kind="optimize")
+    (hits,) = store.search(vectors[2:3], top_k=10, kind="optimize")
+    assert {hit["text"] for hit in hits} == {"o1", "o2"}
+    assert all(hit["kind"] == "optimize" for hit in hits)
+    (hits,) = store.search(vectors[0:1], top_k=10, min_score=0.99)
+    assert [hit["text"] for hit in hits] == ["g1"]
+    with pytest.raises(ValueError):
+        store.add(["x"], vectors[:1], kind="other")
+
+
+def test_compact_drops_deleted_rows_and_keeps_ids(store):
+    vectors = random_vectors(20)
+    store.add([f"prompt {i}" for i in range(20)], vectors)
+    before = store.search(vectors[10:11], top_k=3)
+    assert store.delete([1, 2, 3, 999]) == 3
+    assert store.needs_compaction()
+    old_generation = store.stats()["generation"]
+
+    result = store.compact()
+    assert (result["rows_before"], result["rows_after"]) == (20, 17)
+    assert not os.path.exists(os.path.join(store.root, old_generation))
+    assert store.stats()["rows"] == 17
+    assert store.get([1, 4, 20]) == {4: "prompt 3", 20: "prompt 19"}
+    assert store.search(vectors[10:11], top_k=3) == before
+    # New rows continue after the highest surviving id
+    store.add(["new"], random_vectors(1, seed=2))
+    assert store.get([21]) == {21: "new"}
+    # Deleted texts can be stored again
+    assert store.missing(["prompt 0", "prompt 5"]) == ["prompt 0"]
+
+
+def test_compact_keeps_the_newest_rows_over_max_rows(tmp_path):
+    store = embedding_store.EmbeddingStore(str(tmp_path / "store"), max_rows=5)
+    store.add([f"prompt {i}" for i in range(8)], random_vectors(8))
+    assert store.needs_compaction()
+    store.compact()
+    assert store.stats()["rows"] == 5
+    assert sorted(store.get(list(range(1, 9)))) == [4, 5, 6, 7, 8]
+
+
+def test_compact_reencodes_a_changed_dtype(tmp_path):
+    root = str(tmp_path / "store")
+    vectors = random_vectors(10)
+    embedding_store.EmbeddingStore(root, dtype="float16").add([f"p{i}" for i in range(10)], vectors)
+
+    store = embedding_store.EmbeddingStore(root, dtype="int8")
+    assert store.needs_compaction()
+    store.compact()
+    assert store.stats()["dtype"] == "int8"
+    (hits,) = store.search(vectors[4:5], top_k=1)
+    assert hits[0]["text"] == "p4"
+    assert hits[0]["score"] == pytest.approx(1.0, abs=0.01)
+
+
+def test_a_second_store_sees_rows_and_compaction(tmp_path):
+    root = str(tmp_path / "store")
+    writer = embedding_store.EmbeddingStore(root)
+    reader = embedding_store.EmbeddingStore(root)
+    vectors = random_vectors(6)
+    writer.add([f"p{i}" for i in range(6)], vectors)
+    assert reader.stats()["rows"] == 6
+    writer.delete([1])
+    writer.compact()
+    assert reader.stats()["rows"] == 5
+    assert reader.get([1, 2]) == {2: "p1"}
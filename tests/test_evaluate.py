@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+import models
+
+WORDS = ["the", "model", "should", "write", "a", "short", "summary", "context", "specific",
+         "exactly", "limit", "only", "don't", "code", "data", "report", "Must", "CONTEXT",
+         "precisely", "limitations", "example", "users", "results"]
+CRITERIA = ["clarity", "specificity", "context", "constraints"]
+
+
+def random_prompt(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(0, 80))]
+    # Dots, commas and runs of whitespace exercise the sentence split
+    for i in range(len(words)):
+        roll = rng.random()
+        if roll < 0.1:
+            words[i] += "."
+        elif roll < 0.15:
+            words[i] += ","
+        elif roll < 0.18:
+            words[i] += "  \n"
+    return " ".join(words)
+
+
+def random_criteria(rng: random.Random):
+    criteria = [rng.choice(CRITERIA + ["tone"]) for _ in range(rng.randint(1, 6))]
+    return None if rng.random() < 0.2 else criteria
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_evaluate_prompts_matches_scalar(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        prompts = [random_prompt(rng) for _ in range(rng.randint(1, 25))]
+        criteria = random_criteria(rng)
+        expected = [models.evaluate_prompt_effectiveness(prompt, criteria) for prompt in prompts]
+        assert models.evaluate_prompts(prompts, criteria) == expected
+
+
+def test_evaluate_prompts_edge_cases():
+    prompts = ["", ".", "...", "no dots at all", "one " * 26 + "sentence."]
+    for criteria in (None, ["context", "clarity"], ["clarity", "clarity"], ["tone"]):
+        expected = [models.evaluate_prompt_effectiveness(prompt, criteria) for prompt in prompts]
+        assert models.evaluate_prompts(prompts, criteria) == expected
+    assert models.evaluate_prompts([]) == []
+
+
+def test_evaluate_prompts_requires_a_criterion():
+    with pytest.raises(ValueError):
+        models.evaluate_prompts(["prompt"], [])
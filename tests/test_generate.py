@@ -0,0 +1,84 @@
+import json
+import random
+import re
+import shutil
+
+import pytest
+
+import optimizer
+import template_store
+
+PIECES = ["write", "a", "blog", "post", "about", "code", "research", "data", ".", ",", " .", " ,",
+          "  ", "\n", "\t", "", "end.", "(notes)", "x,y", "Context:", " "]
+CLEAN_WORDS = ["write", "a", "blog", "post", "about", "code", "end.", "x,y", "(notes)", "Context:"]
+MODELS = ["chatgpt", "claude", "gemini", "default", "unknown-model", " ChatGPT ", "CLAUDE"]
+STYLES = ["detailed", "step-by-step", "concise", "casual", None]
+FORMATS = ["standard", "persona", "context", "constraints", "examples"]
+
+
+def reference_prompt(goal, target_model, context=None, style="detailed", formats=["standard"]):
+    """generate_prompt as it was before templates were precompiled"""
+    snapshot = template_store.current()
+    target_model = target_model.lower().strip()
+    template = snapshot.templates.get(target_model, snapshot.templates["default"])
+    practices = snapshot.practices.get(target_model, snapshot.practices["default"])
+
+    components = []
+    if "persona" in formats:
+        components.append(f"As an expert {optimizer.extract_domain(goal)},")
+    components.append(goal)
+    if context:
+        components.append(f"Context: {context}")
+    if style == "detailed":
+        components.append(practices["detailed_format"])
+    elif style == "step-by-step":
+        components.append(practices["step_instructions"])
+    elif style == "concise":
+        components.append(practices["concise_format"])
+
+    prompt = f"{template['prefix']} {' '.join(components)}"
+    if "constraints" in formats:
+        prompt += f"\n\n{practices['constraints']}"
+    if "examples" in formats:
+        prompt += f"\n\n{practices['example_format']}"
+    prompt += template["suffix"]
+
+    prompt = re.sub(r'\s+', ' ', prompt).strip()
+    return prompt.replace(" .", ".").replace(" ,", ",")
+
+
+def random_text(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        # Clean text takes the precompiled fragment path
+        return " ".join(rng.choice(CLEAN_WORDS) for _ in range(rng.randint(1, 8)))
+    pieces = [rng.choice(PIECES) for _ in range(rng.randint(0, 8))]
+    return rng.choice(["", " ", "\n"]).join(pieces)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_generate_prompt_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        args = (random_text(rng), rng.choice(MODELS),
+                rng.choice([None, random_text(rng)]), rng.choice(STYLES),
+                rng.sample(FORMATS, rng.randint(0, len(FORMATS))))
+        assert optimizer.generate_prompt(*args) == reference_prompt(*args), args
+
+
+def test_store_keeps_previous_snapshot_on_bad_reload(tmp_path):
+    templates = tmp_path / "templates.json"
+    practices = tmp_path / "practices.json"
+    shutil.copy(template_store.PROMPT_TEMPLATES_PATH, templates)
+    shutil.copy(template_store.BEST_PRACTICES_PATH, practices)
+    store = template_store.TemplateStore(str(templates), str(practices), interval=0)
+    first = store.current()
+
+    data = json.loads(templates.read_text(encoding="utf-8"))
+    data["default"]["prefix"] = "Changed prefix:"
+    templates.write_text(json.dumps(data), encoding="utf-8")
+    reloaded = store.current()
+    assert reloaded is not first
+    assert reloaded.render("default", "goal", None, None, []).startswith("Changed prefix: goal")
+
+    templates.write_text("{not json", encoding="utf-8")
+    assert store.current() is reloaded
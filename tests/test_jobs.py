@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = jobs.JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+def submit(store, count=1, **item):
+    item.setdefault("optimization_level", "fast")
+    return store.submit([dict(item, prompt=f"prompt {i}", id=i) for i in range(count)])["job_id"]
+
+
+def test_claim_and_complete(store):
+    job_id = submit(store, 3)
+    claimed = store.claim("worker-a", limit=2)
+    assert [row[2] for row in claimed] == ["prompt 0", "prompt 1"]
+    assert all(row[5] == 1 for row in claimed)
+
+    counts = store.complete("worker-a", claimed, ["done 0", "done 1"], busy_seconds=0.1)
+    assert counts == {"done": 2, "failed": 0, "retried": 0}
+    status = store.status(job_id)
+    assert (status["status"], status["done"], status["queued"]) == ("running", 2, 1)
+
+    store.complete("worker-a", store.claim("worker-a"), ["done 2"], busy_seconds=0.1)
+    assert store.status(job_id)["status"] == "completed"
+    assert [(r["id"], r["optimized_prompt"]) for r in store.results(job_id)] == \
+        [(0, "done 0"), (1, "done 1"), (2, "done 2")]
+
+
+def test_expired_lease_is_reclaimed(store):
+    job_id = submit(store)
+    # A zero lease expires at once, as if worker-a had died
+    (stale,) = store.claim("worker-a", lease=0)
+    (reclaimed,) = store.claim("worker-b")
+    assert reclaimed[0] == stale[0]
+    assert reclaimed[5] == 2
+
+    # The late result of the worker that lost the lease is ignored
+    assert store.complete("worker-a", [stale], ["late"], busy_seconds=1)["done"] == 0
+    assert store.complete("worker-b", [reclaimed], ["on time"], busy_seconds=1)["done"] == 1
+    (result,) = store.results(job_id)
+    assert (result["optimized_prompt"], result["attempts"]) == ("on time", 2)
+
+
+def test_item_fails_after_its_last_lease_expires(store, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job_id = submit(store)
+    assert store.claim("worker-a", lease=0)
+    assert store.claim("worker-b", lease=0)
+    assert store.claim("worker-c") == []
+
+    status = store.status(job_id)
+    assert (status["status"], status["failed"]) == ("completed", 1)
+    (result,) = store.results(job_id)
+    assert result["status"] == "failed"
+    assert "lease expired" in result["detail"]
+
+
+def test_failed_items_are_retried_with_backoff(store, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 60)
+    job_id = submit(store)
+    claimed = store.claim("worker-a")
+    assert store.complete("worker-a", claimed, [RuntimeError("busy")], busy_seconds=0)["retried"] == 1
+    # Not due yet
+    assert store.claim("worker-a") == []
+
+    # At most JOB_RETRY_BACKOFF later it is
+    later = time.time() + 60
+    monkeypatch.setattr(jobs.time, "time", lambda: later)
+    claimed = store.claim("worker-a")
+    assert claimed[0][5] == 2
+    store.complete("worker-a", claimed, [RuntimeError("busy")], busy_seconds=0)
+    # Out of attempts, so the second failure is final
+    assert store.claim("worker-a") == []
+    status = store.status(job_id)
+    assert (status["failed"], status["retries"], status["status"]) == (1, 1, "completed")
+
+
+def test_bad_input_is_not_retried(store):
+    job_id = submit(store)
+    claimed = store.claim("worker-a")
+    counts = store.complete("worker-a", claimed, [ValueError("too long")], busy_seconds=0)
+    assert counts == {"done": 0, "failed": 1, "retried": 0}
+    assert store.status(job_id)["status"] == "completed"
+
+
+def test_higher_priority_is_claimed_first(store):
+    store.submit([{"prompt": "low", "optimization_level": "fast"}], priority="low")
+    store.submit([{"prompt": "high", "optimization_level": "fast"}], priority="high")
+    assert [row[2] for row in store.claim("worker-a", limit=2)] == ["high", "low"]
+
+
+def test_cancel_drops_queued_items(store):
+    job_id = submit(store, 2)
+    claimed = store.claim("worker-a", limit=1)
+    status = store.cancel(job_id)
+    assert (status["status"], status["cancelled"], status["running"]) == ("cancelled", 1, 1)
+    assert store.claim("worker-b") == []
+    # The running item still finishes
+    assert store.complete("worker-a", claimed, ["done"], busy_seconds=0)["done"] == 1
+
+
+def test_submit_reads_a_generator_in_chunks(store, monkeypatch):
+    monkeypatch.setattr(jobs, "SUBMIT_CHUNK_ITEMS", 2)
+    stored = []
+
+    def items():
+        for i in range(5):
+            # Earlier chunks are already in the database when later items are read
+            stored.append(store._connect().execute("SELECT COUNT(*) FROM items").fetchone()[0])
+            yield {"prompt": f"prompt {i}", "optimization_level": "fast"}
+
+    job = store.submit(items())
+    assert job["total"] == 5
+    assert stored == [0, 0, 2, 2, 4]
+    assert store.status(job["job_id"])["queued"] == 5
+
+
+def test_a_failed_submit_leaves_nothing_behind(store, monkeypatch):
+    monkeypatch.setattr(jobs, "SUBMIT_CHUNK_ITEMS", 2)
+    items = [{"prompt": f"prompt {i}", "optimization_level": "fast"} for i in range(3)]
+    with pytest.raises(ValueError, match="Item 3"):
+        store.submit(items + [{"prompt": "bad", "optimization_level": "extreme"}])
+    with pytest.raises(ValueError, match="no items"):
+        store.submit([])
+    assert store._connect().execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    assert store.stats()["jobs"] == {}
+
+
+def test_open_job_is_not_claimed_until_closed(store):
+    job_id = store.open_job()
+    store.add_items(job_id, [{"prompt": "first", "optimization_level": "fast"}], 0)
+    assert store.claim("worker-a") == []
+    store.close_job(job_id)
+    assert [row[2] for row in store.claim("worker-a")] == ["first"]
+
+    # A job cancelled while it is being uploaded never runs
+    job_id = store.open_job()
+    store.add_items(job_id, [{"prompt": "second", "optimization_level": "fast"}], 0)
+    store.cancel(job_id)
+    store.add_items(job_id, [{"prompt": "third", "optimization_level": "fast"}], 1)
+    assert store.close_job(job_id)["total"] == 1
+    assert store.status(job_id)["status"] == "cancelled"
+    assert store.claim("worker-a") == []
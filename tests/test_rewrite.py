@@ -0,0 +1,43 @@
+import pytest
+
+import benchmark
+import optimizer
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Offline stand-ins for the optimizer's models, dropped again after the test"""
+    monkeypatch.setattr(optimizer, "MODEL_LOADERS", dict(optimizer.MODEL_LOADERS))
+    monkeypatch.setattr(optimizer, "_LOADED", {})
+    monkeypatch.setattr(optimizer, "sent_tokenize", optimizer.sent_tokenize)
+    benchmark.install_stubs()
+    parses = []
+    real_parse_all = optimizer.parse_all
+
+    def counting_parse_all(parsed):
+        parses.append(len(parsed))
+        real_parse_all(parsed)
+
+    monkeypatch.setattr(optimizer, "parse_all", counting_parse_all)
+    return parses
+
+
+def test_maximum_never_parses(stub_models):
+    prompt = "Write a detailed report about renewable energy adoption in small towns."
+    assert optimizer.optimize_prompt(prompt, "chatgpt", "maximum")
+    results = optimizer.optimize_prompts([
+        {"prompt": f"Summarize chapter {i} of the book for a student.", "target_model": "claude",
+         "optimization_level": "maximum"} for i in range(3)])
+    assert all(isinstance(result, str) for result in results)
+    assert stub_models == []
+    assert not optimizer.is_loaded("nlp")
+    assert not optimizer.is_loaded("template_index")
+
+
+def test_parse_is_shared_between_stages(stub_models):
+    prompt = "Explain recursion. Use a short example. Keep it under a page."
+    parsed = optimizer.parse_prompt(prompt)
+    optimizer.optimize_prompt(prompt, "default", "balanced")
+    assert optimizer.parse_prompt(prompt) is parsed
+    assert parsed._sentences is not None
+    assert stub_models == []
@@ -0,0 +1,47 @@
+import numpy as np
+
+import semantic_cache
+
+
+def vector(seed: int, dim: int = 16) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def test_hit_needs_the_same_scope():
+    cache = semantic_cache.SemanticCache(max_size=4, threshold=0.95)
+    cache.add(vector(0), "chatgpt", "rewrite")
+    assert cache.lookup(vector(0) * 2, "chatgpt") == "rewrite"
+    assert cache.lookup(vector(0), "claude") is None
+    assert cache.lookup(vector(1), "chatgpt") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lookups_of_unknown_scopes_store_nothing():
+    cache = semantic_cache.SemanticCache(max_size=4)
+    cache.add(vector(0), "chatgpt", "rewrite")
+    for i in range(100):
+        assert cache.lookup(vector(0), f"client model {i}") is None
+    assert cache.stats()["scopes"] == 1
+
+
+def test_scopes_are_forgotten_with_their_last_row():
+    cache = semantic_cache.SemanticCache(max_size=3)
+    for i in range(50):
+        cache.add(vector(i), f"client model {i}", f"rewrite {i}")
+    assert cache.stats()["scopes"] == 3
+    # The newest rows survive eviction, each in its own scope
+    for i in range(47, 50):
+        assert cache.lookup(vector(i), f"client model {i}") == f"rewrite {i}"
+    assert cache.lookup(vector(10), "client model 10") is None
+
+
+def test_eviction_keeps_scopes_that_still_have_rows():
+    cache = semantic_cache.SemanticCache(max_size=2)
+    cache.add(vector(0), "chatgpt", "first")
+    cache.add(vector(1), "chatgpt", "second")
+    cache.lookup(vector(1), "chatgpt")
+    cache.add(vector(2), "claude", "third")
+    assert cache.stats()["scopes"] == 2
+    assert cache.lookup(vector(1), "chatgpt") == "second"
+    assert cache.lookup(vector(2), "claude") == "third"
+    assert cache.lookup(vector(0), "chatgpt") is None
@@ -0,0 +1,223 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cache
+import executor
+
+
+async def settle():
+    """Let every ready task run until it blocks"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Computation:
+    """A compute() for SingleFlight that finishes when told to"""
+
+    def __init__(self, result="result"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_identical_requests_share_one_computation():
+    async def scenario():
+        flights, compute = cache.SingleFlight(), Computation()
+        waiters = [asyncio.ensure_future(flights.do("key", compute)) for _ in range(5)]
+        await settle()
+        compute.release.set()
+        return flights, compute, await asyncio.gather(*waiters)
+
+    flights, compute, results = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert compute.calls == 1
+    assert (flights.started, flights.coalesced) == (1, 4)
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        flights, compute = cache.SingleFlight(), Computation(RuntimeError("boom"))
+        waiters = [asyncio.ensure_future(flights.do("key", compute)) for _ in range(3)]
+        await settle()
+        compute.release.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["boom"] * 3
+
+
+def test_cancelled_waiter_leaves_the_others_running():
+    async def scenario():
+        flights, compute = cache.SingleFlight(), Computation()
+        first = asyncio.ensure_future(flights.do("key", compute))
+        second = asyncio.ensure_future(flights.do("key", compute))
+        await settle()
+        first.cancel()
+        await settle()
+        compute.release.set()
+        return flights, compute, first, await second
+
+    flights, compute, first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == "result"
+    assert not compute.cancelled
+    assert flights.abandoned == 0
+
+
+def test_last_waiter_leaving_cancels_the_computation():
+    async def scenario():
+        flights, compute = cache.SingleFlight(), Computation()
+        waiters = [asyncio.ensure_future(flights.do("key", compute)) for _ in range(2)]
+        await settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await settle()
+        assert compute.cancelled
+        # A new request starts a fresh computation instead of joining the cancelled one
+        fresh = Computation("fresh")
+        retry = asyncio.ensure_future(flights.do("key", fresh))
+        await settle()
+        fresh.release.set()
+        return flights, await retry
+
+    flights, result = asyncio.run(scenario())
+    assert flights.abandoned == 1
+    assert result == "fresh"
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_disconnected_client_stops_waiting():
+    async def scenario():
+        flights, compute = cache.SingleFlight(poll_interval=0.01), Computation()
+        gone = asyncio.Event()
+
+        async def is_disconnected():
+            return gone.is_set()
+
+        leaving = asyncio.ensure_future(flights.do("key", compute, is_disconnected))
+        staying = asyncio.ensure_future(flights.do("key", compute))
+        await asyncio.sleep(0.02)
+        gone.set()
+        with pytest.raises(cache.ClientDisconnected):
+            await leaving
+        assert not compute.cancelled
+        compute.release.set()
+        return flights, await staying
+
+    flights, result = asyncio.run(scenario())
+    assert result == "result"
+    assert flights.disconnected == 1
+    assert flights.abandoned == 0
+
+
+def test_disconnect_of_the_only_waiter_cancels_the_computation():
+    async def scenario():
+        flights, compute = cache.SingleFlight(poll_interval=0.01), Computation()
+
+        async def is_disconnected():
+            return True
+
+        with pytest.raises(cache.ClientDisconnected):
+            await flights.do("key", compute, is_disconnected)
+        await settle()
+        assert compute.cancelled
+        return flights
+
+    flights = asyncio.run(scenario())
+    assert flights.abandoned == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+
+class BlockingWork:
+    """Pool work that runs until released, recording which calls started"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+
+    def __call__(self, i):
+        self.started.append(i)
+        self.release.wait(5)
+        return i
+
+
+async def cancel_flights(pool, work, count):
+    flights = cache.SingleFlight()
+    waiters = [asyncio.ensure_future(flights.do(f"key {i}", lambda i=i: pool.run(work, i)))
+               for i in range(count)]
+    await asyncio.sleep(0.05)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await settle()
+    assert flights.abandoned == count
+
+
+async def wait_for_idle(pool):
+    for _ in range(200):
+        if pool.pending == 0:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("pool slots were not released")
+
+
+def test_cancelled_flight_keeps_its_pool_slot_until_the_work_ends():
+    pool = executor.BoundedPool("test", lambda: ThreadPoolExecutor(max_workers=2),
+                                max_workers=2, max_queue=0)
+    work = BlockingWork()
+
+    async def scenario():
+        await cancel_flights(pool, work, 2)
+        # Both threads are still busy, so new work is refused
+        assert (pool.pending, pool.running) == (2, 2)
+        with pytest.raises(executor.QueueFullError):
+            await pool.run(work, 99)
+        work.release.set()
+        await wait_for_idle(pool)
+        assert pool.running == 0
+        return await pool.run(lambda: "next")
+
+    try:
+        assert asyncio.run(scenario()) == "next"
+    finally:
+        work.release.set()
+        pool.shutdown()
+    assert sorted(work.started) == [0, 1]
+
+
+def test_cancelled_flights_waiting_for_a_turn_never_run():
+    pool = executor.BoundedPool("test", lambda: ThreadPoolExecutor(max_workers=1),
+                                max_workers=1, max_queue=3)
+    work = BlockingWork()
+
+    async def scenario():
+        await cancel_flights(pool, work, 4)
+        # Only the running call still holds a slot
+        assert (pool.pending, pool.running) == (1, 1)
+        work.release.set()
+        await wait_for_idle(pool)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        work.release.set()
+        pool.shutdown()
+    assert len(work.started) == 1
@@ -0,0 +1,185 @@
+"""
+A/B prompt variants for one goal
+
+A goal is expanded over a (target model x style x formats) grid, every
+variant is rendered from the precompiled templates, and the variants are
+ranked by a mix of the rule-based effectiveness score and the embedding
+similarity of each prompt to the goal.
+"""
+import os
+import itertools
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import optimizer
+import models
+import embedding_store
+import metrics
+import template_store
+
+DEFAULT_VARIANT_FORMATS = ["persona", "constraints", "examples"]
+
+# Largest grid accepted by /api/generate/variants
+MAX_VARIANTS = int(os.getenv("MAX_VARIANTS", "1024"))
+# Share of the ranking score taken by goal similarity (the rest is the
+# effectiveness score)
+VARIANT_SIMILARITY_WEIGHT = float(os.getenv("VARIANT_SIMILARITY_WEIGHT", "0.3"))
+# Variants embedded per encode call while looking for the top k
+VARIANT_EMBED_BATCH = int(os.getenv("VARIANT_EMBED_BATCH", "64"))
+# Grid cells rendered per job when a grid is split across the NLP threads
+VARIANT_CHUNK_SIZE = int(os.getenv("VARIANT_CHUNK_SIZE", "256"))
+
+
+def format_combinations(formats: List[str]) -> List[List[str]]:
+    """Every subset of formats, smallest first"""
+    formats = list(dict.fromkeys(formats))
+    return [list(combo) for size in range(len(formats) + 1)
+            for combo in itertools.combinations(formats, size)]
+
+
+def expand_grid(target_models: Optional[List[str]] = None, styles: Optional[List[str]] = None,
+                formats: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    The (target model x style x format subset) cells to generate
+
+    Args:
+        target_models: Models to write for (default: every model with a
+            template or best practices)
+        styles: Prompt styles (default: detailed, step-by-step, concise)
+        formats: Formats whose every combination is tried (default: persona,
+            constraints, examples)
+
+    Returns:
+        One {"target_model", "style", "formats"} dict per variant
+    """
+    if target_models is None:
+        snapshot = template_store.current()
+        target_models = sorted(set(snapshot.templates) | set(snapshot.practices))
+    target_models = list(dict.fromkeys(m.lower().strip() for m in target_models))
+    styles = list(dict.fromkeys(styles if styles is not None else template_store.STYLE_FIELDS))
+    combos = format_combinations(formats if formats is not None else DEFAULT_VARIANT_FORMATS)
+    return [{"target_model": model, "style": style, "formats": combo}
+            for model in target_models for style in styles for combo in combos]
+
+
+def grid_size(target_models: Optional[List[str]] = None, styles: Optional[List[str]] = None,
+              formats: Optional[List[str]] = None) -> int:
+    """Number of cells expand_grid would return, without building them"""
+    if target_models is None:
+        snapshot = template_store.current()
+        target_models = set(snapshot.templates) | set(snapshot.practices)
+    n_models = len({m.lower().strip() for m in target_models})
+    n_styles = len(set(styles if styles is not None else template_store.STYLE_FIELDS))
+    n_formats = len(set(formats if formats is not None else DEFAULT_VARIANT_FORMATS))
+    return n_models * n_styles * 2 ** n_formats
+
+
+@metrics.timed("generate_variants")
+def generate_variants(goal: str, cells: List[Dict[str, Any]],
+                      context: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Render the prompt for every grid cell
+
+    The expert domain is extracted once for the whole grid and all cells are
+    rendered from the same template snapshot, so a grid is consistent even
+    if the templates are reloaded meanwhile.
+
+    Returns:
+        The cells, each with its "prompt" added
+    """
+    snapshot = template_store.current()
+    domain = None
+    if any("persona" in cell["formats"] for cell in cells):
+        domain = optimizer.extract_domain(goal)
+    return [dict(cell, prompt=snapshot.render(cell["target_model"], goal, context,
+                                              cell["style"], cell["formats"], domain))
+            for cell in cells]
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    # Runs in the model server when there is one, so API workers never load MiniLM
+    vectors = embedding_store.embed(texts)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@metrics.timed("rank_variants")
+def rank_variants(goal: str, variants: List[Dict[str, Any]], top_k: Optional[int] = None,
+                  criteria: Optional[List[str]] = None,
+                  similarity_weight: float = VARIANT_SIMILARITY_WEIGHT) -> Dict[str, Any]:
+    """
+    Score variants and return them best first
+
+    Every distinct prompt is scored with models.evaluate_prompts in one
+    vectorized pass. Goal similarity needs the embedding model, so prompts
+    are embedded in blocks from the best effectiveness score down, and
+    embedding stops once no remaining prompt could enter the top k even
+    with a perfect similarity.
+
+    Args:
+        goal: The goal the variants were generated for
+        variants: generate_variants output
+        top_k: How many variants to return (None or 0 for all)
+        criteria: Effectiveness criteria passed to evaluate_prompts
+        similarity_weight: Weight of goal similarity in the final score
+
+    Returns:
+        {"variants": ranked variants with scores, "total": variants given,
+        "unique": distinct prompts, "embedded": prompts embedded}
+
+    Raises:
+        ValueError: If top_k is negative
+    """
+    if top_k is not None and top_k < 0:
+        raise ValueError(f"top_k must be at least 0, got {top_k}")
+    total = len(variants)
+    prompts = list(dict.fromkeys(variant["prompt"] for variant in variants))
+    if not prompts:
+        return {"variants": [], "total": total, "unique": 0, "embedded": 0}
+    evaluations = models.evaluate_prompts(prompts, criteria)
+    overall = np.array([evaluation["overall_score"] for evaluation in evaluations])
+
+    # Best first; a stable sort keeps grid order among equal scores
+    order = np.argsort(-overall, kind="stable")
+    index = {prompt: i for i, prompt in enumerate(prompts)}
+    copies = np.bincount([index[variant["prompt"]] for variant in variants], minlength=len(prompts))
+    k = top_k if top_k else total
+
+    similarity = np.full(len(prompts), np.nan)
+    combined = np.full(len(prompts), -np.inf)
+    goal_vector = None
+    block = max(1, VARIANT_EMBED_BATCH)
+    embedded = 0
+    while embedded < len(prompts):
+        done = order[:embedded]
+        # Duplicate variants of a prompt each take a place in the top k
+        scored = np.sort(np.repeat(combined[done], copies[done]))[::-1]
+        if len(scored) >= k:
+            bound = (1 - similarity_weight) * overall[order[embedded]] + similarity_weight
+            if bound < scored[k - 1]:
+                break
+        rows = order[embedded:embedded + block]
+        texts = [prompts[i] for i in rows]
+        if goal_vector is None:
+            # The goal rides along with the first block
+            vectors = _embed([goal] + texts)
+            goal_vector, vectors = vectors[0], vectors[1:]
+        else:
+            vectors = _embed(texts)
+        similarity[rows] = vectors @ goal_vector
+        combined[rows] = (1 - similarity_weight) * overall[rows] + similarity_weight * similarity[rows]
+        embedded += len(rows)
+
+    ranked = []
+    for position, variant in enumerate(variants):
+        i = index[variant["prompt"]]
+        if np.isnan(similarity[i]):
+            continue
+        ranked.append((-combined[i], position, variant, i))
+    ranked.sort(key=lambda item: item[:2])
+
+    results = []
+    for rank, (_, _, variant, i) in enumerate(ranked[:k], start=1):
+        results.append(dict(variant, rank=rank, score=float(combined[i]),
+                            similarity=float(similarity[i]), **evaluations[i]))
+    return {"variants": results, "total": total, "unique": len(prompts), "embedded": embedded}